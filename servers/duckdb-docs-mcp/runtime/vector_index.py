@@ -0,0 +1,246 @@
+"""
+In-process brute-force vector search over a contiguous float32 matrix.
+
+For corpora of a few thousand to ~100k chunks, one matrix-vector product plus
+``argpartition`` is faster than sending the query vector through DuckDB's HNSW operator,
+and the result is exact. Embeddings are loaded once from the indexed table into a
+64-byte aligned array and L2-normalized, so cosine distance is ``1 - dot``.
+
+``QuantizedVectorIndex`` keeps only int8 or 1-bit codes in memory (built by
+``create_indexes.py --quantize``) and rescores the best candidates with float32.
+"""
+
+import numpy as np
+
+_ALIGNMENT = 64
+# Rows scored per block in the int8 first pass (bounds the temporary float32 copy)
+_BLOCK_ROWS = 4096
+
+
+def _aligned_empty(shape: tuple[int, int], dtype=np.float32) -> np.ndarray:
+    """Allocates an uninitialized C-contiguous array whose data pointer is 64-byte aligned."""
+    itemsize = np.dtype(dtype).itemsize
+    nbytes = int(np.prod(shape)) * itemsize
+    buf = np.empty(nbytes + _ALIGNMENT, dtype=np.uint8)
+    offset = (-buf.ctypes.data) % _ALIGNMENT
+    return buf[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+def _normalize_rows(matrix: np.ndarray) -> None:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+
+
+class NumpyVectorIndex:
+    """Exact cosine top-k over all embeddings of a docs table, answered in-process."""
+
+    # self_check() fails below this recall (exact search only misses through ties, which
+    # are counted as hits, so anything short of ~1.0 means a wrong top-k)
+    SELF_CHECK_MIN_RECALL = 0.99
+
+    def __init__(self, connection, table_name: str):
+        data = connection.execute(
+            f"SELECT chunk_id, embedding FROM {table_name} ORDER BY chunk_id;"
+        ).fetchnumpy()
+        self.table_name = table_name
+        self.chunk_ids: list[str] = [str(c) for c in data["chunk_id"]]
+        embeddings = data["embedding"]
+        dim = len(embeddings[0]) if len(embeddings) else 0
+        self.matrix = _aligned_empty((len(embeddings), dim))
+        for i, emb in enumerate(embeddings):
+            self.matrix[i] = emb
+        _normalize_rows(self.matrix)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def _top_k(self, similarities: np.ndarray, limit: int):
+        limit = min(limit, len(similarities))
+        if limit <= 0:
+            return []
+        if limit < len(similarities):
+            top = np.argpartition(-similarities, limit - 1)[:limit]
+        else:
+            top = np.arange(len(similarities))
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return [(self.chunk_ids[i], float(1.0 - similarities[i])) for i in top]
+
+    def search(self, query_vector, limit: int):
+        """Returns up to ``limit`` (chunk_id, cosine distance) tuples, nearest first."""
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm == 0 or len(self.chunk_ids) == 0:
+            return []
+        return self._top_k(self.matrix @ (q / norm), limit)
+
+    def search_many(self, query_vectors, limit: int):
+        """Top-k for several query vectors with a single matrix product."""
+        q = np.asarray(query_vectors, dtype=np.float32)
+        if q.ndim != 2 or len(q) == 0 or len(self.chunk_ids) == 0:
+            return [[] for _ in range(len(q))]
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        similarities = (q / norms) @ self.matrix.T
+        return [self._top_k(row, limit) for row in similarities]
+
+    def self_check(self, connection, samples: int = 16, k: int = 10, tolerance: float = 1e-4) -> dict:
+        """Compares top-k against exact ``array_cosine_distance`` results computed by DuckDB.
+
+        Uses stored embeddings as queries (no embedding server needed). The exact side is
+        materialized before ordering so the HNSW index cannot answer it approximately.
+        Ids are compared as a set (recall); an expected id that was not returned still
+        counts as a hit when its distance is within ``tolerance`` of the k-th expected
+        distance (a tie at the cut-off). Distances are compared for the ids both sides
+        returned.
+        """
+        n = len(self.chunk_ids)
+        if n == 0:
+            return {"queries": 0, "k": k, "recall": 1.0, "max_distance_error": 0.0, "ok": True}
+        positions = np.linspace(0, n - 1, num=min(samples, n)).astype(int)
+        sql = f"""
+        WITH d AS MATERIALIZED (
+            SELECT chunk_id, array_cosine_distance(embedding, CAST(? AS FLOAT[{self.dim}])) AS score
+            FROM {self.table_name}
+        )
+        SELECT chunk_id, score FROM d ORDER BY score ASC LIMIT {k};
+        """
+        hits = 0
+        max_err = 0.0
+        for pos in positions:
+            (query_vector,) = connection.execute(
+                f"SELECT embedding FROM {self.table_name} WHERE chunk_id = ?;", [self.chunk_ids[pos]]
+            ).fetchone()
+            expected = connection.execute(sql, [query_vector]).fetchall()
+            got = self.search(query_vector, k)
+            got_distances = dict(got)
+            kth_distance = float(expected[-1][1]) if expected else 0.0
+            for chunk_id, d_exp in expected:
+                if chunk_id in got_distances:
+                    hits += 1
+                    max_err = max(max_err, abs(float(d_exp) - got_distances[chunk_id]))
+                elif abs(float(d_exp) - kth_distance) <= tolerance:
+                    hits += 1
+        recall = hits / float(len(positions) * min(k, n))
+        return {
+            "queries": len(positions),
+            "k": k,
+            "recall": recall,
+            "max_distance_error": max_err,
+            "ok": max_err <= tolerance and recall >= self.SELF_CHECK_MIN_RECALL,
+        }
+
+
+class QuantizedVectorIndex(NumpyVectorIndex):
+    """Cosine top-k from quantized embeddings with float32 rescoring.
+
+    The first pass scores every chunk against int8 codes (``scale * q . codes``) or 1-bit
+    sign codes (Hamming distance). The best ``rescore_factor * limit`` candidates are then
+    rescored exactly with their float32 embeddings, read from DuckDB through ``fetch``
+    (``(sql, params) -> fetchnumpy() dict``), so no float32 matrix is held in memory.
+    Returned distances are exact.
+    """
+
+    # A true neighbour can fall outside the quantized candidate set
+    SELF_CHECK_MIN_RECALL = 0.9
+
+    def __init__(self, connection, table_name: str, quantization: str = "int8", rescore_factor: int = 4, fetch=None):
+        if quantization not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization '{quantization}', expected 'int8' or 'binary'")
+        self.table_name = table_name
+        self.quantization = quantization
+        self.rescore_factor = max(1, int(rescore_factor))
+        self._fetch = fetch or (lambda sql, params: connection.execute(sql, params).fetchnumpy())
+        if quantization == "int8":
+            data = connection.execute(
+                f"SELECT chunk_id, embedding_int8 AS codes, embedding_scale AS scale FROM {table_name} ORDER BY chunk_id;"
+            ).fetchnumpy()
+        else:
+            data = connection.execute(
+                f"SELECT chunk_id, embedding_bits AS codes FROM {table_name} ORDER BY chunk_id;"
+            ).fetchnumpy()
+        self.chunk_ids: list[str] = [str(c) for c in data["chunk_id"]]
+        codes = data["codes"]
+        width = len(codes[0]) if len(codes) else 0
+        self.codes = _aligned_empty((len(codes), width), dtype=np.int8 if quantization == "int8" else np.uint8)
+        for i, row in enumerate(codes):
+            self.codes[i] = row
+        self.scales = np.asarray(data["scale"], dtype=np.float32) if quantization == "int8" else None
+        self._dim = width if quantization == "int8" else width * 8
+        self._rescore_sql = f"SELECT chunk_id, embedding FROM {table_name} WHERE list_contains(?, chunk_id);"
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _first_pass(self, queries: np.ndarray) -> np.ndarray:
+        """Approximate similarity (higher is closer) of each unit query row to every chunk."""
+        n = len(self.chunk_ids)
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        if self.quantization == "int8":
+            for lo in range(0, n, _BLOCK_ROWS):
+                hi = min(lo + _BLOCK_ROWS, n)
+                block = self.codes[lo:hi].astype(np.float32)
+                scores[:, lo:hi] = (queries @ block.T) * self.scales[lo:hi]
+        else:
+            for i, query_bits in enumerate(np.packbits(queries > 0, axis=1)):
+                scores[i] = -np.bitwise_count(self.codes ^ query_bits).sum(axis=1, dtype=np.int32)
+        return scores
+
+    def _float_vectors(self, positions) -> dict[int, np.ndarray]:
+        """Unit float32 embeddings of the given chunk positions, read from the table."""
+        ids = [self.chunk_ids[p] for p in positions]
+        position_of = dict(zip(ids, (int(p) for p in positions)))
+        data = self._fetch(self._rescore_sql, [ids])
+        vectors = {}
+        for chunk_id, embedding in zip(data["chunk_id"], data["embedding"]):
+            vec = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vec)
+            vectors[position_of[str(chunk_id)]] = vec / norm if norm else vec
+        return vectors
+
+    def search(self, query_vector, limit: int):
+        """Returns up to ``limit`` (chunk_id, cosine distance) tuples, nearest first."""
+        q = np.asarray(query_vector, dtype=np.float32)
+        if np.linalg.norm(q) == 0 or len(self.chunk_ids) == 0:
+            return []
+        return self.search_many(q[None, :], limit)[0]
+
+    def search_many(self, query_vectors, limit: int):
+        """Batched first pass; the float32 vectors of all candidates are read in one query."""
+        q = np.asarray(query_vectors, dtype=np.float32)
+        if q.ndim != 2 or len(q) == 0 or len(self.chunk_ids) == 0 or limit <= 0:
+            return [[] for _ in range(len(q))]
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        q = q / norms
+        approx = self._first_pass(q)
+        count = min(len(self.chunk_ids), limit * self.rescore_factor)
+        candidates = []
+        for row in approx:
+            top = np.argpartition(-row, count - 1)[:count] if count < len(row) else np.arange(len(row))
+            # Chunk order, so ties break like the exact engine
+            candidates.append(np.sort(top))
+        vectors = self._float_vectors(np.unique(np.concatenate(candidates)))
+        results = []
+        for query, cand in zip(q, candidates):
+            cand = [p for p in cand if p in vectors]
+            if not cand:
+                results.append([])
+                continue
+            sims = np.stack([vectors[p] for p in cand]) @ query
+            order = np.argsort(-sims, kind="stable")[:limit]
+            results.append([(self.chunk_ids[cand[j]], float(1.0 - sims[j])) for j in order])
+        return results
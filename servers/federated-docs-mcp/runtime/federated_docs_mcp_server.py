@@ -0,0 +1,410 @@
+"""
+Federated MCP server: one process searching several documentation databases.
+
+Mounts the corpora listed in config/server_config.yaml (by default the Mojo manual and
+DuckDB docs databases of the sibling servers), checks/starts MAX once, embeds each query
+once and searches all corpora in parallel (see federated_search.py). Results are merged
+with corpus-aware RRF and tagged with their corpus.
+
+Requires: pip install "mcp[cli]"
+Run (dev inspector): mcp dev federated_docs_mcp_server.py
+"""
+
+from typing import List, Optional, AsyncIterator, Any
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import json
+import sys
+from pathlib import Path
+import os
+import socket
+import time
+import subprocess
+
+import requests
+
+try:
+    from mcp.server.fastmcp import FastMCP, Context
+except Exception as e:  # pragma: no cover - helpful message if not installed
+    raise RuntimeError(
+        "The 'mcp' package is required. Install with: pip install \"mcp[cli]\""
+    ) from e
+
+from pydantic import BaseModel, Field
+
+# Ensure runtime dir and project root are on sys.path
+_RUNTIME_DIR = Path(__file__).resolve().parent
+_SERVER_ROOT = _RUNTIME_DIR.parent
+_PROJECT_ROOT = _SERVER_ROOT.parent.parent
+
+if str(_RUNTIME_DIR) not in sys.path:
+    sys.path.insert(0, str(_RUNTIME_DIR))
+
+if str(_PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(_PROJECT_ROOT))
+
+# Try to import config loader from shared, fallback to simple yaml load
+try:
+    from shared.config_loader import load_config_with_substitution as load_config
+except ImportError:
+    import yaml
+    def load_config(config_path, server_root=None):
+        with open(config_path, "r") as f:
+            content = f.read()
+            if server_root:
+                content = content.replace("${SERVER_ROOT}", str(server_root))
+            return yaml.safe_load(content)
+
+# Import search modules
+import search as search_mod  # noqa: E402
+from federated_search import FederatedSearcher  # noqa: E402
+from metrics import prometheus_text, write_textfile  # noqa: E402
+TOP_K = search_mod.TOP_K
+
+
+# Structured result model for tools
+class SearchResult(BaseModel):
+    corpus: str
+    chunk_id: str
+    title: str
+    url: str
+    section_hierarchy: Optional[List[str]] = Field(default=None)
+    snippet: str
+    # Search branches left out because they missed the deadline ("embed", "vss")
+    degraded: Optional[List[str]] = Field(default=None)
+
+
+class AppState:
+    def __init__(
+        self, searcher: Any, max_proc: Optional[subprocess.Popen] = None
+    ) -> None:  # type: ignore[name-defined]
+        self.searcher = searcher
+        self.max_proc = max_proc
+
+
+def _parse_host_port_from_url(url: str) -> tuple[str, int]:
+    try:
+        from urllib.parse import urlparse
+
+        parsed = urlparse(url)
+        host = parsed.hostname or "localhost"
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        return host, port
+    except Exception:
+        return ("localhost", 8000)
+
+
+def _tcp_connect_ok(host: str, port: int, timeout_s: float = 0.5) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout_s):
+            return True
+    except Exception:
+        return False
+
+
+def _http_probe_ok(url: str, timeout_s: float = 0.75) -> bool:
+    try:
+        # Any HTTP response means the server is up; 404 is fine
+        requests.get(url, timeout=timeout_s)
+        return True
+    except Exception:
+        return False
+
+
+def _ensure_max_running(
+    base_url: str, model_name: str, auto_start: bool = True, wait_s: float = 20.0
+) -> Optional[subprocess.Popen]:  # type: ignore[name-defined]
+    """Ensure a MAX embeddings server is reachable at base_url. Optionally auto-start.
+
+    Returns a subprocess handle if we started it, else None.
+    """
+    host, port = _parse_host_port_from_url(base_url)
+    if _tcp_connect_ok(host, port) or _http_probe_ok(base_url):
+        return None
+
+    if not auto_start:
+        return None
+
+    # Start MAX server; hide stdio to avoid corrupting MCP stdio transport
+    try:
+        proc = subprocess.Popen(
+            [
+                os.environ.get("MAX_BINARY", "max"),
+                "serve",
+                "--model",
+                model_name,
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL,
+        )
+    except Exception:
+        return None
+
+    # Wait for readiness (poll TCP/HTTP)
+    deadline = time.time() + max(0.0, wait_s)
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            # process exited early
+            return None
+        if _tcp_connect_ok(host, port) or _http_probe_ok(base_url):
+            return proc
+        time.sleep(0.5)
+    return proc  # may not be ready yet; caller can still proceed with FTS-only fallback
+
+
+def _write_metrics(searcher: Any, path: str, server_name: str) -> None:
+    try:
+        write_textfile(path, prometheus_text(searcher.stats(), labels={"server": server_name}))
+    except Exception as e:
+        print(f"Warning: Failed to write metrics to {path}: {e}", file=sys.stderr)
+
+
+async def _export_metrics(searcher: Any, path: str, interval_s: float, server_name: str) -> None:
+    """Rewrites the Prometheus text file every interval_s seconds until cancelled."""
+    while True:
+        _write_metrics(searcher, path, server_name)
+        await asyncio.sleep(interval_s)
+
+
+async def _warm_up(state: "AppState", base_url: str, model_name: str, auto_start: bool) -> None:
+    """Background half of startup: loads the extensions and vector engine while MAX is
+    checked/started, then switches vector search on. Searches are FTS-only meanwhile.
+    """
+    warmed, max_proc = await asyncio.gather(
+        asyncio.to_thread(state.searcher.warm_up),
+        asyncio.to_thread(_ensure_max_running, base_url, model_name, auto_start=auto_start),
+        return_exceptions=True,
+    )
+    if isinstance(max_proc, subprocess.Popen):
+        state.max_proc = max_proc
+    if isinstance(warmed, BaseException):
+        print(f"Warning: Warm-up failed, keeping FTS-only search: {warmed}", file=sys.stderr)
+        return
+    # Also when MAX is not up yet: failed embeddings still fall back to FTS per query
+    state.searcher.enable_vector_search()
+
+
+def _resolve_path(raw_path: str) -> str:
+    """Absolute paths (e.g. after ${SERVER_ROOT} substitution) are kept; others are
+    relative to the runtime directory."""
+    if os.path.isabs(raw_path):
+        return raw_path
+    return str(_RUNTIME_DIR / raw_path)
+
+
+@asynccontextmanager
+async def app_lifespan(server: FastMCP) -> AsyncIterator[AppState]:
+    """Startup/shutdown lifecycle to manage the shared federated searcher."""
+
+    # Load configuration
+    config_path = _SERVER_ROOT / "config" / "server_config.yaml"
+    config = {}
+    if config_path.exists():
+        try:
+            config = load_config(str(config_path), server_root=_SERVER_ROOT)
+        except Exception as e:
+            print(f"Warning: Failed to load config from {config_path}: {e}", file=sys.stderr)
+
+    embed_config = config.get("embedding", {})
+    search_config = config.get("search", {})
+    metrics_config = config.get("metrics") or {}
+    corpora = [
+        {**corpus, "path": _resolve_path(corpus["path"])}
+        for corpus in config.get("corpora", [])
+        if corpus.get("enabled", True)
+    ]
+
+    base_url = embed_config.get("max_server_url", os.getenv("MAX_SERVER_URL", "http://localhost:8000/v1"))
+    model_name = embed_config.get("model_name", os.getenv("EMBED_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2"))
+
+    auto_start_val = embed_config.get("auto_start", os.getenv("AUTO_START_MAX", "1"))
+    if isinstance(auto_start_val, str):
+        auto_start = auto_start_val.lower() not in ("false", "0", "no")
+    else:
+        auto_start = bool(auto_start_val)
+
+    background_warmup = bool(search_config.get("background_warmup", search_mod.BACKGROUND_WARMUP))
+
+    # One MAX check for all corpora (with background_warmup after startup, together with
+    # loading every corpus's extensions and vector engine)
+    max_proc = None
+    if not background_warmup:
+        max_proc = _ensure_max_running(base_url, model_name, auto_start=auto_start)
+
+    searcher = FederatedSearcher(
+        corpora,
+        max_server_url=base_url,
+        model_name=model_name,
+        result_cache_size=int(search_config.get("result_cache_size", search_mod.RESULT_CACHE_SIZE)),
+        result_cache_ttl_s=float(search_config.get("result_cache_ttl_s", search_mod.RESULT_CACHE_TTL_S)),
+        embed_cache_path=str(_RUNTIME_DIR / "federated_docs_mcp_embed_cache.sqlite"),
+        embed_cache_size=int(search_config.get("embed_cache_size", search_mod.EMBED_CACHE_SIZE)),
+        persistent_embed_cache_size=int(
+            search_config.get("persistent_embed_cache_size", search_mod.PERSISTENT_EMBED_CACHE_SIZE)
+        ),
+        execution_mode=search_config.get("execution_mode", search_mod.EXECUTION_MODE),
+        fts_engine=search_config.get("fts_engine", search_mod.FTS_ENGINE),
+        vector_engine=search_config.get("vector_engine", search_mod.VECTOR_ENGINE),
+        vector_self_check=bool(search_config.get("vector_self_check", False)),
+        vector_quantization=search_config.get("vector_quantization", search_mod.VECTOR_QUANTIZATION),
+        vector_rescore_factor=int(search_config.get("vector_rescore_factor", search_mod.VECTOR_RESCORE_FACTOR)),
+        hnsw_ef_search=int(search_config.get("hnsw_ef_search") or search_mod.HNSW_EF_SEARCH),
+        worker_threads=int(search_config.get("worker_threads", search_mod.WORKER_THREADS)),
+        db_pool_size=int(search_config.get("db_pool_size", search_mod.DB_POOL_SIZE)),
+        snippet_chars=int(search_config.get("snippet_chars", search_mod.SNIPPET_CHARS)),
+        snippet_token_budget=int(search_config.get("snippet_token_budget", search_mod.SNIPPET_TOKEN_BUDGET)),
+        background_warmup=background_warmup,
+        deadline_ms=int(search_config.get("deadline_ms", search_mod.SEARCH_DEADLINE_MS)),
+        embed_timeout_s=float(embed_config.get("timeout_s", search_mod.EMBED_TIMEOUT_S)),
+        embed_connect_timeout_s=float(embed_config.get("connect_timeout_s", search_mod.EMBED_CONNECT_TIMEOUT_S)),
+        embed_breaker_threshold=int(
+            embed_config.get("breaker_failure_threshold", search_mod.EMBED_BREAKER_THRESHOLD)
+        ),
+        embed_breaker_reset_s=float(embed_config.get("breaker_reset_s", search_mod.EMBED_BREAKER_RESET_S)),
+    )  # opens every corpus read-only
+    state = AppState(searcher=searcher, max_proc=max_proc)
+    warmup = None
+    if background_warmup:
+        warmup = asyncio.create_task(_warm_up(state, base_url, model_name, auto_start))
+
+    # Optionally export metrics for the node_exporter textfile collector
+    textfile = metrics_config.get("prometheus_textfile")
+    exporter = None
+    if textfile:
+        interval_s = float(metrics_config.get("prometheus_interval_s", 15))
+        exporter = asyncio.create_task(_export_metrics(searcher, textfile, interval_s, server.name))
+    try:
+        yield state
+    finally:
+        if warmup is not None:
+            # Cancelling does not stop the warm-up thread; aclose() waits for it
+            warmup.cancel()
+            with suppress(asyncio.CancelledError):
+                await warmup
+        if exporter is not None:
+            exporter.cancel()
+            _write_metrics(searcher, textfile, server.name)
+        try:
+            await searcher.aclose()
+        except Exception:
+            pass
+        # Clean up spawned MAX process if we started it
+        try:
+            max_proc = state.max_proc
+            if isinstance(max_proc, subprocess.Popen) and max_proc.poll() is None:  # type: ignore[arg-type]
+                max_proc.terminate()
+        except Exception:
+            pass
+
+
+mcp = FastMCP("Federated Docs", lifespan=app_lifespan)
+
+
+def _to_result(row: Any, degraded: Optional[List[str]] = None) -> SearchResult:
+    # Federated rows: (corpus, chunk_id, title, snippet, url, section_hierarchy)
+    corpus, chunk_id, title, snippet, url, section_hierarchy = row
+    return SearchResult(
+        corpus=corpus,
+        chunk_id=str(chunk_id),
+        title=title or "",
+        url=url or "",
+        section_hierarchy=section_hierarchy if section_hierarchy else None,
+        snippet=snippet,
+        degraded=degraded,
+    )
+
+
+@mcp.tool()
+async def search(
+    query: str,
+    k: int = TOP_K,
+    corpora: Optional[List[str]] = None,
+    deadline_ms: Optional[int] = None,
+    ctx: Optional[Context] = None,
+) -> List[SearchResult]:
+    """Hybrid search over all mounted documentation corpora. Returns the top-k results
+    with snippets, each tagged with the corpus it came from.
+
+    Args:
+      query: The natural language query.
+      k: Number of results to return.
+      corpora: Corpus names to search (default: all); see the federated-docs-mcp://corpora resource.
+      deadline_ms: Latency budget in milliseconds (default: the server's; 0 = none). Results
+        that missed it come from keyword search alone and are marked `degraded`.
+    """
+    assert ctx is not None
+    state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
+    timings: dict = {}
+    rows = await state.searcher.asearch(query, k=k, corpora=corpora, timings=timings, deadline_ms=deadline_ms)
+    return [_to_result(row, timings.get("degraded")) for row in rows]
+
+
+@mcp.tool()
+async def stats(ctx: Optional[Context] = None) -> dict:
+    """Search latency and cache statistics since the server started.
+
+    Returns federated latency histograms in milliseconds (embed, per-corpus search,
+    merge, total), counters, the result cache hit rate and each corpus's own statistics.
+    """
+    assert ctx is not None
+    state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
+    return state.searcher.stats()
+
+
+@mcp.resource("federated-docs-mcp://corpora")
+async def corpora_resource() -> str:
+    """Mounted corpora (name, database, table, merge weight and quota) as JSON."""
+    # Static resources take no arguments, so the context comes from the server
+    state: AppState = mcp.get_context().request_context.lifespan_context  # type: ignore[assignment]
+    return json.dumps(state.searcher.describe(), indent=2)
+
+
+@mcp.resource("federated-docs-mcp://search/{q}")
+async def search_resource(q: str, ctx: Optional[Context] = None) -> str:
+    """Dynamic resource that returns a markdown view of top results for a query."""
+    assert ctx is not None
+    state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
+    rows = await state.searcher.asearch(q, k=TOP_K)
+    results = [_to_result(row) for row in rows]
+    lines: List[str] = [f"# Search results for: {q}"]
+    for i, r in enumerate(results, start=1):
+        path = " > ".join(r.section_hierarchy) if r.section_hierarchy else ""
+        lines.append(f"\n## {i}. {r.title} ({r.corpus})\n")
+        if path:
+            lines.append(f"Section: {path}\n")
+        lines.append(f"URL: {r.url}\n")
+        lines.append(r.snippet)
+    return "\n".join(lines)
+
+
+@mcp.resource("federated-docs-mcp://chunk/{corpus}/{chunk_id}")
+async def chunk_resource(corpus: str, chunk_id: str, ctx: Optional[Context] = None) -> str:
+    """Return a single chunk of a corpus by id as markdown (title, section, content, url)."""
+    assert ctx is not None
+    state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
+    rows = await state.searcher.aget_results_by_ids(corpus, [chunk_id])
+    if not rows:
+        return f"Chunk {chunk_id} not found in corpus {corpus}"
+    cid, title, content, url, section_hierarchy = rows[0]
+    path = " > ".join(section_hierarchy) if section_hierarchy else ""
+    parts = [f"# {title}"]
+    if path:
+        parts.append(f"Section: {path}")
+    parts.append(f"URL: {url}")
+    parts.append("")
+    parts.append(content)
+    return "\n\n".join(parts)
+
+
+@mcp.resource("federated-docs-mcp://stats")
+async def stats_resource() -> str:
+    """Search latency and cache statistics as JSON (same payload as the stats tool)."""
+    # Static resources take no arguments, so the context comes from the server
+    state: AppState = mcp.get_context().request_context.lifespan_context  # type: ignore[assignment]
+    return json.dumps(state.searcher.stats(), indent=2)
+
+
+if __name__ == "__main__":
+    # Allow direct execution for convenience (e.g., python federated_docs_mcp_server.py)
+    mcp.run()
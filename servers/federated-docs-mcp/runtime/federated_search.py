@@ -0,0 +1,413 @@
+"""
+Federated hybrid search over several documentation databases ("corpora").
+
+Every corpus is a regular ``HybridSearcher`` (its own read-only DuckDB connection, BM25
+index, vector engine and worker pool). ``FederatedSearcher`` embeds the query once per
+embedding space - corpora built with the same encoder share a single embeddings request
+and query-embedding cache - and fans the search out to all corpora in parallel: each
+corpus's FTS branch starts while the query is embedded, then VSS, fusion and the snippet
+fetch run on each corpus's pool concurrently.
+
+Per-corpus result lists are merged with corpus-aware RRF: a hit at rank r of corpus c
+scores weight_c / (RRF_K + r), ties go to the better rank and then to the corpus listed
+first. An optional per-corpus quota caps how many of the k results one corpus may take.
+
+asearch() honours a latency budget like HybridSearcher.asearch(): an embedding or a
+corpus's vector search still running at the deadline is left out and those corpora are
+fused from FTS alone.
+"""
+
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import SearchMetrics
+from search import (
+    MAX_SERVER_URL,
+    MODEL_NAME,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL_S,
+    RRF_K,
+    SEARCH_DEADLINE_MS,
+    TOP_K,
+    HybridSearcher,
+    _ResultCache,
+    _SingleFlight,
+    _UNSET,
+    normalize_query,
+)
+
+
+class Corpus:
+    """One mounted database and its weight and quota in the merge."""
+
+    def __init__(self, name: str, searcher: HybridSearcher, weight: float = 1.0, quota: int | None = None):
+        self.name = name
+        self.searcher = searcher
+        self.weight = weight
+        self.quota = quota
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "db_path": self.searcher.db_path,
+            "table_name": self.searcher.table_name,
+            "weight": self.weight,
+            "quota": self.quota,
+        }
+
+
+class FederatedSearcher:
+    """
+    Hybrid search across several corpora with one shared query encoder.
+    """
+
+    def __init__(
+        self,
+        corpora: list[dict],
+        max_server_url=MAX_SERVER_URL,
+        model_name=MODEL_NAME,
+        result_cache_size=RESULT_CACHE_SIZE,
+        result_cache_ttl_s=RESULT_CACHE_TTL_S,
+        embed_cache_path=None,
+        deadline_ms=SEARCH_DEADLINE_MS,
+        **searcher_kwargs,
+    ):
+        """``corpora`` entries: name, path, table_name and optionally weight (default 1.0),
+        quota (max results per search, default none), bm25_index_dir, fts_synonyms (list
+        of {match, add} word lists) and fts_like_fallback. ``deadline_ms`` is
+        the default budget of asearch(). Other keyword arguments are passed to every
+        corpus's HybridSearcher.
+        """
+        if not corpora:
+            raise ValueError("At least one corpus is required")
+        names = [c.get("name") for c in corpora]
+        if not all(names) or len(set(names)) != len(names):
+            raise ValueError(f"Corpus names must be set and unique, got {names}")
+        self.metrics = SearchMetrics()
+        self.deadline_ms = deadline_ms
+        self.corpora: dict[str, Corpus] = {}
+        try:
+            for config in corpora:
+                searcher = HybridSearcher(
+                    db_path=config["path"],
+                    table_name=config["table_name"],
+                    max_server_url=max_server_url,
+                    model_name=model_name,
+                    bm25_index_dir=config.get("bm25_index_dir"),
+                    fts_synonyms=[(entry["match"], entry["add"]) for entry in config.get("fts_synonyms") or []],
+                    fts_like_fallback=bool(config.get("fts_like_fallback", False)),
+                    # Caching happens per federated search; the query-embedding cache is
+                    # one file for all corpora, keyed by embedding space
+                    result_cache_size=0,
+                    embed_cache_path=embed_cache_path,
+                    **searcher_kwargs,
+                )
+                quota = config.get("quota")
+                self.corpora[config["name"]] = Corpus(
+                    config["name"],
+                    searcher,
+                    weight=float(config.get("weight", 1.0)),
+                    quota=int(quota) if quota else None,
+                )
+        except Exception:
+            self.close()
+            raise
+        # Corpora whose databases share an embedding space reuse one query embedding,
+        # computed by the first of them
+        self._encoders: dict[str, HybridSearcher] = {}
+        for corpus in self.corpora.values():
+            self._encoders.setdefault(corpus.searcher._embedding_space, corpus.searcher)
+        if len(self._encoders) > 1:
+            try:
+                sys.stderr.write(
+                    f"[WARN] Corpora use {len(self._encoders)} embedding spaces; "
+                    "each query is embedded once per space\n"
+                )
+                sys.stderr.flush()
+            except Exception:
+                pass
+        self.result_cache = _ResultCache(result_cache_size, result_cache_ttl_s, generation=self._db_generation)
+        # Identical concurrent searches share one fan-out
+        self._flights = _SingleFlight()
+        # Fan-out threads of the synchronous search()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.corpora), thread_name_prefix="federated")
+
+    def _db_generation(self):
+        return tuple(corpus.searcher._db_generation() for corpus in self.corpora.values())
+
+    def _select(self, corpora: list[str] | None) -> list[Corpus]:
+        if not corpora:
+            return list(self.corpora.values())
+        unknown = [name for name in corpora if name not in self.corpora]
+        if unknown:
+            raise ValueError(f"Unknown corpus {unknown}, expected one of {list(self.corpora)}")
+        return [self.corpora[name] for name in dict.fromkeys(corpora)]
+
+    def _merge(self, selected: list[Corpus], per_corpus: list[list], k: int) -> list[tuple]:
+        """Corpus-aware RRF over the per-corpus rankings, honouring quotas."""
+        scored = []
+        for order, (corpus, rows) in enumerate(zip(selected, per_corpus)):
+            for rank, row in enumerate(rows, start=1):
+                scored.append((-corpus.weight / (RRF_K + rank), rank, order, corpus.name, row))
+        scored.sort(key=lambda item: item[:3])
+        taken: dict[str, int] = {}
+        merged = []
+        for _, _, order, name, row in scored:
+            quota = selected[order].quota
+            if quota is not None and taken.get(name, 0) >= quota:
+                continue
+            taken[name] = taken.get(name, 0) + 1
+            merged.append((name, *row))
+            if len(merged) == k:
+                break
+        return merged
+
+    @staticmethod
+    def _limit(corpus: Corpus, k: int) -> int:
+        return min(k, corpus.quota) if corpus.quota is not None else k
+
+    def _record(self, selected: list[Corpus], timings: list[dict], embed_ms: float, start: float, merge_start: float):
+        """Per-corpus stages go to each corpus's metrics; the federated metrics get embed,
+        corpus_<name> (a corpus's search, embedding included), merge and total.
+        """
+        now = time.perf_counter()
+        self.metrics.observe("embed", embed_ms)
+        for corpus, corpus_timings in zip(selected, timings):
+            corpus.searcher.metrics.incr("searches")
+            corpus.searcher.metrics.observe_timings(corpus_timings)
+            if "total_ms" in corpus_timings:
+                self.metrics.observe(f"corpus_{corpus.name}", corpus_timings["total_ms"])
+        self.metrics.observe("merge", (now - merge_start) * 1000.0)
+        self.metrics.observe("total", (now - start) * 1000.0)
+
+    def _failed(self, corpus: Corpus, error: BaseException) -> list:
+        """A corpus that fails is left out of the merge instead of failing the search."""
+        self.metrics.incr("corpus_errors")
+        try:
+            sys.stderr.write(f"[WARN] Search in corpus '{corpus.name}' failed: {error}\n")
+            sys.stderr.flush()
+        except Exception:
+            pass
+        return []
+
+    def search(
+        self,
+        query_text: str,
+        k: int = TOP_K,
+        corpora: list[str] | None = None,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+    ):
+        """Returns the merged top-k rows (corpus, chunk_id, title, snippet, url,
+        section_hierarchy) over the selected corpora (default: all).
+        """
+        selected = self._select(corpora)
+        key = (normalize_query(query_text), k, tuple(c.name for c in selected), fts_weight, vss_weight)
+        self.metrics.incr("searches")
+        rows = self.result_cache.get(key)
+        if rows is not None:
+            return rows
+        rows, shared = self._flights.do(key, self._search, key, selected, query_text, k, fts_weight, vss_weight)
+        if shared:
+            self.metrics.incr("searches_coalesced")
+        return rows
+
+    def _search(self, key, selected, query_text, k, fts_weight, vss_weight):
+        """Body of search(); one run is shared by all coalesced callers."""
+        start = time.perf_counter()
+        timings = [{} for _ in selected]
+        fts = [
+            c.searcher._executor.submit(
+                c.searcher._timed, t, "fts", c.searcher.full_text_search, query_text, self._limit(c, k) * 2
+            )
+            for c, t in zip(selected, timings)
+        ]
+        vectors = {
+            space: encoder.get_query_embedding(query_text)
+            for space, encoder in self._encoders.items()
+            if any(c.searcher._embedding_space == space for c in selected)
+        }
+        embed_ms = (time.perf_counter() - start) * 1000.0
+        futures = []
+        for c, t, fts_results in zip(selected, timings, fts):
+            t["embed_ms"] = embed_ms
+            futures.append(
+                self._executor.submit(
+                    self._search_corpus, c, query_text, k, fts_weight, vss_weight,
+                    vectors[c.searcher._embedding_space], fts_results, t, start,
+                )
+            )
+        per_corpus = []
+        for c, future in zip(selected, futures):
+            try:
+                per_corpus.append(future.result())
+            except Exception as e:
+                per_corpus.append(self._failed(c, e))
+        merge_start = time.perf_counter()
+        rows = self._merge(selected, per_corpus, k)
+        self._record(selected, timings, embed_ms, start, merge_start)
+        self.result_cache.set(key, rows)
+        return rows
+
+    def _search_corpus(self, corpus, query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings, start):
+        searcher = corpus.searcher
+        try:
+            return searcher._search(
+                query_text, self._limit(corpus, k), fts_weight, vss_weight, query_vector, fts_results, timings
+            )
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000.0
+
+    async def asearch(
+        self,
+        query_text: str,
+        k: int = TOP_K,
+        corpora: list[str] | None = None,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+        timings: dict | None = None,
+        deadline_ms: int | None = None,
+    ):
+        """Async search(): FTS starts on every corpus's pool, the query is embedded once per
+        embedding space on the event loop, then the corpora finish their searches
+        concurrently. Cache hits return without leaving the loop and identical searches
+        already running are joined. ``deadline_ms`` (default: the searcher's, 0 = none)
+        bounds the embedding and vector search waits; ``timings["degraded"]`` then lists
+        the branches left out and the rows are not cached.
+        """
+        timings = {} if timings is None else timings
+        deadline_ms = self.deadline_ms if deadline_ms is None else deadline_ms
+        selected = self._select(corpora)
+        key = (normalize_query(query_text), k, tuple(c.name for c in selected), fts_weight, vss_weight)
+        self.metrics.incr("searches")
+        rows = self.result_cache.get(key)
+        if rows is not None:
+            return rows
+        (rows, degraded), shared = await self._flights.ado(
+            (key, deadline_ms), self._asearch, key, selected, query_text, k, fts_weight, vss_weight, deadline_ms
+        )
+        if shared:
+            self.metrics.incr("searches_coalesced")
+        if degraded:
+            timings["degraded"] = degraded
+        return rows
+
+    async def _asearch(self, key, selected, query_text, k, fts_weight, vss_weight, deadline_ms):
+        """Body of asearch(); one run is shared by all coalesced callers.
+        Returns (rows, degraded branches).
+        """
+        start = time.perf_counter()
+        deadline = start + deadline_ms / 1000.0 if deadline_ms else None
+        degraded: list[str] = []
+        timings = [{} for _ in selected]
+        fts = [
+            c.searcher._executor.submit(
+                c.searcher._timed, t, "fts", c.searcher.full_text_search, query_text, self._limit(c, k) * 2
+            )
+            for c, t in zip(selected, timings)
+        ]
+        spaces = [
+            space for space in self._encoders if any(c.searcher._embedding_space == space for c in selected)
+        ]
+        embedded = await asyncio.gather(
+            *(
+                HybridSearcher._before_deadline(self._encoders[s].aget_query_embedding(query_text), deadline)
+                for s in spaces
+            )
+        )
+        if any(vector is _UNSET for vector in embedded):
+            degraded.append("embed")
+        vectors = {s: None if vector is _UNSET else vector for s, vector in zip(spaces, embedded)}
+        embed_ms = (time.perf_counter() - start) * 1000.0
+        for t in timings:
+            t["embed_ms"] = embed_ms
+        results = await asyncio.gather(
+            *(
+                self._asearch_corpus(
+                    c, query_text, k, fts_weight, vss_weight,
+                    vectors[c.searcher._embedding_space], fts_results, t, start, deadline, degraded,
+                )
+                for c, t, fts_results in zip(selected, timings, fts)
+            ),
+            return_exceptions=True,
+        )
+        per_corpus = [
+            self._failed(c, result) if isinstance(result, BaseException) else result
+            for c, result in zip(selected, results)
+        ]
+        merge_start = time.perf_counter()
+        rows = self._merge(selected, per_corpus, k)
+        self._record(selected, timings, embed_ms, start, merge_start)
+        # Several corpora may drop their vector branch; each branch is reported once
+        degraded = list(dict.fromkeys(degraded))
+        if degraded:
+            self.metrics.incr("searches_degraded")
+            for branch in degraded:
+                self.metrics.incr(f"degraded_{branch}")
+        else:
+            self.result_cache.set(key, rows)
+        return rows, degraded
+
+    async def _asearch_corpus(
+        self, corpus, query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings, start, deadline,
+        degraded,
+    ):
+        try:
+            return await corpus.searcher._run_search(
+                query_text, self._limit(corpus, k), fts_weight, vss_weight, query_vector, fts_results, timings,
+                deadline, degraded,
+            )
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000.0
+
+    async def aget_results_by_ids(self, corpus: str, chunk_ids: list):
+        """Full rows (chunk_id, title, content, url, section_hierarchy) from one corpus."""
+        searcher = self._select([corpus])[0].searcher
+        return await searcher.aget_results_by_ids(chunk_ids)
+
+    def warm_up(self):
+        """Warms all corpora up in parallel (HybridSearcher.warm_up, background_warmup)."""
+        # Own threads: the fan-out pool keeps serving searches meanwhile
+        with ThreadPoolExecutor(max_workers=len(self.corpora), thread_name_prefix="warmup") as pool:
+            for future in [pool.submit(corpus.searcher.warm_up) for corpus in self.corpora.values()]:
+                future.result()
+
+    def enable_vector_search(self):
+        for corpus in self.corpora.values():
+            corpus.searcher.enable_vector_search()
+
+    def describe(self) -> list[dict]:
+        return [corpus.describe() for corpus in self.corpora.values()]
+
+    def stats(self) -> dict:
+        """Federated metrics snapshot (stages embed, corpus_<name>, merge, total) with the
+        result cache and the per-corpus searcher stats.
+        """
+        snapshot = self.metrics.snapshot()
+        lookups = self.result_cache.hits + self.result_cache.misses
+        snapshot["caches"] = {
+            "result": {
+                "hits": self.result_cache.hits,
+                "misses": self.result_cache.misses,
+                "hit_rate": self.result_cache.hits / lookups if lookups else 0.0,
+                "entries": len(self.result_cache),
+            }
+        }
+        snapshot["corpora"] = {name: corpus.searcher.stats() for name, corpus in self.corpora.items()}
+        return snapshot
+
+    def close(self):
+        """Closes every corpus searcher."""
+        executor = getattr(self, "_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for corpus in self.corpora.values():
+            corpus.searcher.close()
+
+    async def aclose(self):
+        """Closes every corpus searcher without blocking the event loop."""
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+        await asyncio.gather(*(corpus.searcher.aclose() for corpus in self.corpora.values()))
+
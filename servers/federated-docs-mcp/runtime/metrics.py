@@ -0,0 +1,157 @@
+"""
+Always-on search metrics: per-stage latency histograms and event counters.
+
+``HybridSearcher`` records the per-stage wall times it already collects for every search
+(embed, fts, vss, fused_sql, fetch, total, ...) and counts cache hits, embedding
+failures (searches that fell back to FTS only) and the FTS path taken. Recording is a
+lock plus a bucket increment, so it stays on in production.
+
+Snapshots are served by the MCP ``stats`` tool/resource and can be written as a
+Prometheus text file (node_exporter textfile collector format).
+"""
+
+import bisect
+import os
+import threading
+import time
+
+# Upper bounds of the latency buckets in milliseconds (the last bucket is +Inf)
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0, 10000.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (not thread-safe; guarded by SearchMetrics)."""
+
+    def __init__(self, bounds=BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimates the q-quantile by linear interpolation inside its bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.sum / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max,
+            "sum_ms": self.sum,
+            "buckets": list(self.counts),
+        }
+
+
+class SearchMetrics:
+    """Thread-safe registry of stage histograms and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: dict[str, Histogram] = {}
+        self._counters: dict[str, int] = {}
+        self.started_at = time.time()
+
+    def observe(self, stage: str, ms: float):
+        with self._lock:
+            hist = self._histograms.get(stage)
+            if hist is None:
+                hist = self._histograms[stage] = Histogram()
+            hist.observe(ms)
+
+    def observe_timings(self, timings: dict):
+        """Records every ``<stage>_ms`` entry of a search's timings dict."""
+        with self._lock:
+            for key, ms in timings.items():
+                if not key.endswith("_ms"):
+                    continue
+                stage = key[:-3]
+                hist = self._histograms.get(stage)
+                if hist is None:
+                    hist = self._histograms[stage] = Histogram()
+                hist.observe(ms)
+
+    def incr(self, counter: str, n: int = 1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + n
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "uptime_s": time.time() - self.started_at,
+                "bucket_bounds_ms": list(BUCKETS_MS),
+                "stages": {name: hist.snapshot() for name, hist in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+
+def _metric_name(*parts: str) -> str:
+    return "_".join(p.replace("-", "_").replace(".", "_") for p in parts if p)
+
+
+def prometheus_text(stats: dict, prefix: str = "mcp_search", labels: dict | None = None) -> str:
+    """Renders a ``HybridSearcher.stats()`` snapshot in the Prometheus text format."""
+    label_str = ",".join(f'{k}="{v}"' for k, v in (labels or {}).items())
+
+    def fmt(extra: str = "") -> str:
+        inner = ",".join(p for p in (label_str, extra) if p)
+        return "{" + inner + "}" if inner else ""
+
+    lines = []
+    name = _metric_name(prefix, "stage_duration_ms")
+    lines.append(f"# HELP {name} Search stage wall time in milliseconds")
+    lines.append(f"# TYPE {name} histogram")
+    bounds = stats["bucket_bounds_ms"]
+    for stage, hist in stats["stages"].items():
+        stage_label = 'stage="%s"' % stage
+        cumulative = 0
+        for bound, count in zip(list(bounds) + ["+Inf"], hist["buckets"]):
+            cumulative += count
+            bucket_label = '%s,le="%s"' % (stage_label, bound)
+            lines.append(f"{name}_bucket{fmt(bucket_label)} {cumulative}")
+        lines.append(f"{name}_sum{fmt(stage_label)} {hist['sum_ms']}")
+        lines.append(f"{name}_count{fmt(stage_label)} {hist['count']}")
+    for counter, value in stats["counters"].items():
+        cname = _metric_name(prefix, counter, "total")
+        lines.append(f"# TYPE {cname} counter")
+        lines.append(f"{cname}{fmt()} {value}")
+    for cache, values in stats.get("caches", {}).items():
+        gname = _metric_name(prefix, cache, "cache_hit_ratio")
+        lines.append(f"# TYPE {gname} gauge")
+        lines.append(f"{gname}{fmt()} {values['hit_rate']}")
+    uname = _metric_name(prefix, "uptime_seconds")
+    lines.append(f"# TYPE {uname} gauge")
+    lines.append(f"{uname}{fmt()} {stats['uptime_s']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, text: str):
+    """Writes a Prometheus text file atomically (the collector never reads a partial file)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,1692 @@
+"""
+Hybrid search (DuckDB VSS + FTS) over one corpus of the federated docs server.
+
+The same engine as each single-corpus server's runtime/search.py, with the corpus-specific
+parts supplied by the corpus configuration instead of being edited into the code: the
+database path and table, the FTS synonym expansion (``fts_synonyms``) and whether a
+keyword (LIKE) scan backs up DuckDB FTS (``fts_like_fallback``). Used through
+federated_search.FederatedSearcher; there is no command line entry point.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from openai import AsyncOpenAI, OpenAI, Timeout
+import duckdb
+import os
+import asyncio
+import functools
+import hashlib
+import json
+import queue
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+from bm25_index import BM25Index
+from embedding_cache import PersistentEmbeddingCache
+from metrics import SearchMetrics
+from vector_index import NumpyVectorIndex, QuantizedVectorIndex
+
+# --- Configuration ---
+MAX_SERVER_URL = os.getenv("MAX_SERVER_URL", "http://localhost:8000/v1")
+MODEL_NAME = os.getenv("EMBED_MODEL_NAME", "sentence-transformers/all-mpnet-base-v2")
+# Embedding width assumed for databases built before the embedding_metadata table existed
+# (normally the width is read from the database; see _read_embedding_metadata)
+EMBEDDING_DIM = 768
+TOP_K = 5  # Default number of results to return
+# FTS scoring weights (title boosted)
+FTS_TITLE_WEIGHT = 2.0
+FTS_CONTENT_WEIGHT = 1.0
+# Debug/verification flags
+DEBUG_EXPLAIN_VSS = False  # when True, prints EXPLAIN of VSS query to confirm HNSW_INDEX_SCAN
+DEBUG_LOG_FTS_PATH = False  # when True, prints which FTS path was used
+DEBUG_LOG_TIMINGS = False  # when True, prints per-branch timings of each async search
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "512"))
+# Embeddings requests: total and connect timeouts in seconds. Requests are not retried;
+# a failed one makes the search FTS-only
+EMBED_TIMEOUT_S = float(os.getenv("EMBED_TIMEOUT_S", "2.0"))
+EMBED_CONNECT_TIMEOUT_S = float(os.getenv("EMBED_CONNECT_TIMEOUT_S", "0.25"))
+# Circuit breaker: consecutive embedding failures that open it (0 disables it) and seconds
+# between the background probes that close it again once the endpoint answers
+EMBED_BREAKER_THRESHOLD = int(os.getenv("EMBED_BREAKER_THRESHOLD", "3"))
+EMBED_BREAKER_RESET_S = float(os.getenv("EMBED_BREAKER_RESET_S", "5"))
+# Entries in the on-disk query-embedding cache next to the database (0 disables it)
+PERSISTENT_EMBED_CACHE_SIZE = int(os.getenv("PERSISTENT_EMBED_CACHE_SIZE", "100000"))
+# "staged" issues VSS, FTS, RRF and the payload fetch separately; "fused" runs the SQL vector
+# search, RRF and the fetch as one statement (only used with vector_engine "duckdb")
+EXECUTION_MODE = os.getenv("SEARCH_EXECUTION_MODE", "staged")
+RRF_K = 60  # RRF constant, typically 60
+SNIPPET_CHARS = 500  # content characters returned per hit by search()
+# Approximate tokens for all snippets of one response (0 = no limit): each of the n hits
+# gets min(snippet_chars, budget * SNIPPET_CHARS_PER_TOKEN / n) characters
+SNIPPET_TOKEN_BUDGET = int(os.getenv("SEARCH_SNIPPET_TOKEN_BUDGET", "0"))
+SNIPPET_CHARS_PER_TOKEN = 4
+SNIPPET_MIN_CHARS = 80
+# "memory" scores FTS with the memory-mapped BM25 index built by create_indexes.py
+# (falls back to "duckdb", the fts extension's match_bm25, when the index is missing)
+FTS_ENGINE = os.getenv("SEARCH_FTS_ENGINE", "memory")
+# "numpy" answers vector_search in-process from a pre-normalized float32 matrix loaded at
+# startup; "duckdb" sends the query vector through the HNSW-backed SQL operator
+VECTOR_ENGINE = os.getenv("SEARCH_VECTOR_ENGINE", "duckdb")
+# HNSW candidate list size at query time (vector_engine "duckdb"); 0 keeps the ef_search
+# the index was built with (indexing.hnsw in processing_config.yaml)
+HNSW_EF_SEARCH = int(os.getenv("SEARCH_HNSW_EF_SEARCH", "0"))
+# With the numpy engine: "int8" or "binary" keeps only the quantized codes written by
+# create_indexes.py --quantize in memory and rescores the best rescore_factor * k
+# candidates with float32 read from DuckDB; "none" loads the float32 matrix
+VECTOR_QUANTIZATION = os.getenv("SEARCH_VECTOR_QUANTIZATION", "none")
+VECTOR_RESCORE_FACTOR = int(os.getenv("SEARCH_VECTOR_RESCORE_FACTOR", "4"))
+# Size of the thread pool the async API (asearch & co.) runs DuckDB work on
+WORKER_THREADS = int(os.getenv("SEARCH_WORKER_THREADS", "4"))
+# Cursors in the DuckDB pool: one per worker thread plus one for the calling thread
+DB_POOL_SIZE = int(os.getenv("SEARCH_DB_POOL_SIZE", "5"))
+# Defer loading the extensions and the vector engine to warm_up(), run by the server on a
+# background thread: searches are FTS-only until enable_vector_search() is called
+BACKGROUND_WARMUP = os.getenv("SEARCH_BACKGROUND_WARMUP", "0").lower() in ("1", "true", "yes")
+# Latency budget of one asearch() in milliseconds (0 = none): when the embedding or the
+# vector branch has not finished by then, the search returns FTS-only results marked degraded
+SEARCH_DEADLINE_MS = int(os.getenv("SEARCH_DEADLINE_MS", "0"))
+# Search result cache: entries (0 disables) and time-to-live in seconds (0 = no expiry)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "300"))
+# --- End Configuration ---
+
+# Marks "no precomputed query vector passed" (None means embedding failed -> FTS only)
+_UNSET = object()
+
+# Errors showing the fused statement cannot run on this database (execution falls back
+# to staged for good); any other fused failure only falls back for that query
+_FUSED_UNSUPPORTED = (duckdb.ParserException, duckdb.BinderException, duckdb.CatalogException)
+
+# Query words too common to locate the matching passage of a chunk
+_SNIPPET_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or the this to use "
+    "using what when where which with".split()
+)
+
+
+class _LRUCache:
+    def __init__(self, capacity: int = 512):
+        self.capacity = max(1, capacity)
+        self._store: OrderedDict[str, list[float]] = OrderedDict()
+
+    def get(self, key: str):
+        if key in self._store:
+            self._store.move_to_end(key)
+            return self._store[key]
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._store
+
+    def set(self, key: str, value: list[float]):
+        if key in self._store:
+            self._store.move_to_end(key)
+        self._store[key] = value
+        if len(self._store) > self.capacity:
+            self._store.popitem(last=False)
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: lowercased, whitespace collapsed."""
+    return " ".join(text.lower().split())
+
+
+class _ResultCache:
+    """Thread-safe LRU cache with a per-entry TTL for search results.
+
+    ``generation`` returns the identity of the database build; it is polled at most every
+    ``check_interval_s`` seconds and the cache is emptied when it changes.
+    """
+
+    def __init__(self, capacity: int, ttl_s: float, generation=None, check_interval_s: float = 1.0):
+        self.capacity = max(0, capacity)
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._store: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation_fn = generation
+        self._generation = generation() if generation is not None else None
+        self._check_interval_s = check_interval_s
+        self._checked_at = time.monotonic()
+
+    def _check_generation(self, now: float):
+        if self._generation_fn is None or now - self._checked_at < self._check_interval_s:
+            return
+        self._checked_at = now
+        current = self._generation_fn()
+        if current != self._generation:
+            self._generation = current
+            self._store.clear()
+
+    def get(self, key):
+        if self.capacity == 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation(now)
+            entry = self._store.get(key)
+            if entry is not None and 0 < self.ttl_s and entry[0] <= now:
+                del self._store[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._store.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.capacity == 0:
+            return
+        with self._lock:
+            self._store[key] = (time.monotonic() + self.ttl_s, value)
+            self._store.move_to_end(key)
+            while len(self._store) > self.capacity:
+                self._store.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._store.clear()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+
+
+class _SingleFlight:
+    """Coalesces concurrent identical calls: the first caller for a key runs the
+    computation and callers arriving while it runs wait for it and share its result (or
+    exception). Nothing is kept after it completes; that is what the caches are for.
+    do() serves threads, ado() coroutines of one event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+        self._tasks: dict = {}
+
+    def do(self, key, fn, *args):
+        """Returns (result, shared); shared is True when another call computed it."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key, fn, *args):
+        """Async do(): fn(*args) is a coroutine, run as a task that finishes even if the
+        caller that started it is cancelled."""
+        task = self._tasks.get(key)
+        shared = task is not None
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(fn(*args))
+
+            def forget(done):
+                if self._tasks.get(key) is done:
+                    del self._tasks[key]
+
+            task.add_done_callback(forget)
+        return await asyncio.shield(task), shared
+
+
+class _CircuitBreaker:
+    """Circuit breaker for the embeddings endpoint.
+
+    Closed: requests go through. ``failure_threshold`` consecutive failures open it: callers
+    skip the endpoint (FTS-only) without waiting on timeouts. While open, a background
+    thread probes every ``reset_s`` seconds (half-open) and closes the breaker on the first
+    successful probe. A threshold of 0 never opens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_s: float, probe, on_change=None):
+        self.failure_threshold = failure_threshold
+        self.reset_s = reset_s
+        self.state = "closed"
+        self._probe = probe
+        self._on_change = on_change
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober = None
+
+    def allow(self) -> bool:
+        return self.state == "closed"
+
+    def record_success(self):
+        self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state != "closed" or not 0 < self.failure_threshold <= self._failures:
+                return
+            self._set_state("open")
+            if self._prober is None or not self._prober.is_alive():
+                self._prober = threading.Thread(target=self._probe_loop, name="embed-breaker", daemon=True)
+                self._prober.start()
+
+    def _set_state(self, state: str):
+        self.state = state
+        if self._on_change is not None:
+            self._on_change(state)
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.reset_s):
+            with self._lock:
+                self._set_state("half_open")
+            try:
+                ok = bool(self._probe())
+            except Exception:
+                ok = False
+            with self._lock:
+                if ok:
+                    self._failures = 0
+                    self._set_state("closed")
+                    return
+                self._set_state("open")
+
+    def close(self):
+        self._stop.set()
+
+
+class _CursorPool:
+    """Bounded pool of cursors on one read-only DuckDB connection.
+
+    A DuckDB connection must not run queries from several threads at once; a cursor is an
+    independent connection to the same database instance. Cursors are created lazily up to
+    ``size`` and run ``setup`` once when created. Each query checks one out for the calling
+    thread and returns it afterwards; when all are in use, callers wait for one.
+    """
+
+    def __init__(self, connection, size: int, setup=None):
+        self.size = max(1, size)
+        self._connection = connection
+        self._setup = setup
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._cursors: list = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            cur = self._connection.cursor() if len(self._cursors) < self.size else None
+            if cur is not None:
+                self._cursors.append(cur)
+        if cur is None:
+            return self._idle.get()
+        if self._setup is not None:
+            try:
+                self._setup(cur)
+            except Exception:
+                with self._lock:
+                    self._cursors.remove(cur)
+                cur.close()
+                raise
+        return cur
+
+    def release(self, cur):
+        self._idle.put(cur)
+
+    @contextmanager
+    def cursor(self):
+        cur = self.acquire()
+        try:
+            yield cur
+        finally:
+            self.release(cur)
+
+    def close(self):
+        with self._lock:
+            cursors, self._cursors = self._cursors, []
+        for cur in cursors:
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+
+
+class HybridSearcher:
+    """
+    A class to perform hybrid search (vector + full-text) on one corpus database.
+    ``fts_synonyms`` is a list of (trigger words, added words) pairs: a query containing
+    any trigger word (substring, case-insensitive) also searches the added words in FTS.
+    ``fts_like_fallback`` scores chunks by keyword LIKE matches when DuckDB FTS fails.
+    """
+    def __init__(
+        self,
+        db_path,
+        table_name,
+        fts_synonyms=None,
+        fts_like_fallback=False,
+        max_server_url=MAX_SERVER_URL,
+        model_name=MODEL_NAME,
+        embed_cache_size=EMBED_CACHE_SIZE,
+        execution_mode=EXECUTION_MODE,
+        snippet_chars=SNIPPET_CHARS,
+        snippet_token_budget=SNIPPET_TOKEN_BUDGET,
+        fts_engine=FTS_ENGINE,
+        bm25_index_dir=None,
+        vector_engine=VECTOR_ENGINE,
+        vector_self_check=False,
+        vector_quantization=VECTOR_QUANTIZATION,
+        vector_rescore_factor=VECTOR_RESCORE_FACTOR,
+        hnsw_ef_search=HNSW_EF_SEARCH,
+        worker_threads=WORKER_THREADS,
+        db_pool_size=DB_POOL_SIZE,
+        result_cache_size=RESULT_CACHE_SIZE,
+        result_cache_ttl_s=RESULT_CACHE_TTL_S,
+        persistent_embed_cache_size=PERSISTENT_EMBED_CACHE_SIZE,
+        embed_cache_path=None,
+        background_warmup=BACKGROUND_WARMUP,
+        embed_timeout_s=EMBED_TIMEOUT_S,
+        embed_connect_timeout_s=EMBED_CONNECT_TIMEOUT_S,
+        embed_breaker_threshold=EMBED_BREAKER_THRESHOLD,
+        embed_breaker_reset_s=EMBED_BREAKER_RESET_S,
+        deadline_ms=SEARCH_DEADLINE_MS,
+    ):
+        if execution_mode not in ("fused", "staged"):
+            raise ValueError(f"Unknown execution_mode '{execution_mode}', expected 'fused' or 'staged'")
+        if fts_engine not in ("memory", "duckdb"):
+            raise ValueError(f"Unknown fts_engine '{fts_engine}', expected 'memory' or 'duckdb'")
+        if vector_engine not in ("numpy", "duckdb"):
+            raise ValueError(f"Unknown vector_engine '{vector_engine}', expected 'numpy' or 'duckdb'")
+        if vector_quantization not in ("none", "int8", "binary"):
+            raise ValueError(
+                f"Unknown vector_quantization '{vector_quantization}', expected 'none', 'int8' or 'binary'"
+            )
+        self.db_path = db_path
+        self.table_name = table_name
+        self.fts_synonyms = [
+            (tuple(word.lower() for word in triggers), tuple(extras)) for triggers, extras in (fts_synonyms or [])
+        ]
+        self.fts_like_fallback = fts_like_fallback
+        self.execution_mode = execution_mode
+        self.snippet_chars = snippet_chars
+        self.snippet_token_budget = snippet_token_budget
+        self.hnsw_ef_search = int(hnsw_ef_search or 0)
+        self.background_warmup = background_warmup
+        self.deadline_ms = deadline_ms
+        # Set once vss/fts are loaded, and once queries may be embedded and vector-searched
+        self._extensions_ready = threading.Event()
+        self._vector_ready = threading.Event()
+        # Stage latency histograms and event counters (see stats())
+        self.metrics = SearchMetrics()
+        # Embeddings clients are created on first use (building them costs ~0.3 s of imports)
+        self.max_server_url = max_server_url
+        self._embed_timeout = Timeout(embed_timeout_s, connect=embed_connect_timeout_s)
+        self._embed_breaker = _CircuitBreaker(
+            embed_breaker_threshold, embed_breaker_reset_s, self._probe_embeddings, self._breaker_changed
+        )
+        # Marks the executor's threads (see _start_branches)
+        self._local = threading.local()
+        # Bounded pool for blocking DuckDB/NumPy work (async API, FTS branch of a search)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, worker_threads),
+            thread_name_prefix="search",
+            initializer=lambda: setattr(self._local, "worker", True),
+        )
+        self.model_name = model_name
+        self._embed_cache = _LRUCache(capacity=embed_cache_size)
+        # In-flight searches and embeddings requests shared by identical concurrent calls
+        self._flights = _SingleFlight()
+        # Survives restarts and is shared by all processes serving this database; opened lazily
+        self.disk_embed_cache = None
+        if persistent_embed_cache_size > 0:
+            self.disk_embed_cache = PersistentEmbeddingCache(
+                embed_cache_path or os.path.splitext(db_path)[0] + "_embed_cache.sqlite",
+                max_entries=persistent_embed_cache_size,
+            )
+        # SQL text of the fused statement, keyed by (with_vector, candidate_limit, k)
+        self._fused_sql: dict[tuple[bool, int, int], str] = {}
+        # Held by warm_up() while it uses the connection; close() waits for it and
+        # sets _closed so an unfinished warm-up skips its remaining steps
+        self._warmup_lock = threading.Lock()
+        self._closed = False
+        self.db_connection = self._connect()
+        if not background_warmup:
+            self._load_extensions()
+        # Stored width and query projection recorded by create_indexes.py
+        self.embedding_model, self.embedding_dim, self.embedding_reduction, self._projection = (
+            self._read_embedding_metadata()
+        )
+        if self.embedding_model and self.embedding_model != model_name:
+            try:
+                sys.stderr.write(
+                    f"[WARN] Database embeddings were built with '{self.embedding_model}' but queries "
+                    f"are embedded with '{model_name}'; vector results will be meaningless\n"
+                )
+                sys.stderr.flush()
+            except Exception:
+                pass
+        # Disk cache key space: projected vectors differ per reduction of the same model
+        self._embedding_space = model_name
+        if self.embedding_reduction != "none":
+            self._embedding_space = f"{model_name}|{self.embedding_reduction}{self.embedding_dim}"
+            if self._projection is not None:
+                digest = hashlib.sha256(self._projection.tobytes()).hexdigest()[:12]
+                self._embedding_space += f"|{digest}"
+        # Written by create_indexes.py after every successful build
+        self.generation_path = os.path.splitext(self.db_path)[0] + ".generation"
+        self.build_generation = self._read_build_generation()
+        # Rows by (normalized query, k, weights) and rendered views (see the MCP server)
+        self.result_cache = _ResultCache(result_cache_size, result_cache_ttl_s, generation=self._db_generation)
+        self._pool = _CursorPool(self.db_connection, db_pool_size, setup=self._setup_cursor)
+        self.bm25_index = None
+        if fts_engine == "memory":
+            index_dir = bm25_index_dir or os.path.splitext(self.db_path)[0] + "_bm25"
+            try:
+                self.bm25_index = BM25Index(index_dir)
+            except (FileNotFoundError, ValueError) as e:
+                try:
+                    sys.stderr.write(f"[WARN] In-memory BM25 unavailable, using DuckDB FTS: {e}\n")
+                    sys.stderr.flush()
+                except Exception:
+                    pass
+        self.fts_engine = "memory" if self.bm25_index is not None else "duckdb"
+        # Reported as requested until _build_vector_engine() has run
+        self.vector_index = None
+        self.vector_engine = vector_engine
+        self.vector_quantization = vector_quantization
+        self._vector_options = (vector_engine, vector_quantization, vector_rescore_factor, vector_self_check)
+        if not background_warmup:
+            self._build_vector_engine()
+            self._vector_ready.set()
+
+    def _build_vector_engine(self):
+        """Loads the NumPy vector engine (vector_engine "numpy"); the SQL engine needs no setup."""
+        vector_engine, vector_quantization, vector_rescore_factor, vector_self_check = self._vector_options
+        vector_index = None
+        if vector_engine == "numpy":
+            if vector_quantization != "none":
+                try:
+                    vector_index = QuantizedVectorIndex(
+                        self.db_connection,
+                        self.table_name,
+                        quantization=vector_quantization,
+                        rescore_factor=vector_rescore_factor,
+                        fetch=self._fetchnumpy,
+                    )
+                except duckdb.Error as e:
+                    # Columns missing: the database was built without --quantize
+                    try:
+                        sys.stderr.write(f"[WARN] {vector_quantization} vectors unavailable, using float32: {e}\n")
+                        sys.stderr.flush()
+                    except Exception:
+                        pass
+            if vector_index is None:
+                vector_index = NumpyVectorIndex(self.db_connection, self.table_name)
+            if vector_self_check:
+                report = vector_index.self_check(self.db_connection)
+                try:
+                    sys.stderr.write(f"[INFO] NumPy vector engine self-check: {report}\n")
+                    sys.stderr.flush()
+                except Exception:
+                    pass
+                if not report["ok"]:
+                    # Disagreement with exact array_cosine_distance: keep the SQL path
+                    vector_index = None
+        self.vector_index = vector_index
+        self.vector_engine = "numpy" if vector_index is not None else "duckdb"
+        self.vector_quantization = getattr(vector_index, "quantization", "none")
+
+    def _connect(self):
+        """Connects to the DuckDB database (extensions are loaded by _load_extensions)."""
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"Database file not found at {self.db_path}. Please run the indexing script first.")
+        
+        return duckdb.connect(database=self.db_path, read_only=True)
+
+    def _load_extensions(self):
+        """Loads vss and fts offline-first: LOAD uses an installed extension without touching
+        the network, INSTALL (a download) only runs when LOAD fails. Extensions and the
+        global hnsw_ef_search apply to every cursor of the database.
+        """
+        for name in ("vss", "fts"):
+            try:
+                self.db_connection.execute(f"LOAD {name};")
+            except duckdb.Error:
+                self.db_connection.execute(f"INSTALL {name};")
+                self.db_connection.execute(f"LOAD {name};")
+        if self.hnsw_ef_search > 0:
+            self.db_connection.execute(f"SET GLOBAL hnsw_ef_search = {self.hnsw_ef_search};")
+        self._extensions_ready.set()
+
+    # No client-side retries: the circuit breaker handles a failing endpoint
+    @functools.cached_property
+    def openai_client(self) -> OpenAI:
+        return OpenAI(base_url=self.max_server_url, api_key="EMPTY", timeout=self._embed_timeout, max_retries=0)
+
+    @functools.cached_property
+    def async_openai_client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            base_url=self.max_server_url, api_key="EMPTY", timeout=self._embed_timeout, max_retries=0
+        )
+
+    def _probe_embeddings(self) -> bool:
+        """Half-open probe of the circuit breaker: one tiny embeddings request."""
+        self.openai_client.embeddings.create(model=self.model_name, input=["ping"])
+        return True
+
+    def _breaker_changed(self, state: str):
+        self.metrics.incr(f"embed_breaker_{state}")
+        if state == "half_open":
+            return
+        try:
+            if state == "open":
+                sys.stderr.write("[WARN] Embeddings endpoint failing; searching FTS-only until it recovers\n")
+            else:
+                sys.stderr.write("[INFO] Embeddings endpoint recovered; vector search resumed\n")
+            sys.stderr.flush()
+        except Exception:
+            pass
+
+    @property
+    def vector_ready(self) -> bool:
+        """False while a background warm-up is pending: searches run FTS-only."""
+        return self._vector_ready.is_set()
+
+    def warm_up(self):
+        """Completes a background_warmup start (blocking; run it off the event loop): loads
+        the extensions and the vector engine. Vector search stays off until
+        enable_vector_search(), so the caller can also wait for the embeddings endpoint.
+        Returns early if close() has been called; close() waits for the step in progress.
+        """
+        start = time.perf_counter()
+        with self._warmup_lock:
+            if self._closed:
+                return
+            # The first statement with parameters imports DuckDB's optional Python modules
+            # (pandas/pyarrow when installed, ~0.5 s), and the embeddings clients take their
+            # own imports: pay both here rather than in the first searches
+            self.db_connection.execute("SELECT ?;", [0]).fetchall()
+            _ = (self.openai_client, self.async_openai_client)
+            if self._closed:
+                return
+            try:
+                self._load_extensions()
+            except Exception as e:
+                # The memory FTS and numpy vector engines work without the extensions
+                try:
+                    sys.stderr.write(f"[WARN] Loading DuckDB extensions failed: {e}\n")
+                    sys.stderr.flush()
+                except Exception:
+                    pass
+            if self._closed:
+                return
+            self._build_vector_engine()
+        self.metrics.observe("warmup", (time.perf_counter() - start) * 1000.0)
+
+    def enable_vector_search(self):
+        """Switches query embedding and vector search on (after warm_up())."""
+        self._vector_ready.set()
+
+    def _read_embedding_metadata(self):
+        """Returns (model name, dim, reduction, projection) from the ``embedding_metadata``
+        table. ``projection`` is the (dim, source_dim) PCA matrix, or None.
+        Databases built without the table report the embedding column's width.
+        """
+        try:
+            row = self.db_connection.execute(
+                "SELECT model_name, dim, reduction, projection FROM embedding_metadata LIMIT 1;"
+            ).fetchone()
+        except duckdb.Error:
+            row = None
+        if row is None:
+            try:
+                width = self.db_connection.execute(
+                    f"SELECT len(embedding) FROM {self.table_name} LIMIT 1;"
+                ).fetchone()
+            except duckdb.Error:
+                width = None
+            return None, int(width[0]) if width else EMBEDDING_DIM, "none", None
+        model_name, dim, reduction, projection = row
+        if projection is not None:
+            projection = np.asarray(projection, dtype=np.float32)
+        return model_name, int(dim), reduction, projection
+
+    def _project(self, embedding):
+        """Maps a model embedding into the database's vector space (PCA / Matryoshka)."""
+        if len(embedding) == self.embedding_dim:
+            return embedding
+        if self.embedding_reduction == "matryoshka" and len(embedding) > self.embedding_dim:
+            return list(embedding[: self.embedding_dim])
+        if self._projection is not None and len(embedding) == self._projection.shape[1]:
+            return (self._projection @ np.asarray(embedding, dtype=np.float32)).tolist()
+        raise ValueError(
+            f"Query embedding has {len(embedding)} dimensions, database expects {self.embedding_dim}"
+        )
+
+    def _read_build_generation(self):
+        try:
+            with open(self.generation_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("generation")
+        except (OSError, ValueError):
+            return None
+
+    def _db_generation(self):
+        """Identity of the database build: stat of the database file and of its generation
+        stamp. Changes when the file is rewritten or replaced, or on a new build stamp.
+        """
+        identity = []
+        for path in (self.db_path, self.generation_path):
+            try:
+                st = os.stat(path)
+                identity.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except OSError:
+                identity.append(None)
+        return tuple(identity)
+
+    def _setup_cursor(self, cur):
+        """Per-cursor setup, run once when the pool creates a cursor. Cursors created
+        before the extensions are loaded skip it (see _load_extensions).
+        """
+        if not self._extensions_ready.is_set():
+            return
+        cur.execute("LOAD vss;")
+        cur.execute("LOAD fts;")
+        if self.hnsw_ef_search > 0:
+            cur.execute(f"SET hnsw_ef_search = {self.hnsw_ef_search};")
+
+    def _fetchall(self, sql: str, params=None):
+        """Runs a query on a pooled cursor and returns all rows."""
+        with self._pool.cursor() as cur:
+            return cur.execute(sql, params).fetchall()
+
+    def _fetchnumpy(self, sql: str, params=None):
+        """Runs a query on a pooled cursor and returns its columns as NumPy arrays."""
+        with self._pool.cursor() as cur:
+            return cur.execute(sql, params).fetchnumpy()
+
+    def _run(self, fn, *args, **kwargs):
+        """Runs a blocking call on the worker pool; returns an awaitable."""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    @staticmethod
+    def _timed(timings: dict, name: str, fn, *args, **kwargs):
+        """Calls fn and records its wall time in milliseconds as timings[f"{name}_ms"]."""
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings[f"{name}_ms"] = (time.perf_counter() - start) * 1000.0
+
+    def _start_branches(self, query_text: str, limit: int, query_vector, fts_results, timings: dict):
+        """Starts the FTS branch on the worker pool, then embeds the query on the calling
+        thread while it runs. Values passed in are kept; on a pool thread FTS runs inline
+        (waiting on the pool from inside it could deadlock a saturated pool).
+        Returns (query_vector, fts_results), where fts_results may be a pending Future.
+        """
+        if fts_results is None:
+            if getattr(self._local, "worker", False):
+                fts_results = self._timed(timings, "fts", self.full_text_search, query_text, limit)
+            else:
+                fts_results = self._executor.submit(
+                    self._timed, timings, "fts", self.full_text_search, query_text, limit
+                )
+        if query_vector is _UNSET:
+            query_vector = self._timed(timings, "embed", self.get_query_embedding, query_text)
+        return query_vector, fts_results
+
+    @staticmethod
+    def _await_fts(fts_results, timings: dict):
+        """Resolves a pending FTS branch; fts_wait_ms is how long fusion was blocked on it."""
+        if not isinstance(fts_results, Future):
+            return fts_results
+        start = time.perf_counter()
+        rows = fts_results.result()
+        timings["fts_wait_ms"] = (time.perf_counter() - start) * 1000.0
+        return rows
+
+    def _expand_fts_query(self, query_text: str) -> str:
+        """Lightweight synonym expansion for FTS to improve lexical recall, driven by the
+        corpus's fts_synonyms. Only affects FTS (VSS uses the raw query).
+        """
+        q = query_text.lower()
+        extras: list[str] = []
+        for triggers, added in self.fts_synonyms:
+            if any(word in q for word in triggers):
+                extras.extend(added)
+        # Return original plus expansions as a single space-joined string
+        if extras:
+            return f"{query_text} " + " ".join(sorted(set(extras)))
+        return query_text
+
+    def _lookup_embedding(self, text: str):
+        """In-memory LRU first, then the on-disk cache (promoting hits into memory)."""
+        emb = self._embed_cache.get(text)
+        if emb is not None:
+            self.metrics.incr("embed_cache_memory_hits")
+            return emb
+        if self.disk_embed_cache is not None:
+            try:
+                emb = self.disk_embed_cache.get(self._embedding_space, text)
+            except Exception as e:
+                self._disable_disk_embed_cache(e)
+            if emb is not None:
+                self.metrics.incr("embed_cache_disk_hits")
+                self._embed_cache.set(text, emb)
+                return emb
+        self.metrics.incr("embed_cache_misses")
+        return None
+
+    async def _alookup_embedding(self, text: str):
+        """Async _lookup_embedding(): the on-disk cache read runs on the worker pool."""
+        if self.disk_embed_cache is None or text in self._embed_cache:
+            return self._lookup_embedding(text)
+        return await self._run(self._lookup_embedding, text)
+
+    def _remember_embedding(self, text: str, emb):
+        self._embed_cache.set(text, emb)
+        if self.disk_embed_cache is not None:
+            try:
+                self.disk_embed_cache.put(self._embedding_space, text, emb)
+            except Exception as e:
+                self._disable_disk_embed_cache(e)
+
+    def _disable_disk_embed_cache(self, error: Exception):
+        try:
+            sys.stderr.write(f"[WARN] Persistent embedding cache disabled: {error}\n")
+            sys.stderr.flush()
+        except Exception:
+            pass
+        cache, self.disk_embed_cache = self.disk_embed_cache, None
+        if cache is not None:
+            cache.close(timeout_s=0)
+
+    def get_query_embedding(self, query_text: str):
+        """Generates an embedding for the user's query (None: search FTS-only)."""
+        if not self._vector_ready.is_set():
+            self.metrics.incr("embed_skipped_warmup")
+            return None
+        cached = self._lookup_embedding(query_text)
+        if cached is not None:
+            return cached
+        if not self._embed_breaker.allow():
+            self.metrics.incr("embed_skipped_breaker")
+            return None
+        # Concurrent requests for the same text share one embeddings call
+        emb, shared = self._flights.do(("embed", query_text), self._embed_query, query_text)
+        if shared:
+            self.metrics.incr("embed_coalesced")
+        return emb
+
+    def _embed_query(self, query_text: str):
+        """One embeddings request for get_query_embedding (None if it fails)."""
+        self.metrics.incr("embed_requests")
+        try:
+            response = self.openai_client.embeddings.create(
+                model=self.model_name,
+                input=[query_text],
+            )
+            emb = self._project(response.data[0].embedding)
+            self._embed_breaker.record_success()
+            self._remember_embedding(query_text, emb)
+            return emb
+        except Exception as e:
+            self._embed_breaker.record_failure()
+            # Graceful fallback: if embeddings aren't available (e.g., MAX not running),
+            # return None and let callers skip vector search.
+            self.metrics.incr("embed_failures")
+            try:
+                sys.stderr.write(f"[WARN] Embedding generation failed, falling back to FTS only: {e}\n")
+                sys.stderr.flush()
+            except Exception:
+                pass
+            return None
+
+    def get_query_embeddings(self, query_texts: list[str]):
+        """Embeds several queries with a single embeddings request (cache misses only).
+        Returns one embedding per query, or None for all misses if the request fails.
+        """
+        if not self._vector_ready.is_set():
+            self.metrics.incr("embed_skipped_warmup")
+            return [None] * len(query_texts)
+        embeddings = [self._lookup_embedding(text) for text in query_texts]
+        missing = list(dict.fromkeys(text for text, emb in zip(query_texts, embeddings) if emb is None))
+        if not missing:
+            return embeddings
+        if not self._embed_breaker.allow():
+            self.metrics.incr("embed_skipped_breaker")
+            return embeddings
+        self.metrics.incr("embed_requests")
+        try:
+            response = self.openai_client.embeddings.create(
+                model=self.model_name,
+                input=missing,
+            )
+            fresh = {text: self._project(item.embedding) for text, item in zip(missing, response.data)}
+            self._embed_breaker.record_success()
+        except Exception as e:
+            self._embed_breaker.record_failure()
+            self.metrics.incr("embed_failures")
+            try:
+                sys.stderr.write(f"[WARN] Batch embedding generation failed, falling back to FTS only: {e}\n")
+                sys.stderr.flush()
+            except Exception:
+                pass
+            fresh = {}
+        for text, emb in fresh.items():
+            self._remember_embedding(text, emb)
+        return [emb if emb is not None else fresh.get(text) for text, emb in zip(query_texts, embeddings)]
+
+    async def aget_query_embedding(self, query_text: str):
+        """Async variant of get_query_embedding; does not block the event loop."""
+        if not self._vector_ready.is_set():
+            self.metrics.incr("embed_skipped_warmup")
+            return None
+        cached = await self._alookup_embedding(query_text)
+        if cached is not None:
+            return cached
+        if not self._embed_breaker.allow():
+            self.metrics.incr("embed_skipped_breaker")
+            return None
+        emb, shared = await self._flights.ado(("embed", query_text), self._aembed_query, query_text)
+        if shared:
+            self.metrics.incr("embed_coalesced")
+        return emb
+
+    async def _aembed_query(self, query_text: str):
+        """Async _embed_query()."""
+        self.metrics.incr("embed_requests")
+        try:
+            response = await self.async_openai_client.embeddings.create(
+                model=self.model_name,
+                input=[query_text],
+            )
+            emb = self._project(response.data[0].embedding)
+            self._embed_breaker.record_success()
+            self._remember_embedding(query_text, emb)
+            return emb
+        except Exception as e:
+            self._embed_breaker.record_failure()
+            self.metrics.incr("embed_failures")
+            try:
+                sys.stderr.write(f"[WARN] Embedding generation failed, falling back to FTS only: {e}\n")
+                sys.stderr.flush()
+            except Exception:
+                pass
+            return None
+
+    async def aget_query_embeddings(self, query_texts: list[str]):
+        """Async variant of get_query_embeddings (one request for all cache misses)."""
+        if not self._vector_ready.is_set():
+            self.metrics.incr("embed_skipped_warmup")
+            return [None] * len(query_texts)
+        embeddings = [await self._alookup_embedding(text) for text in query_texts]
+        missing = list(dict.fromkeys(text for text, emb in zip(query_texts, embeddings) if emb is None))
+        if not missing:
+            return embeddings
+        if not self._embed_breaker.allow():
+            self.metrics.incr("embed_skipped_breaker")
+            return embeddings
+        self.metrics.incr("embed_requests")
+        try:
+            response = await self.async_openai_client.embeddings.create(
+                model=self.model_name,
+                input=missing,
+            )
+            fresh = {text: self._project(item.embedding) for text, item in zip(missing, response.data)}
+            self._embed_breaker.record_success()
+        except Exception as e:
+            self._embed_breaker.record_failure()
+            self.metrics.incr("embed_failures")
+            try:
+                sys.stderr.write(f"[WARN] Batch embedding generation failed, falling back to FTS only: {e}\n")
+                sys.stderr.flush()
+            except Exception:
+                pass
+            fresh = {}
+        for text, emb in fresh.items():
+            self._remember_embedding(text, emb)
+        return [emb if emb is not None else fresh.get(text) for text, emb in zip(query_texts, embeddings)]
+
+    def vector_search_many(self, query_vectors: list, limit: int):
+        """Vector search for several query vectors. The NumPy engine scores them all with one
+        matrix product; the SQL engine runs one query per vector. None vectors yield [].
+        """
+        present = [i for i, vec in enumerate(query_vectors) if vec is not None]
+        results: list[list] = [[] for _ in query_vectors]
+        if self.vector_index is not None and present:
+            batch = self.vector_index.search_many([query_vectors[i] for i in present], limit)
+            for i, rows in zip(present, batch):
+                results[i] = rows
+        else:
+            for i in present:
+                results[i] = self.vector_search(query_vectors[i], limit)
+        return results
+
+    def vector_search(self, query_vector, limit: int):
+        """Performs vector similarity search using HNSW-backed operator when available.
+        With vector_engine "numpy" the exact top-k is computed in-process instead.
+        """
+        if self.vector_index is not None:
+            return self.vector_index.search(query_vector, limit)
+        query = f"""
+        SELECT chunk_id, array_cosine_distance(embedding, CAST(? AS FLOAT[{self.embedding_dim}])) AS score
+        FROM {self.table_name}
+        ORDER BY score ASC
+        LIMIT {limit};
+        """
+        try:
+            if DEBUG_EXPLAIN_VSS:
+                explain_query = f"EXPLAIN {query}"
+                explain_result = self._fetchall(explain_query, [query_vector])
+                print("VSS EXPLAIN:")
+                for row in explain_result:
+                    print(row)
+            return self._fetchall(query, [query_vector])
+        except Exception:
+            # Fallback to array_distance if operator not available
+            fallback = f"""
+            SELECT chunk_id, array_distance(embedding, CAST(? AS FLOAT[{self.embedding_dim}])) AS score
+            FROM {self.table_name}
+            ORDER BY score ASC
+            LIMIT {limit};
+            """
+            return self._fetchall(fallback, [query_vector])
+
+    def full_text_search(self, query_text: str, limit: int):
+        """Performs full-text search with robust fallbacks and title boost.
+        Uses the in-memory BM25 index when loaded (fts_engine "memory"), else DuckDB FTS.
+        """
+        expanded = self._expand_fts_query(query_text)
+
+        if self.bm25_index is not None:
+            rows = self.bm25_index.search(
+                expanded, limit, title_weight=FTS_TITLE_WEIGHT, content_weight=FTS_CONTENT_WEIGHT
+            )
+            self.metrics.incr("fts_path_memory")
+            if DEBUG_LOG_FTS_PATH:
+                print("FTS: Using in-memory BM25 index")
+            return rows
+
+        # Attempt weighted field search
+        query_weighted = f"""
+        SELECT t.chunk_id,
+               ({FTS_TITLE_WEIGHT} * COALESCE(
+                    fts_main_{self.table_name}.match_bm25(
+                        input_id := t.chunk_id,
+                        query_string := CAST(? AS TEXT),
+                        fields := 'title'
+                    ), 0
+               ) + {FTS_CONTENT_WEIGHT} * COALESCE(
+                    fts_main_{self.table_name}.match_bm25(
+                        input_id := t.chunk_id,
+                        query_string := CAST(? AS TEXT),
+                        fields := 'content'
+                    ), 0
+               )) AS score
+        FROM {self.table_name} AS t
+        ORDER BY score DESC
+        LIMIT {limit};
+        """
+        try:
+            rows = self._fetchall(query_weighted, [expanded, expanded])
+            self.metrics.incr("fts_path_match_bm25_fields")
+            if DEBUG_LOG_FTS_PATH:
+                print("FTS: Using weighted field search")
+            return rows
+        except Exception:
+            # Fallback to default fields
+            query_default = f"""
+            SELECT t.chunk_id,
+                   fts_main_{self.table_name}.match_bm25(
+                       input_id := t.chunk_id,
+                       query_string := CAST(? AS TEXT)
+                   ) AS score
+            FROM {self.table_name} AS t
+            ORDER BY score DESC
+            LIMIT {limit};
+            """
+            try:
+                rows = self._fetchall(query_default, [expanded])
+                self.metrics.incr("fts_path_match_bm25_default")
+                if DEBUG_LOG_FTS_PATH:
+                    print("FTS: Using default field search")
+                return rows
+            except Exception:
+                if not self.fts_like_fallback:
+                    self.metrics.incr("fts_path_none")
+                    return []
+                # Final fallback: version-agnostic keyword scoring using LIKE presence
+                # Title matches are weighted higher than content matches
+                tokens = [tok for tok in expanded.lower().split() if len(tok) >= 2]
+                tokens = list(dict.fromkeys(tokens))  # de-duplicate preserving order
+                if not tokens:
+                    return []
+
+                title_clauses = ["(CASE WHEN lower(t.title) LIKE '%' || ? || '%' THEN 1 ELSE 0 END)" for _ in tokens]
+                content_clauses = ["(CASE WHEN lower(t.content) LIKE '%' || ? || '%' THEN 1 ELSE 0 END)" for _ in tokens]
+                query_kw = f"""
+                SELECT t.chunk_id,
+                       ({FTS_TITLE_WEIGHT} * ({" + ".join(title_clauses)}) + {FTS_CONTENT_WEIGHT} * ({" + ".join(content_clauses)})) AS score
+                FROM {self.table_name} AS t
+                ORDER BY score DESC
+                LIMIT {limit};
+                """
+                rows = self._fetchall(query_kw, tokens + tokens)  # title LIKEs, then content LIKEs
+                self.metrics.incr("fts_path_like")
+                if DEBUG_LOG_FTS_PATH:
+                    print("FTS: Using LIKE-based fallback")
+                return rows
+
+    def full_text_search_many(self, query_texts: list[str], limit: int):
+        """Full-text search for several queries. The in-memory BM25 engine scores the batch
+        together, computing each distinct term's postings once; DuckDB FTS runs per query.
+        """
+        if self.bm25_index is not None:
+            expanded = [self._expand_fts_query(q) for q in query_texts]
+            self.metrics.incr("fts_path_memory", len(query_texts))
+            return self.bm25_index.search_many(
+                expanded, limit, title_weight=FTS_TITLE_WEIGHT, content_weight=FTS_CONTENT_WEIGHT
+            )
+        return [self.full_text_search(q, limit) for q in query_texts]
+
+    def hybrid_search(
+        self,
+        query_text: str,
+        k: int = TOP_K,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+        query_vector=_UNSET,
+        fts_results=None,
+        timings: dict | None = None,
+    ):
+        """Performs hybrid search using Reciprocal Rank Fusion (RRF).
+        FTS does not depend on the embedding, so it runs while the query is embedded and
+        fusion waits only for the slower of (embed + VSS) and FTS.
+        """
+        timings = {} if timings is None else timings
+        query_vector, fts_results = self._start_branches(query_text, k * 2, query_vector, fts_results, timings)
+
+        # Get results from both search methods
+        if query_vector is None:
+            vector_results = []
+        else:
+            vector_results = self._timed(timings, "vss", self.vector_search, query_vector, limit=k * 2)
+        fts_results = self._await_fts(fts_results, timings)
+
+        return self._timed(timings, "fusion", self._fuse_rrf, vector_results, fts_results, k, fts_weight, vss_weight)
+
+    def _fuse_rrf(self, vector_results, fts_results, k: int, fts_weight: float, vss_weight: float):
+        """Reciprocal Rank Fusion of ranked (chunk_id, score) lists; returns top-k chunk_ids."""
+        rrf_scores = {}
+        rrf_k = RRF_K
+
+        # Process vector search results
+        for i, (chunk_id, _) in enumerate(vector_results):
+            rank = i + 1
+            rrf_scores[chunk_id] = rrf_scores.get(chunk_id, 0) + vss_weight / (rrf_k + rank)
+
+        # Process full-text search results
+        for i, (chunk_id, _) in enumerate(fts_results):
+            rank = i + 1
+            rrf_scores[chunk_id] = rrf_scores.get(chunk_id, 0) + fts_weight / (rrf_k + rank)
+
+        # Sort results by RRF score and return top-k chunk_ids
+        sorted_results = sorted(rrf_scores.items(), key=lambda item: item[1], reverse=True)
+        return [chunk_id for chunk_id, _ in sorted_results[:k]]
+
+    def hybrid_search_many(
+        self,
+        query_texts: list[str],
+        k: int = TOP_K,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+        query_vectors=None,
+    ):
+        """Hybrid search for a batch of related queries: one embeddings request, one matrix
+        product for the vector side (NumPy engine), a batched FTS pass and per-query RRF.
+        Returns one top-k chunk_id list per query, in input order.
+        """
+        if not query_texts:
+            return []
+        if query_vectors is None:
+            query_vectors = self.get_query_embeddings(query_texts)
+        vector_results = self.vector_search_many(query_vectors, limit=k * 2)
+        fts_results = self.full_text_search_many(query_texts, limit=k * 2)
+        return [
+            self._fuse_rrf(vss, fts, k, fts_weight, vss_weight)
+            for vss, fts in zip(vector_results, fts_results)
+        ]
+
+    def search_many(
+        self,
+        query_texts: list[str],
+        k: int = TOP_K,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+        query_vectors=None,
+    ):
+        """Returns one list of result rows (chunk_id, title, snippet, url, section_hierarchy)
+        per query; the payload for all queries is fetched with a single query. Queries found
+        in the result cache are not searched again (unless query_vectors are passed in).
+        """
+        if query_vectors is not None:
+            return self._search_many(query_texts, k, fts_weight, vss_weight, query_vectors)
+        start = time.perf_counter()
+        keys, results, missing = self._cached_many(query_texts, k, fts_weight, vss_weight)
+        if missing:
+            fresh = self._search_many([query_texts[i] for i in missing], k, fts_weight, vss_weight, None)
+            self._store_many(keys, results, missing, fresh)
+        self._record_many(len(query_texts), start)
+        return results
+
+    def _cached_many(self, query_texts: list[str], k: int, fts_weight: float, vss_weight: float):
+        """Returns (cache keys, results with None for misses, positions of the misses)."""
+        keys = [(normalize_query(q), k, fts_weight, vss_weight) for q in query_texts]
+        results = [self.result_cache.get(key) for key in keys]
+        missing = [i for i, rows in enumerate(results) if rows is None]
+        return keys, results, missing
+
+    def _record_many(self, n_queries: int, start: float):
+        self.metrics.incr("batches")
+        self.metrics.incr("batch_queries", n_queries)
+        self.metrics.observe("batch_total", (time.perf_counter() - start) * 1000.0)
+
+    def _store_many(self, keys, results, missing, fresh):
+        for i, rows in zip(missing, fresh):
+            results[i] = rows
+            self.result_cache.set(keys[i], rows)
+
+    def _search_many(self, query_texts, k, fts_weight, vss_weight, query_vectors):
+        """Uncached body of search_many()."""
+        ranked = self.hybrid_search_many(
+            query_texts, k=k, fts_weight=fts_weight, vss_weight=vss_weight, query_vectors=query_vectors
+        )
+        return self._snippets_many(ranked, query_texts)
+
+    def get_results_by_ids(self, chunk_ids: list):
+        """Fetches the full document chunk details for a list of chunk_ids, preserving order."""
+        if not chunk_ids:
+            return []
+        
+        placeholders = ', '.join(['?'] * len(chunk_ids))
+        query = f"SELECT chunk_id, title, content, url, section_hierarchy FROM {self.table_name} WHERE chunk_id IN ({placeholders})"
+        
+        # Fetch results and map them by chunk_id
+        rows = self._fetchall(query, chunk_ids)
+        results_map = {row[0]: row for row in rows}
+        
+        # Return results in the original, ranked order
+        return [results_map[chunk_id] for chunk_id in chunk_ids if chunk_id in results_map]
+
+    def _snippet_terms(self, query_text: str) -> list[str]:
+        """Lowercased query words (FTS expansions included) used to locate the snippet."""
+        words = re.findall(r"[a-z0-9_]+", self._expand_fts_query(query_text).lower())
+        return list(dict.fromkeys(w for w in words if len(w) >= 2 and w not in _SNIPPET_STOPWORDS))[:12]
+
+    def _snippet_width(self, hits: int) -> int:
+        """Snippet characters per hit: snippet_chars, shrunk to fit the token budget."""
+        if self.snippet_token_budget <= 0 or hits <= 0:
+            return self.snippet_chars
+        share = self.snippet_token_budget * SNIPPET_CHARS_PER_TOKEN // hits
+        return max(min(SNIPPET_MIN_CHARS, self.snippet_chars), min(self.snippet_chars, share))
+
+    @staticmethod
+    def _snippet_sql(content: str, terms: str, width: str) -> str:
+        """SQL expression for the query-aware snippet of ``content``: the ``width``-character
+        window holding the first occurrences of the most query ``terms``, among windows
+        starting at the beginning or shortly before one of them. Whitespace is collapsed
+        and cut ends are marked with "…", so only the snippet leaves DuckDB.
+        """
+        positions = f"list_filter(list_transform({terms}, t -> instr(lower({content}), t)), p -> p > 0)"
+        starts = f"list_prepend(1, list_transform(ps, p -> greatest(1, p - {width} // 5)))"
+        covered = f"len(list_filter(ps, p -> p >= s AND p < s + {width}))"
+        start = (
+            f"list_transform([{positions}], ps -> "
+            f"list_sort(list_transform({starts}, s -> {{'rank': -{covered}, 'start': s}}))[1].start)[1]"
+        )
+        # Windows cut inside the chunk start after the next space, not mid-word
+        word_start = f"list_transform([{start}], s1 -> CASE WHEN s1 > 1 THEN s1 + instr(substr({content}, s1, 20), ' ') ELSE 1 END)"
+        return (
+            f"list_transform({word_start}, s0 -> "
+            f"CASE WHEN s0 > 1 THEN '…' ELSE '' END "
+            f"|| trim(regexp_replace(substr({content}, s0, {width}), '\\s+', ' ', 'g')) "
+            f"|| CASE WHEN s0 + {width} <= length({content}) THEN '…' ELSE '' END)[1]"
+        )
+
+    def get_snippets_by_ids(self, chunk_ids: list, query_text: str):
+        """Like get_results_by_ids, but the content column holds the query-aware snippet
+        (see _snippet_sql) instead of the full chunk text.
+        """
+        if not chunk_ids:
+            return []
+        # Rows are filtered before the snippet expression runs, and terms and width are
+        # constants of the statement rather than per-row columns
+        snippet = self._snippet_sql("content", "CAST($terms AS VARCHAR[])", "CAST($width AS INTEGER)")
+        query = f"""
+        SELECT chunk_id, title, {snippet} AS content, url, section_hierarchy
+        FROM {self.table_name}
+        WHERE chunk_id IN (SELECT unnest(CAST($ids AS VARCHAR[])));
+        """
+        params = {
+            "ids": list(chunk_ids),
+            "terms": self._snippet_terms(query_text),
+            "width": self._snippet_width(len(chunk_ids)),
+        }
+        results_map = {row[0]: row for row in self._fetchall(query, params)}
+        return [results_map[chunk_id] for chunk_id in chunk_ids if chunk_id in results_map]
+
+    def _snippets_many(self, ranked: list[list], query_texts: list[str]):
+        """Snippet rows for several ranked id lists (one per query) in one statement."""
+        ids, terms, widths = [], [], []
+        for chunk_ids, query_text in zip(ranked, query_texts):
+            query_terms = self._snippet_terms(query_text)
+            width = self._snippet_width(len(chunk_ids))
+            for chunk_id in chunk_ids:
+                ids.append(chunk_id)
+                terms.append(query_terms)
+                widths.append(width)
+        if not ids:
+            return [[] for _ in ranked]
+        sql = f"""
+        WITH wanted AS (
+            SELECT unnest(CAST($ids AS VARCHAR[])) AS chunk_id,
+                   unnest(CAST($terms AS VARCHAR[][])) AS terms,
+                   unnest(CAST($widths AS INTEGER[])) AS width,
+                   generate_subscripts(CAST($ids AS VARCHAR[]), 1) AS slot
+        )
+        SELECT w.slot, d.chunk_id, d.title, {self._snippet_sql("d.content", "w.terms", "w.width")} AS content,
+               d.url, d.section_hierarchy
+        FROM wanted AS w
+        JOIN {self.table_name} AS d ON d.chunk_id = w.chunk_id;
+        """
+        by_slot = {row[0]: row[1:] for row in self._fetchall(sql, {"ids": ids, "terms": terms, "widths": widths})}
+        results, slot = [], 1
+        for chunk_ids in ranked:
+            rows = []
+            for _ in chunk_ids:
+                if slot in by_slot:
+                    rows.append(by_slot[slot])
+                slot += 1
+            results.append(rows)
+        return results
+
+    def _build_fused_sql(self, with_vector: bool, limit: int, k: int) -> str:
+        """Builds the single-statement hybrid query: VSS and FTS candidates, weighted RRF
+        and the payload fetch (with the query-aware snippet as content) in one round-trip.
+        Candidate ranking mirrors vector_search/full_text_search; ties in the fused score
+        are broken by first appearance (VSS ranks first, then FTS), as in hybrid_search.
+        FTS candidates are ranked by full_text_search (concurrently with the embedding) and
+        passed in as the $fts_ids list; VSS always runs in SQL (the HNSW index if present).
+        """
+        branches = []
+        if with_vector:
+            branches.append(f"""
+            SELECT chunk_id, $vss_weight / ({RRF_K} + rnk) AS rrf, rnk AS pos
+            FROM (
+                SELECT chunk_id, row_number() OVER (ORDER BY score ASC) AS rnk
+                FROM (
+                    SELECT chunk_id, array_cosine_distance(embedding, CAST($query_vector AS FLOAT[{self.embedding_dim}])) AS score
+                    FROM {self.table_name}
+                    ORDER BY score ASC
+                    LIMIT {limit}
+                )
+            )""")
+        branches.append(f"""
+            SELECT chunk_id, $fts_weight / ({RRF_K} + rnk) AS rrf, {limit} + rnk AS pos
+            FROM (
+                SELECT unnest(ids) AS chunk_id, generate_subscripts(ids, 1) AS rnk
+                FROM (SELECT CAST($fts_ids AS VARCHAR[]) AS ids)
+            )""")
+        candidates = "\n            UNION ALL".join(branches)
+        return f"""
+        WITH candidates AS ({candidates}
+        ),
+        fused AS (
+            SELECT chunk_id, SUM(rrf) AS rrf, MIN(pos) AS pos
+            FROM candidates
+            GROUP BY chunk_id
+            ORDER BY rrf DESC, pos ASC
+            LIMIT {k}
+        )
+        SELECT d.chunk_id, d.title,
+               {self._snippet_sql("d.content", "CAST($snippet_terms AS VARCHAR[])", "CAST($snippet_chars AS INTEGER)")} AS content,
+               d.url, d.section_hierarchy
+        FROM fused AS f
+        JOIN {self.table_name} AS d ON d.chunk_id = f.chunk_id
+        ORDER BY f.rrf DESC, f.pos ASC;
+        """
+
+    def fused_search(
+        self,
+        query_text: str,
+        k: int = TOP_K,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+        query_vector=_UNSET,
+        fts_results=None,
+        timings: dict | None = None,
+    ):
+        """Runs the SQL vector search, fusion and payload fetch of a hybrid search as one DuckDB
+        statement and returns the ranked rows (chunk_id, title, content, url, section_hierarchy). Content is
+        the query-aware snippet (see _snippet_sql).
+        """
+        timings = {} if timings is None else timings
+        limit = k * 2
+        query_vector, fts_results = self._start_branches(query_text, limit, query_vector, fts_results, timings)
+        with_vector = query_vector is not None
+        key = (with_vector, limit, k)
+        sql = self._fused_sql.get(key)
+        if sql is None:
+            sql = self._build_fused_sql(with_vector, limit, k)
+            self._fused_sql[key] = sql
+        params = {
+            "fts_weight": fts_weight,
+            "snippet_terms": self._snippet_terms(query_text),
+            "snippet_chars": self._snippet_width(k),
+        }
+        if with_vector:
+            params["query_vector"] = query_vector
+            params["vss_weight"] = vss_weight
+        params["fts_ids"] = [chunk_id for chunk_id, _ in self._await_fts(fts_results, timings)]
+        return self._timed(timings, "fused_sql", self._fetchall, sql, params)
+
+    def search(
+        self,
+        query_text: str,
+        k: int = TOP_K,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+        query_vector=_UNSET,
+        fts_results=None,
+        timings: dict | None = None,
+    ):
+        """Returns the top-k result rows (chunk_id, title, content, url, section_hierarchy),
+        with the query-aware snippet of each chunk as content (see _snippet_sql).
+        Uses the fused single-statement query when execution_mode is "fused", the SQL vector
+        engine is in use and the query was embedded (otherwise the statement would only do
+        RRF and the fetch, which the staged path does faster), and falls back to the staged
+        hybrid_search + get_results_by_ids path if it fails; only a fused
+        statement the database cannot parse or bind switches the searcher to staged for good.
+        Pass a dict as ``timings`` to receive per-branch wall times in ms (embed, fts,
+        fts_wait, vss, fused_sql or fusion + fetch, total).
+        Results are cached by (normalized query, k, weights) unless a precomputed
+        query_vector or fts_results is passed in. A call that arrives while an identical
+        search is running waits for that one and shares its rows (its timings stay empty).
+        """
+        timings = {} if timings is None else timings
+        self.metrics.incr("searches")
+        if query_vector is not _UNSET or fts_results is not None:
+            return self._search_recorded(query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings)
+        key = (normalize_query(query_text), k, fts_weight, vss_weight)
+        rows = self.result_cache.get(key)
+        if rows is not None:
+            return rows
+        rows, shared = self._flights.do(
+            ("search", key), self._search_and_cache, key, query_text, k, fts_weight, vss_weight, timings
+        )
+        if shared:
+            self.metrics.incr("searches_coalesced")
+        return rows
+
+    def _search_and_cache(self, key, query_text, k, fts_weight, vss_weight, timings):
+        rows = self._search_recorded(query_text, k, fts_weight, vss_weight, _UNSET, None, timings)
+        self.result_cache.set(key, rows)
+        return rows
+
+    def _search_recorded(self, query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings):
+        """_search() with its stage timings and errors recorded in the metrics."""
+        start = time.perf_counter()
+        try:
+            return self._search(query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings)
+        except Exception:
+            self.metrics.incr("search_errors")
+            raise
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000.0
+            self.metrics.observe_timings(timings)
+
+    def _search(self, query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings):
+        """Body of search(); see there."""
+        query_vector, fts_results = self._start_branches(query_text, k * 2, query_vector, fts_results, timings)
+        if self.execution_mode == "fused" and self.vector_engine == "duckdb" and query_vector is not None:
+            try:
+                return self.fused_search(
+                    query_text, k=k, fts_weight=fts_weight, vss_weight=vss_weight,
+                    query_vector=query_vector, fts_results=fts_results, timings=timings,
+                )
+            except Exception as e:
+                self.metrics.incr("fused_fallbacks")
+                sticky = isinstance(e, _FUSED_UNSUPPORTED)
+                try:
+                    scope = "execution" if sticky else "execution for this query"
+                    sys.stderr.write(f"[WARN] Fused search failed, using staged {scope}: {e}\n")
+                    sys.stderr.flush()
+                except Exception:
+                    pass
+                if sticky:
+                    self.execution_mode = "staged"
+        ids = self.hybrid_search(
+            query_text, k=k, fts_weight=fts_weight, vss_weight=vss_weight,
+            query_vector=query_vector, fts_results=fts_results, timings=timings,
+        )
+        return self._timed(timings, "fetch", self.get_snippets_by_ids, ids, query_text)
+
+    async def asearch(
+        self,
+        query_text: str,
+        k: int = TOP_K,
+        fts_weight: float = 0.4,
+        vss_weight: float = 0.6,
+        timings: dict | None = None,
+        deadline_ms: int | None = None,
+    ):
+        """Async search(): FTS starts on the worker pool, the embedding is awaited on the event
+        loop meanwhile, then VSS, fusion and the payload fetch run on the pool. Concurrent
+        requests overlap instead of queueing. Cache hits return without leaving the loop, and
+        identical searches already running are joined (see search()).
+        ``deadline_ms`` (default: the searcher's deadline_ms, 0 = none) bounds the waits for
+        the embedding and the vector search; past it the search is fused from FTS alone and
+        ``timings["degraded"]`` lists the branches left out ("embed", "vss"). Degraded rows
+        are not cached.
+        """
+        timings = {} if timings is None else timings
+        deadline_ms = self.deadline_ms if deadline_ms is None else deadline_ms
+        key = (normalize_query(query_text), k, fts_weight, vss_weight)
+        self.metrics.incr("searches")
+        rows = self.result_cache.get(key)
+        if rows is not None:
+            return rows
+        (rows, degraded), shared = await self._flights.ado(
+            ("search", key, deadline_ms), self._asearch, key, query_text, k, fts_weight, vss_weight, timings,
+            deadline_ms,
+        )
+        if shared:
+            self.metrics.incr("searches_coalesced")
+        if degraded:
+            timings["degraded"] = degraded
+        return rows
+
+    async def _asearch(self, key, query_text, k, fts_weight, vss_weight, timings, deadline_ms):
+        """Body of asearch(); one run is shared by all coalesced callers.
+        Returns (rows, degraded branches).
+        """
+        start = time.perf_counter()
+        deadline = start + deadline_ms / 1000.0 if deadline_ms else None
+        degraded: list[str] = []
+        # Submitted before the search task below, so a worker is never blocked on a FTS
+        # task queued behind it
+        fts_future = self._executor.submit(self._timed, timings, "fts", self.full_text_search, query_text, k * 2)
+        query_vector = await self._before_deadline(self.aget_query_embedding(query_text), deadline)
+        if query_vector is _UNSET:
+            query_vector = None
+            degraded.append("embed")
+        timings["embed_ms"] = (time.perf_counter() - start) * 1000.0
+        try:
+            rows = await self._run_search(
+                query_text, k, fts_weight, vss_weight, query_vector, fts_future, timings, deadline, degraded
+            )
+        except Exception:
+            self.metrics.incr("search_errors")
+            raise
+        finally:
+            timings["total_ms"] = (time.perf_counter() - start) * 1000.0
+            self.metrics.observe_timings(timings)
+        if degraded:
+            self.metrics.incr("searches_degraded")
+            for branch in degraded:
+                self.metrics.incr(f"degraded_{branch}")
+        else:
+            self.result_cache.set(key, rows)
+        if DEBUG_LOG_TIMINGS:
+            try:
+                sys.stderr.write(
+                    "[DEBUG] search timings: "
+                    + " ".join(f"{name}={ms:.1f}" for name, ms in sorted(timings.items()))
+                    + "\n"
+                )
+                sys.stderr.flush()
+            except Exception:
+                pass
+        return rows, degraded
+
+    @staticmethod
+    async def _before_deadline(awaitable, deadline):
+        """Awaits a result until the deadline (perf_counter seconds, None = no limit);
+        returns _UNSET if it passes first. A shared embeddings request keeps running and
+        still fills the cache.
+        """
+        if deadline is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, max(0.0, deadline - time.perf_counter()))
+        except asyncio.TimeoutError:
+            return _UNSET
+
+    async def _run_search(
+        self, query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings, deadline, degraded
+    ):
+        """Runs _search() on the pool. With a deadline and a query vector only the vector
+        search is bounded: it runs as its own pool task, and fusion and the payload fetch
+        then run once (staged) on whatever it returned in time. A vector search still
+        running at the deadline is left out ("vss" is added to degraded) and completes in
+        the background.
+        """
+        if deadline is None or query_vector is None:
+            return await self._run(
+                self._search, query_text, k, fts_weight, vss_weight, query_vector, fts_results, timings
+            )
+        # Own timings dict: an abandoned vector search must not write into one that is being reported
+        vss_timings: dict = {}
+        vss = self._run(self._timed, vss_timings, "vss", self.vector_search, query_vector, limit=k * 2)
+        vector_results = await self._before_deadline(asyncio.shield(vss), deadline)
+        if vector_results is _UNSET:
+            degraded.append("vss")
+            vector_results = []
+        else:
+            timings.update(vss_timings)
+        return await self._run(
+            self._fuse_and_fetch, query_text, k, fts_weight, vss_weight, vector_results, fts_results, timings
+        )
+
+    def _fuse_and_fetch(self, query_text, k, fts_weight, vss_weight, vector_results, fts_results, timings):
+        """Staged fusion and payload fetch for vector results that are already in hand."""
+        fts_results = self._await_fts(fts_results, timings)
+        ids = self._timed(timings, "fusion", self._fuse_rrf, vector_results, fts_results, k, fts_weight, vss_weight)
+        return self._timed(timings, "fetch", self.get_snippets_by_ids, ids, query_text)
+
+    async def asearch_many(
+        self, query_texts: list[str], k: int = TOP_K, fts_weight: float = 0.4, vss_weight: float = 0.6
+    ):
+        """Async search_many(); only queries missing from the result cache are embedded."""
+        if not query_texts:
+            return []
+        start = time.perf_counter()
+        keys, results, missing = self._cached_many(query_texts, k, fts_weight, vss_weight)
+        if missing:
+            texts = [query_texts[i] for i in missing]
+            query_vectors = await self.aget_query_embeddings(texts)
+            fresh = await self._run(self._search_many, texts, k, fts_weight, vss_weight, query_vectors)
+            self._store_many(keys, results, missing, fresh)
+        self._record_many(len(query_texts), start)
+        return results
+
+    async def aget_results_by_ids(self, chunk_ids: list):
+        """Async get_results_by_ids()."""
+        return await self._run(self.get_results_by_ids, chunk_ids)
+
+    def stats(self) -> dict:
+        """Metrics snapshot: per-stage latency histograms (ms), counters, cache hit rates
+        and the engines in use. Served by the MCP ``stats`` tool and resource.
+        """
+        snapshot = self.metrics.snapshot()
+        counters = snapshot["counters"]
+        result_lookups = self.result_cache.hits + self.result_cache.misses
+        embed_hits = counters.get("embed_cache_memory_hits", 0) + counters.get("embed_cache_disk_hits", 0)
+        embed_lookups = embed_hits + counters.get("embed_cache_misses", 0)
+        snapshot["caches"] = {
+            "result": {
+                "hits": self.result_cache.hits,
+                "misses": self.result_cache.misses,
+                "hit_rate": self.result_cache.hits / result_lookups if result_lookups else 0.0,
+                "entries": len(self.result_cache),
+            },
+            "embedding": {
+                "memory_hits": counters.get("embed_cache_memory_hits", 0),
+                "disk_hits": counters.get("embed_cache_disk_hits", 0),
+                "misses": counters.get("embed_cache_misses", 0),
+                "hit_rate": embed_hits / embed_lookups if embed_lookups else 0.0,
+            },
+        }
+        snapshot["engine"] = {
+            "execution_mode": self.execution_mode,
+            "fts_engine": self.fts_engine,
+            "vector_engine": self.vector_engine,
+            "vector_quantization": self.vector_quantization,
+            "embedding_model": self.embedding_model or self.model_name,
+            "embedding_dim": self.embedding_dim,
+            "build_generation": self.build_generation,
+            "vector_ready": self.vector_ready,
+            "deadline_ms": self.deadline_ms,
+            "embedding_breaker": self._embed_breaker.state,
+        }
+        return snapshot
+
+    def close(self):
+        """Stops the worker pool and closes the cursors and the database connection
+        (after a background warm_up() still running has finished its current step).
+        """
+        self._closed = True
+        self._embed_breaker.close()
+        self._executor.shutdown(wait=True)
+        with self._warmup_lock:
+            self._pool.close()
+            if self.disk_embed_cache is not None:
+                self.disk_embed_cache.close()
+            if self.db_connection:
+                self.db_connection.close()
+
+    async def aclose(self):
+        """Closes the async embeddings client, then everything close() does."""
+        if "async_openai_client" in self.__dict__:
+            try:
+                await self.async_openai_client.close()
+            except Exception:
+                pass
+        await asyncio.to_thread(self.close)
@@ -0,0 +1,171 @@
+"""
+Persistent query-embedding cache shared by all server processes on a machine.
+
+Stored as a small SQLite database next to the runtime DuckDB file
+(``<db name>_embed_cache.sqlite``). SQLite in WAL mode lets several processes read while
+one writes, which a DuckDB file does not. Entries are keyed by a hash of the model name
+and the exact query text and hold the embedding as float32 bytes.
+
+- Lazy: nothing is opened until the first lookup
+- Background writes: inserts and recency updates go through a queue to one writer
+  thread, so lookups never wait for disk writes
+- Bounded: when the table grows past ``max_entries`` the least recently used rows are
+  deleted (LRU on ``last_used``)
+"""
+
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    embedding BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS query_embeddings_last_used ON query_embeddings (last_used);
+"""
+_STOP = object()
+
+
+def cache_key(model: str, text: str) -> str:
+    """Row key: SHA-256 of the model name and the exact query text."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class PersistentEmbeddingCache:
+    """On-disk (model, query) -> embedding cache with LRU eviction."""
+
+    def __init__(self, path: str, max_entries: int = 100_000, flush_interval_s: float = 0.5):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.flush_interval_s = flush_interval_s
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;")
+        return con
+
+    def _reader(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            self._start()
+            con = self._connect()
+            self._local.con = con
+            with self._lock:
+                self._readers.append(con)
+        return con
+
+    def _start(self):
+        """Creates the table and starts the writer thread on first use."""
+        with self._lock:
+            if self._writer is not None:
+                return
+            con = self._connect()
+            con.executescript(_SCHEMA)
+            self._writer = threading.Thread(
+                target=self._write_loop, args=(con,), name="embed-cache-writer", daemon=True
+            )
+            self._writer.start()
+
+    def get(self, model: str, text: str):
+        """Returns the cached embedding as a list of floats, or None."""
+        key = cache_key(model, text)
+        row = self._reader().execute(
+            "SELECT embedding FROM query_embeddings WHERE key = ?;", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._queue.put(("touch", key, time.time()))
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def put(self, model: str, text: str, embedding):
+        """Queues an embedding for the writer thread."""
+        if self._closed:
+            return
+        self._start()
+        blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        self._queue.put(("put", cache_key(model, text), model, len(blob) // 4, blob, time.time()))
+
+    def _write_loop(self, con: sqlite3.Connection):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            batch = [item]
+            # Group everything queued within flush_interval_s into one transaction
+            deadline = time.monotonic() + self.flush_interval_s
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if any(op is _STOP for op in batch):
+                stop = True
+                batch = [op for op in batch if op is not _STOP]
+            try:
+                self._apply(con, batch)
+            except sqlite3.Error:
+                pass  # best effort: a lost cache write only costs a re-embed
+        con.close()
+
+    def _apply(self, con: sqlite3.Connection, batch: list):
+        puts = [op[1:] for op in batch if op[0] == "put"]
+        touches = [(ts, key) for _, key, ts in (op for op in batch if op[0] == "touch")]
+        if not puts and not touches:
+            return
+        con.execute("BEGIN IMMEDIATE;")
+        try:
+            con.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (key, model, dim, embedding, last_used) "
+                "VALUES (?, ?, ?, ?, ?);",
+                puts,
+            )
+            con.executemany("UPDATE query_embeddings SET last_used = ? WHERE key = ?;", touches)
+            if puts:
+                (count,) = con.execute("SELECT COUNT(*) FROM query_embeddings;").fetchone()
+                if count > self.max_entries:
+                    con.execute(
+                        "DELETE FROM query_embeddings WHERE key IN ("
+                        "SELECT key FROM query_embeddings ORDER BY last_used ASC LIMIT ?);",
+                        (count - self.max_entries,),
+                    )
+            con.execute("COMMIT;")
+        except sqlite3.Error:
+            con.execute("ROLLBACK;")
+            raise
+
+    def close(self, timeout_s: float = 2.0):
+        """Flushes queued writes (up to timeout_s) and stops the writer thread."""
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(_STOP)
+            self._writer.join(timeout=timeout_s)
+        with self._lock:
+            readers, self._readers = self._readers, []
+        for con in readers:
+            try:
+                con.close()
+            except sqlite3.Error:
+                pass
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return self._reader().execute("SELECT COUNT(*) FROM query_embeddings;").fetchone()[0]
@@ -0,0 +1,192 @@
+"""
+Build a compact BM25 inverted index for the runtime in-memory FTS engine.
+
+The index is written as a directory of NumPy arrays next to the runtime DuckDB file
+(``<db name>_bm25/``) and memory-mapped by ``runtime/bm25_index.py`` at startup:
+
+- ``meta.json``: format version, BM25 parameters, corpus statistics and the exact
+  tokenizer settings (pattern, stemmer, stopwords) the runtime must reuse for queries
+- ``vocab.json`` / ``chunk_ids.json``: term and document id lists (array positions)
+- ``offsets.npy``: per-term slice into the postings arrays (len = terms + 1)
+- ``postings.npy``: document positions, ascending within each term
+- ``title_tf.npy`` / ``content_tf.npy``: per-posting term frequency per field
+- ``title_len.npy`` / ``content_len.npy``: document lengths per field (tokens)
+- ``title_idf.npy`` / ``content_idf.npy``: per-term IDF per field
+- ``title_max.npy`` / ``content_max.npy``: per-term maximum BM25 contribution per
+  field, used as MaxScore upper bounds
+"""
+
+import json
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+
+FORMAT_VERSION = 1
+TOKEN_PATTERN = r"[a-z0-9]+"
+STEMMER = "s"
+# BM25 defaults, matching DuckDB's fts extension
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOPWORDS = [
+    "a", "about", "above", "after", "again", "against", "all", "am", "an", "and", "any",
+    "are", "as", "at", "be", "because", "been", "before", "being", "below", "between",
+    "both", "but", "by", "can", "could", "did", "do", "does", "doing", "down", "during",
+    "each", "few", "for", "from", "further", "had", "has", "have", "having", "he", "her",
+    "here", "hers", "herself", "him", "himself", "his", "how", "i", "if", "in", "into",
+    "is", "it", "its", "itself", "just", "me", "more", "most", "my", "myself", "no", "nor",
+    "not", "of", "off", "on", "once", "only", "or", "other", "our", "ours", "ourselves",
+    "out", "over", "own", "same", "she", "should", "so", "some", "such", "than", "that",
+    "the", "their", "theirs", "them", "themselves", "then", "there", "these", "they",
+    "this", "those", "through", "to", "too", "under", "until", "up", "very", "was", "we",
+    "were", "what", "when", "where", "which", "while", "who", "whom", "why", "will", "with",
+    "would", "you", "your", "yours", "yourself", "yourselves",
+]
+
+
+def s_stem(token: str) -> str:
+    """Harman's "S" stemmer: folds common English plurals onto their singular form."""
+    if len(token) > 3 and token.endswith("ies") and not token.endswith(("eies", "aies")):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("es") and not token.endswith(("aes", "ees", "oes")):
+        return token[:-1]
+    if len(token) > 2 and token.endswith("s") and not token.endswith(("us", "ss")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str, stopwords: set[str], pattern: re.Pattern = re.compile(TOKEN_PATTERN)) -> list[str]:
+    """Lowercases, splits on non-alphanumerics, drops stopwords and applies the S stemmer."""
+    if not text:
+        return []
+    return [s_stem(tok) for tok in pattern.findall(text.lower()) if tok not in stopwords]
+
+
+def _idf(df: np.ndarray, n_docs: int) -> np.ndarray:
+    # Okapi BM25 IDF with the +1 smoothing used by DuckDB (never negative)
+    return np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+
+def _impacts(tf: np.ndarray, doc_len: np.ndarray, avg_len: float, k1: float, b: float) -> np.ndarray:
+    norm = k1 * (1.0 - b + b * doc_len / max(avg_len, 1e-9))
+    return (tf * (k1 + 1.0) / (tf + norm)).astype(np.float32)
+
+
+def build_bm25_index(rows, output_dir: str, k1: float = BM25_K1, b: float = BM25_B) -> dict:
+    """Builds the index from ``(chunk_id, title, content)`` rows and writes it to ``output_dir``.
+
+    The directory is written to a temporary sibling first and swapped in, so a running
+    server never observes a half-written index.
+
+    Returns:
+        The ``meta.json`` contents (corpus statistics)
+    """
+    stopwords = set(STOPWORDS)
+    chunk_ids: list[str] = []
+    title_lens: list[int] = []
+    content_lens: list[int] = []
+    vocab: dict[str, int] = {}
+    # term id -> list of (doc position, title tf, content tf)
+    postings: list[list[tuple[int, int, int]]] = []
+
+    for doc, (chunk_id, title, content) in enumerate(rows):
+        title_tokens = tokenize(title or "", stopwords)
+        content_tokens = tokenize(content or "", stopwords)
+        chunk_ids.append(str(chunk_id))
+        title_lens.append(len(title_tokens))
+        content_lens.append(len(content_tokens))
+        title_tf = Counter(title_tokens)
+        content_tf = Counter(content_tokens)
+        for term in title_tf.keys() | content_tf.keys():
+            term_id = vocab.setdefault(term, len(vocab))
+            if term_id == len(postings):
+                postings.append([])
+            postings[term_id].append((doc, title_tf.get(term, 0), content_tf.get(term, 0)))
+
+    n_docs = len(chunk_ids)
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    flat = [entry for plist in postings for entry in plist]
+    docs_arr = np.fromiter((e[0] for e in flat), dtype=np.int32, count=len(flat))
+    tf_cap = np.iinfo(np.uint16).max
+    title_tf_arr = np.fromiter((min(e[1], tf_cap) for e in flat), dtype=np.uint16, count=len(flat))
+    content_tf_arr = np.fromiter((min(e[2], tf_cap) for e in flat), dtype=np.uint16, count=len(flat))
+    title_len_arr = np.asarray(title_lens, dtype=np.int32)
+    content_len_arr = np.asarray(content_lens, dtype=np.int32)
+    avg_title_len = float(title_len_arr.mean()) if n_docs else 0.0
+    avg_content_len = float(content_len_arr.mean()) if n_docs else 0.0
+
+    # Per-field document frequency and IDF
+    term_of_posting = np.repeat(np.arange(len(postings)), np.diff(offsets))
+    title_df = np.bincount(term_of_posting, weights=title_tf_arr > 0, minlength=len(postings))
+    content_df = np.bincount(term_of_posting, weights=content_tf_arr > 0, minlength=len(postings))
+    title_idf = _idf(title_df, n_docs)
+    content_idf = _idf(content_df, n_docs)
+
+    # Per-term maximum contribution per field (MaxScore upper bounds)
+    title_imp = _impacts(title_tf_arr, title_len_arr[docs_arr], avg_title_len, k1, b) * title_idf[term_of_posting]
+    content_imp = _impacts(content_tf_arr, content_len_arr[docs_arr], avg_content_len, k1, b) * content_idf[term_of_posting]
+    title_max = np.zeros(len(postings), dtype=np.float32)
+    content_max = np.zeros(len(postings), dtype=np.float32)
+    np.maximum.at(title_max, term_of_posting, title_imp)
+    np.maximum.at(content_max, term_of_posting, content_imp)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "k1": k1,
+        "b": b,
+        "n_docs": n_docs,
+        "n_terms": len(postings),
+        "n_postings": int(offsets[-1]),
+        "avg_title_len": avg_title_len,
+        "avg_content_len": avg_content_len,
+        "token_pattern": TOKEN_PATTERN,
+        "stemmer": STEMMER,
+        "stopwords": sorted(stopwords),
+    }
+
+    tmp_dir = output_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    terms = [None] * len(vocab)
+    for term, term_id in vocab.items():
+        terms[term_id] = term
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    with open(os.path.join(tmp_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(terms, f)
+    with open(os.path.join(tmp_dir, "chunk_ids.json"), "w", encoding="utf-8") as f:
+        json.dump(chunk_ids, f)
+    arrays = {
+        "offsets": offsets,
+        "postings": docs_arr,
+        "title_tf": title_tf_arr,
+        "content_tf": content_tf_arr,
+        "title_len": title_len_arr,
+        "content_len": content_len_arr,
+        "title_idf": title_idf,
+        "content_idf": content_idf,
+        "title_max": title_max,
+        "content_max": content_max,
+    }
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), arr)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return meta
+
+
+def bm25_index_dir(db_path: str) -> str:
+    """Conventional index location for a runtime database (``<db without .db>_bm25``)."""
+    return os.path.splitext(db_path)[0] + "_bm25"
+
+
+def index_size_bytes(index_dir: str) -> int:
+    """Total on-disk size of an index directory."""
+    return sum(
+        os.path.getsize(os.path.join(index_dir, name)) for name in os.listdir(index_dir)
+    ) if os.path.isdir(index_dir) else 0
+
@@ -6,30 +6,127 @@ from pathlib import Path
 _project_root = Path(__file__).resolve().parent.parent.parent
 sys.path.insert(0, str(_project_root))
 
-import json
 import argparse
-import pandas as pd
-from tqdm import tqdm
+import duckdb
 
 from shared.config_loader import load_config_with_substitution
+from shared.embedding.generate_embeddings import EMBEDDINGS_FILE
 
 
 
 # --- Defaults ---
 MIN_CHUNK_LENGTH = 80  # Relaxed threshold; consider token-based threshold downstream
+MEMORY_LIMIT = "1GB"  # DuckDB spills the join to disk beyond this
+ROW_GROUP_SIZE = 4096  # Rows per Parquet row group of the output
 # --- End Defaults ---
 
-def load_jsonl(file_path):
-    """Loads a .jsonl file and returns a list of dictionaries."""
-    data = []
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip():
-                data.append(json.loads(line))
-    return data
+# Chunk fields read from the chunk files; anything else in them is ignored
+_CHUNK_COLUMNS = {
+    "chunk_id": "VARCHAR",
+    "document_id": "VARCHAR",
+    "content": "VARCHAR",
+    "token_count": "BIGINT",
+    "has_code": "BOOLEAN",
+    "metadata": "STRUCT(title VARCHAR, url VARCHAR, section_hierarchy VARCHAR[], section_url VARCHAR)",
+}
+
+
+def _sql_literal(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _struct(columns: dict) -> str:
+    return "{" + ", ".join(f"{_sql_literal(name)}: {_sql_literal(kind)}" for name, kind in columns.items()) + "}"
+
+
+def chunks_source(chunks_dir: str) -> str:
+    """SQL relation over all chunk .jsonl files of a server, parsed by DuckDB as it scans."""
+    pattern = os.path.join(chunks_dir, "*.jsonl")
+    return f"read_json({_sql_literal(pattern)}, format = 'newline_delimited', columns = {_struct(_CHUNK_COLUMNS)})"
+
+
+def embeddings_source(embeddings_dir: str) -> str:
+    """SQL relation (chunk_id, embedding) over the embeddings of a server: the Parquet file
+    written by generate_embeddings.py, else the older ``*_embeddings.jsonl`` files.
+    Empty embeddings are dropped, and a chunk_id listed more than once keeps its last
+    embedding (last row of the file; for JSON lines, of the last file by name).
+    """
+    parquet_path = os.path.join(embeddings_dir, EMBEDDINGS_FILE)
+    if os.path.exists(parquet_path):
+        rows = f"""
+            SELECT chunk_id, embedding, len(embedding) > 0 AS has_embedding,
+                   '' AS filename, file_row_number AS line_no
+            FROM read_parquet({_sql_literal(parquet_path)}, file_row_number = true)
+        """
+    else:
+        print(f"No {EMBEDDINGS_FILE} in {embeddings_dir}; reading legacy *_embeddings.jsonl files")
+        pattern = os.path.join(embeddings_dir, "*_embeddings.jsonl")
+        # read_json has no row numbers: split the lines to keep the order of duplicates
+        rows = f"""
+            SELECT line ->> 'chunk_id' AS chunk_id, CAST(line -> 'embedding' AS FLOAT[]) AS embedding,
+                   coalesce(json_array_length(line, '$.embedding'), 0) > 0 AS has_embedding,
+                   filename, line_no
+            FROM (
+                SELECT filename, unnest(lines) AS line, generate_subscripts(lines, 1) AS line_no
+                FROM (SELECT filename, string_split(content, chr(10)) AS lines FROM read_text({_sql_literal(pattern)}))
+            )
+            WHERE trim(line) <> ''
+        """
+    # The last row per chunk_id is picked on the keys alone (a window over the embeddings
+    # themselves does not spill well), then its embedding is read
+    return f"""(
+        SELECT r.chunk_id, r.embedding
+        FROM ({rows}) AS r
+        SEMI JOIN (
+            SELECT chunk_id, filename, line_no FROM ({rows})
+            WHERE has_embedding
+            QUALIFY row_number() OVER (PARTITION BY chunk_id ORDER BY filename DESC, line_no DESC) = 1
+        ) AS last USING (chunk_id, filename, line_no)
+    )"""
+
+
+def keep_chunk(min_chunk_length: int = MIN_CHUNK_LENGTH) -> str:
+    """SQL condition on chunk ``c``: it has an id and passes the quality filter."""
+    return f"""
+        coalesce(c.chunk_id, '') <> ''
+        -- Quality filter: drop very short chunks unless they look like headers or intros
+        -- (have a section hierarchy)
+        AND (length(coalesce(c.content, '')) >= {int(min_chunk_length)}
+             OR len(coalesce(c.metadata.section_hierarchy, [])) > 0)
+    """
+
+
+def consolidation_query(chunks: str, embeddings: str, min_chunk_length: int = MIN_CHUNK_LENGTH) -> str:
+    """One streaming join of chunks and embeddings with the quality filter applied in the
+    scan, producing the consolidated schema.
+    """
+    return f"""
+        SELECT
+            c.chunk_id,
+            c.document_id,
+            c.content,
+            e.embedding,
+            c.metadata.title AS title,
+            c.metadata.url AS url,
+            coalesce(c.metadata.section_hierarchy, []) AS section_hierarchy,
+            -- Persist a section_url if present; else fall back to url at read time
+            c.metadata.section_url AS section_url,
+            -- Persist useful quality features when present
+            c.token_count,
+            c.has_code
+        FROM {chunks} AS c
+        JOIN {embeddings} AS e ON e.chunk_id = c.chunk_id
+        WHERE {keep_chunk(min_chunk_length)}
+    """
+
 
 def main():
-    """Consolidates chunks, metadata, and embeddings into a single Parquet file."""
+    """Consolidates chunks, metadata, and embeddings into a single Parquet file.
+
+    Runs as one DuckDB query: the chunk and embedding files are scanned, filtered and
+    joined as a stream and written out row group by row group, so memory stays bounded by
+    ``--memory-limit`` (DuckDB spills to disk beyond it) however large the corpus is.
+    """
 
     parser = argparse.ArgumentParser(description="Consolidate chunks and embeddings into Parquet")
     parser.add_argument(
@@ -48,6 +145,11 @@ def main():
         required=False,
         help="Optional path to processing_config.yaml for variable substitution",
     )
+    parser.add_argument(
+        "--memory-limit",
+        default=MEMORY_LIMIT,
+        help=f"DuckDB memory limit for the join, e.g. '512MB' (default: {MEMORY_LIMIT})",
+    )
     args = parser.parse_args()
 
     if args.config:
@@ -60,79 +162,48 @@ def main():
 
     print("🔥 Starting data consolidation process...")
 
-    # 1. Load all embeddings into a dictionary for quick lookup
-    print("Loading embeddings...")
-    embeddings_map = {}
-    embedding_files = [f for f in os.listdir(embeddings_dir) if f.endswith("_embeddings.jsonl")]
-    for file_name in tqdm(embedding_files, desc="Reading embedding files"):
-        file_path = os.path.join(embeddings_dir, file_name)
-        for item in load_jsonl(file_path):
-            embeddings_map[item["chunk_id"]] = item["embedding"]
-    print(f"✓ Loaded {len(embeddings_map)} embeddings.")
-
-    # 2. Load all chunks and join with embeddings and metadata
-    print("\nLoading chunks and metadata...")
-    consolidated_data = []
-    chunk_files = [f for f in os.listdir(chunks_dir) if f.endswith(".jsonl")]
-    for file_name in tqdm(chunk_files, desc="Reading chunk files"):
-        file_path = os.path.join(chunks_dir, file_name)
-        for chunk_data in load_jsonl(file_path):
-            chunk_id = chunk_data.get("chunk_id")
-            if not chunk_id:
-                continue
-
-            # --- Quality Filter ---
-            # Only include chunks with a minimal length to avoid extreme noise.
-            content = chunk_data.get("content")
-            if not content or len(content) < MIN_CHUNK_LENGTH:
-                # Keep short chunks if they look like headers or intros
-                meta = chunk_data.get("metadata", {})
-                section_h = meta.get("section_hierarchy", [])
-                if not section_h:
-                    continue
-
-            # Get the corresponding embedding
-            embedding = embeddings_map.get(chunk_id)
-            if not embedding:
-                print(f"Warning: No embedding found for chunk_id {chunk_id}")
-                continue
-
-            # Extract relevant metadata
-            metadata = chunk_data.get("metadata", {})
-            
-            # Create a unified record
-            record = {
-                "chunk_id": chunk_id,
-                "document_id": chunk_data.get("document_id"),
-                "content": content,
-                "embedding": embedding,
-                "title": metadata.get("title"),
-                "url": metadata.get("url"),
-                "section_hierarchy": metadata.get("section_hierarchy", []),
-                # Persist a section_url if present; else fall back to url at read time
-                "section_url": metadata.get("section_url"),
-                # Persist useful quality features when present
-                "token_count": chunk_data.get("token_count"),
-                "has_code": chunk_data.get("has_code"),
-            }
-            consolidated_data.append(record)
-
-    if not consolidated_data:
-        print("❌ No data was consolidated. Exiting.")
-        return
-
-    print(f"✓ Consolidated {len(consolidated_data)} records.")
-
-    # 3. Create a DataFrame and save to Parquet
-    print("\nCreating DataFrame and saving to Parquet...")
-    df = pd.DataFrame(consolidated_data)
-
     # Ensure the output directory exists
     output_dir = os.path.dirname(output_file)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    df.to_parquet(output_file, index=False)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = {_sql_literal(args.memory_limit)};")
+    con.execute(f"SET temp_directory = {_sql_literal(os.path.join(output_dir, '.consolidate_tmp'))};")
+    # Row order does not matter downstream; not keeping it lets the join stream
+    con.execute("SET preserve_insertion_order = false;")
+
+    chunks = chunks_source(chunks_dir)
+    embeddings = embeddings_source(embeddings_dir)
+
+    # 1. Chunks that pass the filter but have no embedding are reported (the join drops them)
+    missing_sql = f"""
+        SELECT c.chunk_id FROM {chunks} AS c
+        ANTI JOIN {embeddings} AS e ON e.chunk_id = c.chunk_id
+        WHERE {keep_chunk()}
+    """
+    (missing,) = con.execute(f"SELECT count(*) FROM ({missing_sql});").fetchone()
+    if missing:
+        examples = ", ".join(chunk_id for (chunk_id,) in con.execute(f"{missing_sql} LIMIT 5;").fetchall())
+        print(f"Warning: No embedding found for {missing} chunks (e.g. {examples})")
+
+    # 2. Stream the filtered join into Parquet row groups
+    print("\nJoining chunks with embeddings and writing Parquet...")
+    tmp_file = f"{output_file}.tmp"
+    con.execute(
+        f"COPY ({consolidation_query(chunks, embeddings)}) TO {_sql_literal(tmp_file)} "
+        f"(FORMAT parquet, ROW_GROUP_SIZE {ROW_GROUP_SIZE});"
+    )
+    (count,) = con.execute(f"SELECT count(*) FROM read_parquet({_sql_literal(tmp_file)});").fetchone()
+    con.close()
+
+    if count == 0:
+        os.remove(tmp_file)
+        print("❌ No data was consolidated. Exiting.")
+        return
+
+    os.replace(tmp_file, output_file)
+    print(f"✓ Consolidated {count} records.")
     print(f"✅ Successfully saved consolidated data to {output_file}")
 
 if __name__ == "__main__":
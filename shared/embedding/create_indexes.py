@@ -1,6 +1,34 @@
+import os
+import sys
+from pathlib import Path
+
+# Add project root to path BEFORE any shared imports
+_project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(_project_root))
+
 import argparse
+import json
+import uuid
+from datetime import datetime, timezone
+
 import duckdb
-import os
+
+from shared.config_loader import load_config_with_substitution
+from shared.embedding.bm25_index import build_bm25_index, bm25_index_dir, index_size_bytes
+from shared.embedding.dim_reduction import (
+    REDUCTION_METHODS,
+    embedding_dim,
+    reduce_table_embeddings,
+    write_embedding_metadata,
+)
+from shared.embedding.quantize import QUANTIZATION_MODES, add_quantized_columns
+
+
+# --- Defaults ---
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+# DuckDB vss defaults; m0 (neighbours on the base layer) defaults to 2 * m
+HNSW_DEFAULTS = {"ef_construction": 128, "ef_search": 64, "m": 16, "m0": None}
+# --- End Defaults ---
 
 
 def _build_paths(mcp_name: str, doc_type: str = "manual"):
@@ -21,6 +49,44 @@ def _build_paths(mcp_name: str, doc_type: str = "manual"):
     main_db_path = os.path.join("servers", mcp_dir, "runtime", f"{mcp_name}_{doc_type}_mcp.db")
     return ducklake_catalog_path, ducklake_table_name, indexed_table_name, main_db_path
 
+def hnsw_index_options(params: dict | None = None) -> str:
+    """Returns the WITH (...) option list of a cosine HNSW index for ``params``
+    (keys of HNSW_DEFAULTS; missing or null values use the defaults).
+    """
+    merged = {**HNSW_DEFAULTS, **{k: v for k, v in (params or {}).items() if v is not None}}
+    m = int(merged["m"])
+    m0 = int(merged["m0"]) if merged["m0"] is not None else 2 * m
+    return (
+        f"metric = 'cosine', ef_construction = {int(merged['ef_construction'])}, "
+        f"ef_search = {int(merged['ef_search'])}, M = {m}, M0 = {m0}"
+    )
+
+
+def write_build_generation(db_path: str, row_count: int) -> str:
+    """Writes a new build-generation stamp next to the database (``<db without .db>.generation``).
+
+    The runtime empties its search result cache when the stamp changes. The file is
+    replaced atomically.
+
+    Returns:
+        The new generation id
+    """
+    generation = uuid.uuid4().hex
+    stamp_path = os.path.splitext(db_path)[0] + ".generation"
+    tmp_path = stamp_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "generation": generation,
+                "built_at": datetime.now(timezone.utc).isoformat(),
+                "row_count": row_count,
+            },
+            f,
+        )
+    os.replace(tmp_path, stamp_path)
+    return generation
+
+
 def main():
     """Create a materialized, indexed copy of the DuckLake data for fast querying."""
 
@@ -35,12 +101,52 @@ def main():
         default="manual",
         help="Documentation type (e.g., 'manual', 'docs', 'guide')",
     )
+    parser.add_argument(
+        "--config",
+        help="Path to processing_config.yaml (default: servers/{mcp}-{doc}-mcp/config/processing_config.yaml)",
+    )
+    parser.add_argument(
+        "--model-name",
+        help="Embedding model recorded in the database (default: embedding.model_name from the config)",
+    )
+    parser.add_argument(
+        "--reduce-dim",
+        type=int,
+        help="Reduce stored embeddings to this many dimensions (default: indexing.reduce_dim from the config)",
+    )
+    parser.add_argument(
+        "--reduce-method",
+        choices=REDUCTION_METHODS,
+        help="Dimensionality reduction method (default: indexing.reduce_method from the config, else 'pca')",
+    )
+    parser.add_argument(
+        "--quantize",
+        choices=QUANTIZATION_MODES,
+        help="Quantized embedding columns to add for the runtime's two-stage vector search "
+        "(default: the search.vector_quantization the server is configured with, else 'none')",
+    )
     args = parser.parse_args()
 
     mcp_name = args.mcp_name
     doc_type = args.doc_type
     ducklake_catalog_path, ducklake_table_name, indexed_table_name, main_db_path = _build_paths(mcp_name, doc_type)
 
+    config_path = args.config or os.path.join("servers", f"{mcp_name}-{doc_type}-mcp", "config", "processing_config.yaml")
+    config = load_config_with_substitution(config_path) if os.path.exists(config_path) else {}
+    embed_config = config.get("embedding") or {}
+    index_config = config.get("indexing") or {}
+    model_name = args.model_name or embed_config.get("model_name") or MODEL_NAME
+    reduce_dim = args.reduce_dim if args.reduce_dim is not None else index_config.get("reduce_dim")
+    reduce_method = args.reduce_method or index_config.get("reduce_method") or "pca"
+    # Quantized columns grow the database: only build the ones the server will use
+    quantize = args.quantize
+    if quantize is None:
+        server_config_path = os.path.join(os.path.dirname(config_path), "server_config.yaml")
+        server_config = load_config_with_substitution(server_config_path) if os.path.exists(server_config_path) else {}
+        quantize = (server_config.get("search") or {}).get("vector_quantization") or "none"
+        if quantize not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown search.vector_quantization '{quantize}' in {server_config_path}")
+
     print("🔥 Starting materialized view and index creation process...")
 
     if not os.path.exists(ducklake_catalog_path):
@@ -60,7 +166,10 @@ def main():
         # 1. Materialize the latest data from DuckLake into a native table
         print(f"\nMaterializing data into native table '{indexed_table_name}'...")
         con.execute(f"DROP TABLE IF EXISTS {indexed_table_name};")
-        # Explicitly cast the embedding column to the required FLOAT[768] type for HNSW indexing
+        # HNSW indexing needs a fixed-size FLOAT[d] column; d is the model's output width
+        source_dim = embedding_dim(con, f"mojo_lake.{ducklake_table_name}")
+        if source_dim == 0:
+            raise ValueError(f"DuckLake table '{ducklake_table_name}' has no embeddings")
         con.execute(
             f"""
             CREATE TABLE {indexed_table_name} AS 
@@ -68,14 +177,42 @@ def main():
                 chunk_id, 
                 document_id, 
                 content, 
-                CAST(embedding AS FLOAT[768]) AS embedding, 
+                CAST(embedding AS FLOAT[{source_dim}]) AS embedding, 
                 title, 
                 url, 
                 section_hierarchy 
             FROM mojo_lake.{ducklake_table_name};
             """
         )
-        print(f"✓ Successfully copied data to '{indexed_table_name}'.")
+        print(f"✓ Successfully copied data to '{indexed_table_name}' ({source_dim}-dim embeddings from {model_name}).")
+
+        # 1a. Optional dimensionality reduction (the table is rebuilt, so before any index)
+        dim, projection = source_dim, {}
+        if reduce_dim and int(reduce_dim) < source_dim:
+            dim = int(reduce_dim)
+            print(f"\nReducing embeddings to {dim} dimensions ({reduce_method})...")
+            projection = reduce_table_embeddings(con, indexed_table_name, dim, reduce_method)
+            print(f"✓ Reduced {projection['rows']} embeddings, {projection['energy_kept']:.1%} of the energy kept.")
+        write_embedding_metadata(
+            con,
+            model_name,
+            dim,
+            source_dim,
+            reduce_method if projection else "none",
+            components=projection.get("components"),
+        )
+        print(f"✓ Embedding metadata recorded: {model_name}, {dim} dims.")
+
+        # 1b. Quantized copies of the embeddings (the table is rebuilt, so before any index)
+        if quantize != "none":
+            print(f"\nAdding quantized embedding columns ({quantize})...")
+            stats = add_quantized_columns(con, indexed_table_name, quantize)
+            sizes = ", ".join(
+                f"{name} {stats[f'{name}_bytes'] / 1e6:.1f} MB"
+                for name in ("float32", "int8", "binary")
+                if f"{name}_bytes" in stats
+            )
+            print(f"✓ Quantized {stats['rows']} embeddings ({stats['dim']} dims): {sizes}.")
 
         # 2. Create HNSW index for Vector Search on the native table
         print("\nCreating HNSW index for vector search...")
@@ -85,10 +222,11 @@ def main():
         con.execute("SET hnsw_enable_experimental_persistence = true;")
         # Recreate the index to ensure the desired metric is applied
         con.execute("DROP INDEX IF EXISTS mojo_hnsw_idx;")
+        hnsw_options = hnsw_index_options(index_config.get("hnsw"))
         con.execute(
-            f"CREATE INDEX mojo_hnsw_idx ON {indexed_table_name} USING HNSW (embedding) WITH (metric = 'cosine');"
+            f"CREATE INDEX mojo_hnsw_idx ON {indexed_table_name} USING HNSW (embedding) WITH ({hnsw_options});"
         )
-        print("✓ HNSW index created or already exists.")
+        print(f"✓ HNSW index created ({hnsw_options}).")
 
         # 3. Create FTS index for Full-Text Search on the native table
         print("\nCreating FTS index for full-text search...")
@@ -102,10 +240,24 @@ def main():
         )
         print("✓ FTS index created successfully.")
 
+        # 4. Build the inverted index for the runtime's in-memory BM25 engine
+        bm25_dir = bm25_index_dir(main_db_path)
+        print(f"\nBuilding in-memory BM25 index at: {bm25_dir}")
+        rows = con.execute(
+            f"SELECT chunk_id, title, content FROM {indexed_table_name} ORDER BY chunk_id;"
+        ).fetchall()
+        bm25_meta = build_bm25_index(rows, bm25_dir)
+        print(
+            f"✓ BM25 index built: {bm25_meta['n_terms']} terms, {bm25_meta['n_postings']} postings, "
+            f"{index_size_bytes(bm25_dir) / 1e6:.1f} MB."
+        )
+
         # Verify the final table
         result = con.execute(f"SELECT COUNT(*) FROM {indexed_table_name}").fetchone()
         row_count = result[0] if result else 0
         print(f"\n✅ Success! Materialized table '{indexed_table_name}' contains {row_count} records and is fully indexed.")
+        generation = write_build_generation(main_db_path, row_count)
+        print(f"✓ Build generation stamp: {generation}")
 
     except Exception as e:
         print(f"\n❌ An error occurred during the process: {e}")
@@ -0,0 +1,132 @@
+"""
+Embedding dimensionality reduction and the ``embedding_metadata`` table.
+
+``create_indexes.py`` can shrink the stored embeddings before any index is built:
+
+- ``pca``: project onto the top principal axes of the corpus embeddings
+  (``x @ components.T``); works for any model. The axes are fitted on centered data
+  but vectors are projected uncentered, which keeps cosine rankings close to the
+  full-width ones (centering shifts every cosine)
+- ``matryoshka``: keep the first ``dim`` components; only meaningful for models trained
+  with Matryoshka representation learning, whose leading components carry most of the
+  signal
+
+Every build records the model name, the stored dimension and the query projection in a
+one-row ``embedding_metadata`` table, which the runtime ``HybridSearcher`` reads at
+startup to type its SQL and to project query embeddings the same way.
+"""
+
+import numpy as np
+import pyarrow as pa
+
+REDUCTION_METHODS = ("pca", "matryoshka")
+
+
+def fit_pca(matrix: np.ndarray, dim: int) -> np.ndarray:
+    """Returns the top ``dim`` principal axes of ``matrix``, shape (dim, source_dim)."""
+    _, _, vt = np.linalg.svd(matrix - matrix.mean(axis=0), full_matrices=False)
+    return vt[:dim].astype(np.float32)
+
+
+def reduce_matrix(matrix: np.ndarray, dim: int, method: str) -> tuple[np.ndarray, dict]:
+    """Reduces the rows of ``matrix`` to ``dim`` components.
+
+    Returns:
+        (reduced float32 matrix, projection dict with 'components' (None for matryoshka)
+        and 'energy_kept', the share of the squared norm the reduced rows keep)
+    """
+    if method not in REDUCTION_METHODS:
+        raise ValueError(f"Unknown reduction method '{method}', expected one of {REDUCTION_METHODS}")
+    if not 0 < dim < matrix.shape[1]:
+        raise ValueError(f"Target dimension {dim} must be between 1 and {matrix.shape[1] - 1}")
+    components = None
+    if method == "matryoshka":
+        reduced = np.ascontiguousarray(matrix[:, :dim], dtype=np.float32)
+    else:
+        components = fit_pca(matrix, dim)
+        reduced = (matrix @ components.T).astype(np.float32)
+    total = float((matrix**2).sum())
+    energy = float((reduced**2).sum() / total) if total else 1.0
+    return reduced, {"components": components, "energy_kept": energy}
+
+
+def embedding_dim(con, table_name: str) -> int:
+    """Width of the embedding column of ``table_name`` (0 when the table is empty)."""
+    row = con.execute(f"SELECT len(embedding) FROM {table_name} LIMIT 1;").fetchone()
+    return int(row[0]) if row else 0
+
+
+def reduce_table_embeddings(con, table_name: str, dim: int, method: str = "pca") -> dict:
+    """Replaces the embedding column of the freshly materialized ``table_name`` with its
+    ``dim``-dimensional reduction. Must run before any index is created on the table.
+
+    Returns:
+        The projection (see ``reduce_matrix``) plus 'source_dim' and 'rows'
+    """
+    data = con.execute(f"SELECT chunk_id, embedding FROM {table_name} ORDER BY chunk_id;").fetchnumpy()
+    n = len(data["chunk_id"])
+    if n == 0:
+        raise ValueError(f"Table {table_name} is empty; nothing to reduce")
+    source_dim = len(data["embedding"][0])
+    matrix = np.empty((n, source_dim), dtype=np.float32)
+    for i, emb in enumerate(data["embedding"]):
+        matrix[i] = emb
+    reduced, projection = reduce_matrix(matrix, dim, method)
+
+    con.register(
+        "reduced_embeddings",
+        pa.table(
+            {
+                "chunk_id": pa.array([str(c) for c in data["chunk_id"]]),
+                "embedding": pa.FixedSizeListArray.from_arrays(pa.array(reduced.ravel()), dim),
+            }
+        ),
+    )
+    try:
+        con.execute(
+            f"""
+            CREATE OR REPLACE TABLE {table_name} AS
+            SELECT t.* REPLACE (CAST(r.embedding AS FLOAT[{dim}]) AS embedding)
+            FROM {table_name} AS t
+            JOIN reduced_embeddings AS r ON r.chunk_id = t.chunk_id
+            ORDER BY t.chunk_id;
+            """
+        )
+    finally:
+        con.unregister("reduced_embeddings")
+    return {**projection, "source_dim": source_dim, "rows": n}
+
+
+def write_embedding_metadata(
+    con,
+    model_name: str,
+    dim: int,
+    source_dim: int,
+    reduction: str = "none",
+    components: np.ndarray | None = None,
+):
+    """(Re)creates the one-row ``embedding_metadata`` table."""
+    con.execute("DROP TABLE IF EXISTS embedding_metadata;")
+    con.execute(
+        """
+        CREATE TABLE embedding_metadata (
+            model_name VARCHAR NOT NULL,
+            dim INTEGER NOT NULL,
+            source_dim INTEGER NOT NULL,
+            reduction VARCHAR NOT NULL,
+            projection FLOAT[][],
+            created_at TIMESTAMPTZ DEFAULT current_timestamp
+        );
+        """
+    )
+    con.execute(
+        "INSERT INTO embedding_metadata (model_name, dim, source_dim, reduction, projection) "
+        "VALUES (?, ?, ?, ?, ?);",
+        [
+            model_name,
+            dim,
+            source_dim,
+            reduction,
+            components.tolist() if components is not None else None,
+        ],
+    )
@@ -0,0 +1,153 @@
+"""
+Content-addressed store of chunk embeddings for incremental builds.
+
+``generate_embeddings.py`` looks every chunk up here before calling MAX and only embeds
+the misses, so a documentation sync that touched a few pages re-embeds only the chunks
+whose text changed. Rows are keyed by a SHA-256 of the model name and the exact text sent
+to the model (content with the Title/Section prefix), the same key as the runtime's
+query-embedding cache, and hold the embedding as float32 bytes.
+
+One SQLite file per MCP server (``shared/build/embedding_store/{mcp_name}.sqlite``).
+Every build stamps the rows it used; after a complete build the rows of that model left
+unused (chunks that no longer exist) are pruned, so the store tracks the corpus instead
+of growing with every edit.
+
+The store is also the build's progress journal: each embedded batch is committed as soon
+as it returns, and a ``build_runs`` row records that a build for a model is in progress.
+A build that was interrupted (crash, Ctrl-C, MAX going away) resumes its run: the chunks
+it already committed are reused, even with ``--full``, and only the rest is embedded.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    embedding BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunk_embeddings_model_last_used ON chunk_embeddings (model, last_used);
+CREATE TABLE IF NOT EXISTS build_runs (
+    model TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    full_rebuild INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+# Keys per SELECT/UPDATE statement (SQLite's default host parameter limit is 999)
+_LOOKUP_BATCH = 500
+
+
+def cache_key(model: str, text: str) -> str:
+    """Row key: SHA-256 of the model name and the exact embedded text."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """On-disk (model, text) -> embedding store, used from a single thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._con = sqlite3.connect(path, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL;")
+        self._con.execute("PRAGMA synchronous=NORMAL;")
+        self._con.executescript(_SCHEMA)
+
+    def begin_run(self, model: str, full_rebuild: bool = False) -> tuple[float, bool, bool]:
+        """Starts a build run for the model, or resumes the one left unfinished.
+        Returns (started_at, full_rebuild, resumed); a resumed run keeps its original start
+        time and full_rebuild setting.
+        """
+        row = self._con.execute(
+            "SELECT started_at, full_rebuild FROM build_runs WHERE model = ? AND status = 'running';", (model,)
+        ).fetchone()
+        now = time.time()
+        if row is not None:
+            self._con.execute("UPDATE build_runs SET updated_at = ? WHERE model = ?;", (now, model))
+            return row[0], bool(row[1]), True
+        self._con.execute(
+            "INSERT OR REPLACE INTO build_runs (model, started_at, full_rebuild, status, updated_at) "
+            "VALUES (?, ?, ?, 'running', ?);",
+            (model, now, int(full_rebuild), now),
+        )
+        return now, full_rebuild, False
+
+    def finish_run(self, model: str):
+        """Marks the model's run complete; the next build starts a new one."""
+        self._con.execute(
+            "UPDATE build_runs SET status = 'complete', updated_at = ? WHERE model = ?;", (time.time(), model)
+        )
+
+    def committed_since(self, model: str, since: float) -> int:
+        """Number of the model's embeddings written or reused since ``since``."""
+        return self._con.execute(
+            "SELECT COUNT(*) FROM chunk_embeddings WHERE model = ? AND last_used >= ?;", (model, since)
+        ).fetchone()[0]
+
+    def get_many(self, model: str, texts: list[str], used_since: float | None = None) -> list:
+        """Returns the stored embedding (float32 array) or None per text and marks the
+        hits as used by this build. With ``used_since`` only rows written or reused since
+        then count as hits (resuming a full rebuild).
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        now = time.time()
+        since = float("-inf") if used_since is None else used_since
+        for i in range(0, len(keys), _LOOKUP_BATCH):
+            part = keys[i:i + _LOOKUP_BATCH]
+            marks = ",".join("?" * len(part))
+            hits = self._con.execute(
+                f"SELECT key, embedding FROM chunk_embeddings WHERE key IN ({marks}) AND last_used >= ?;",
+                [*part, since],
+            ).fetchall()
+            found.update(hits)
+            hit_keys = [key for key, _ in hits]
+            if hit_keys:
+                self._con.execute(
+                    f"UPDATE chunk_embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hit_keys))});",
+                    [now, *hit_keys],
+                )
+        return [
+            np.frombuffer(found[key], dtype=np.float32) if key in found else None for key in keys
+        ]
+
+    def put_many(self, model: str, texts: list[str], embeddings: list):
+        """Stores the embeddings of a batch in one transaction."""
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows.append((cache_key(model, text), model, len(blob) // 4, blob, now))
+        self._con.execute("BEGIN;")
+        try:
+            self._con.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (key, model, dim, embedding, last_used) "
+                "VALUES (?, ?, ?, ?, ?);",
+                rows,
+            )
+            self._con.execute("COMMIT;")
+        except sqlite3.Error:
+            self._con.execute("ROLLBACK;")
+            raise
+
+    def prune(self, model: str, used_since: float) -> int:
+        """Deletes the model's rows not used since ``used_since``; returns how many."""
+        cursor = self._con.execute(
+            "DELETE FROM chunk_embeddings WHERE model = ? AND last_used < ?;", (model, used_since)
+        )
+        return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self._con.execute("SELECT COUNT(*) FROM chunk_embeddings;").fetchone()[0]
+
+    def close(self):
+        self._con.close()
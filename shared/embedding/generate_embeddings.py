@@ -8,11 +8,19 @@ sys.path.insert(0, str(_project_root))
 
 import json
 import argparse
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
-from openai import OpenAI
+from openai import APIConnectionError, APIStatusError, OpenAI
 from tqdm import tqdm
 
 from shared.config_loader import load_config_with_substitution
+from shared.embedding.embedding_store import EmbeddingStore
 
 
 
@@ -20,6 +28,13 @@ from shared.config_loader import load_config_with_substitution
 MAX_SERVER_URL = "http://localhost:8000/v1"
 MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
 BATCH_SIZE = 64
+MAX_IN_FLIGHT = 4  # Concurrent embeddings requests against MAX
+MAX_RETRIES = 5  # Retries per failed batch (connection errors, 429 and 5xx responses)
+RETRY_BACKOFF_S = 1.0  # First retry delay; doubles per attempt, with jitter
+RETRY_BACKOFF_MAX_S = 30.0
+MIN_COVERAGE = 1.0  # Fail the build if fewer chunks than this share end up embedded
+ROW_GROUP_SIZE = 4096  # Embeddings per Parquet row group
+EMBEDDINGS_FILE = "chunk_embeddings.parquet"  # In shared/build/embeddings/{mcp_name}/
 # --- End Defaults ---
 
 def check_max_server(server_url):
@@ -45,72 +60,224 @@ def get_jsonl_files(directory):
             if file.endswith(".jsonl"):
                 yield os.path.join(root, file)
 
-def process_file(client, input_path, output_path):
-    """
-    Reads a .jsonl file, generates embeddings for the content in batches,
-    and saves them to a new .jsonl file.
+def embedding_text(data):
+    """Text embedded for a chunk: its content with the Title/Section context prepended to
+    help embeddings, or None if the chunk has no content.
     """
-    chunks_to_process = []
-    chunk_ids = []
+    content = data.get("content")
+    if not content or not content.strip():
+        return None
+    meta = data.get("metadata", {})
+    title = meta.get("title") or ""
+    section = meta.get("section_hierarchy") or []
+    section_path = " > ".join(section) if section else ""
+    if title and section_path:
+        return f"Title: {title}\nSection: {section_path}\n\n{content}"
+    if title:
+        return f"Title: {title}\n\n{content}"
+    if section_path:
+        return f"Section: {section_path}\n\n{content}"
+    return content
 
-    # First pass: read all chunks to process
+def read_chunks(input_path):
+    """Reads a chunk .jsonl file; returns (chunk_id, text, token_count) for every chunk
+    with content.
+    """
+    chunks = []
     with open(input_path, "r", encoding="utf-8") as f_in:
         for line in f_in:
             if line.strip():
                 data = json.loads(line)
-                content = data.get("content")
-                # Only process chunks that have non-empty content
-                if content and content.strip():
-                    # Prepend Title/Section context to help embeddings
-                    meta = data.get("metadata", {})
-                    title = meta.get("title") or ""
-                    section = meta.get("section_hierarchy") or []
-                    section_path = " > ".join(section) if section else ""
-                    if title and section_path:
-                        text = f"Title: {title}\nSection: {section_path}\n\n{content}"
-                    elif title:
-                        text = f"Title: {title}\n\n{content}"
-                    elif section_path:
-                        text = f"Section: {section_path}\n\n{content}"
-                    else:
-                        text = content
-
-                    chunks_to_process.append(text)
-                    chunk_ids.append(data.get("chunk_id", ""))
-
-    if not chunks_to_process:
-        print(f"No processable content found in {input_path}")
-        return
+                text = embedding_text(data)
+                if text is not None:
+                    chunks.append((data.get("chunk_id", ""), text, data.get("token_count") or 0))
+    return chunks
+
+class EmbeddingWriter:
+    """
+    Writes chunk embeddings to one Parquet file with columns chunk_id (string) and
+    embedding (fixed-size list of float32), about 4x smaller than JSON text and readable
+    without parsing (DuckDB read_parquet, memory-mapped Arrow).
+
+    Rows are buffered and written as row groups of ``row_group_size``. The file is
+    written under a temporary name; close() completes it and commit() moves it into place,
+    so an interrupted run never leaves a truncated file behind and a run that is rejected
+    (abort()) keeps the previous file.
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._tmp_path = f"{path}.tmp"
+        self._writer = None
+        self._ids = []
+        self._vectors = []
+
+    def write(self, chunk_ids, embeddings):
+        self._ids.extend(chunk_ids)
+        self._vectors.extend(embeddings)
+        if len(self._ids) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._ids:
+            return
+        matrix = np.asarray(self._vectors, dtype=np.float32)
+        table = pa.table(
+            {
+                "chunk_id": pa.array(self._ids, type=pa.string()),
+                "embedding": pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), matrix.shape[1]),
+            }
+        )
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._tmp_path, table.schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows += len(self._ids)
+        self._ids, self._vectors = [], []
 
-    # Prepare to write embeddings
-    with open(output_path, "w", encoding="utf-8") as f_out:
-        # Process in batches
-        for i in tqdm(range(0, len(chunks_to_process), BATCH_SIZE), desc=f"Embedding {os.path.basename(input_path)}"):
-            batch_texts = chunks_to_process[i:i + BATCH_SIZE]
-            batch_ids = chunk_ids[i:i + BATCH_SIZE]
-
-            # Ensure the batch is not empty
-            if not batch_texts:
-                continue
-
-            try:
-                # Create embeddings for the batch
-                response = client.embeddings.create(
-                    model=MODEL_NAME,
-                    input=batch_texts,
-                )
-
-                # Write embeddings to the output file
-                for chunk_id, embedding_data in zip(batch_ids, response.data):
-                    embedding_dict = {
-                        "chunk_id": chunk_id,
-                        "embedding": embedding_data.embedding
-                    }
-                    f_out.write(json.dumps(embedding_dict) + "\n")
-
-            except Exception as e:
-                print(f"An error occurred while processing a batch from {input_path}: {e}")
-                # Optionally, add error handling here, like skipping the batch or stopping.
+    def close(self):
+        """Writes the remaining rows and completes the temporary file. A run without any
+        embedding still gets an empty file, so once committed the embeddings of an earlier
+        build are not picked up by consolidate_data.py.
+        """
+        self._flush()
+        if self._writer is None:
+            # No vector to take the width from: an empty variable-length list column
+            schema = pa.schema([("chunk_id", pa.string()), ("embedding", pa.list_(pa.float32()))])
+            self._writer = pq.ParquetWriter(self._tmp_path, schema)
+        self._writer.close()
+
+    def commit(self):
+        """Moves the completed file (see close()) into place."""
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discards the temporary file; the file already in place is left untouched."""
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+def pack_batches(input_paths, batch_size=BATCH_SIZE, prepare=None):
+    """Reads the chunk files in order and packs their chunks into full batches across file
+    boundaries (only the last batch may be short). Yields lists of
+    (chunk_id, text, token_count). ``prepare(chunks)``, if given, is called per file and
+    returns the chunks left to embed (e.g. writes those already stored).
+    """
+    batch = []
+    for input_path in input_paths:
+        chunks = read_chunks(input_path)
+        if not chunks:
+            print(f"No processable content found in {input_path}")
+            continue
+        if prepare is not None:
+            chunks = prepare(chunks)
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def _retryable(error):
+    """Connection errors, timeouts, rate limiting and server errors are worth retrying;
+    other errors (e.g. an input the model rejects) would fail again.
+    """
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+def _embed_batch(client, model_name, texts, max_retries=MAX_RETRIES, retry_backoff_s=RETRY_BACKOFF_S):
+    """Embeds one batch, retrying transient failures with exponential backoff and jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return client.embeddings.create(model=model_name, input=texts)
+        except Exception as e:
+            if attempt == max_retries or not _retryable(e):
+                raise
+            delay = min(RETRY_BACKOFF_MAX_S, retry_backoff_s * 2 ** attempt) * random.uniform(0.5, 1.0)
+            tqdm.write(f"Embedding batch failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+def embed_files(
+    client,
+    input_paths,
+    writer,
+    model_name=MODEL_NAME,
+    batch_size=BATCH_SIZE,
+    max_in_flight=MAX_IN_FLIGHT,
+    store=None,
+    stored_since=None,
+    max_retries=MAX_RETRIES,
+    retry_backoff_s=RETRY_BACKOFF_S,
+):
+    """
+    Embeds the chunks of all input files with up to max_in_flight batches in flight against
+    MAX and writes them to ``writer`` (an EmbeddingWriter) as they return, closing it at
+    the end; committing or aborting the file is up to the caller. Failed batches are
+    retried with backoff (max_retries); a batch that still fails is reported and counted in failed_chunks. With an EmbeddingStore, chunks whose exact
+    text was embedded before (since ``stored_since``, if given) are written from the store
+    and only the rest is sent to MAX; every embedded batch is committed to the store.
+
+    Returns throughput stats: total (chunks with content), chunks (embedded by MAX),
+    tokens (as counted by the server, else the chunker's token_count), reused, batches,
+    failed_chunks and seconds.
+    """
+    stats = {"total": 0, "chunks": 0, "tokens": 0, "reused": 0, "batches": 0, "failed_chunks": 0, "seconds": 0.0}
+    progress = tqdm(unit="chunk", desc="Embedding")
+
+    def prepare(chunks):
+        stats["total"] += len(chunks)
+        if store is None:
+            return chunks
+        stored = store.get_many(model_name, [text for _, text, _ in chunks], used_since=stored_since)
+        missing = [chunk for chunk, embedding in zip(chunks, stored) if embedding is None]
+        hits = [(chunk[0], embedding) for chunk, embedding in zip(chunks, stored) if embedding is not None]
+        if hits:
+            writer.write([chunk_id for chunk_id, _ in hits], [embedding for _, embedding in hits])
+            stats["reused"] += len(hits)
+            progress.update(len(hits))
+        return missing
+
+    def finish(future, batch):
+        try:
+            response = future.result()
+            embeddings = [embedding_data.embedding for embedding_data in response.data]
+            if store is not None:
+                store.put_many(model_name, [text for _, text, _ in batch], embeddings)
+            writer.write([chunk_id for chunk_id, _, _ in batch], embeddings)
+            usage = getattr(response, "usage", None)
+            stats["tokens"] += (getattr(usage, "prompt_tokens", 0) or 0) or sum(tokens for _, _, tokens in batch)
+            stats["chunks"] += len(batch)
+        except Exception as e:
+            tqdm.write(f"An error occurred while processing a batch of {len(batch)} chunks from {batch[0][0]}: {e}")
+            stats["failed_chunks"] += len(batch)
+        stats["batches"] += 1
+        progress.update(len(batch))
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed") as pool:
+            in_flight = {}
+            for batch in pack_batches(input_paths, batch_size, prepare):
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future, in_flight.pop(future))
+                texts = [text for _, text, _ in batch]
+                in_flight[pool.submit(_embed_batch, client, model_name, texts, max_retries, retry_backoff_s)] = batch
+            for future in list(in_flight):
+                finish(future, in_flight.pop(future))
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        progress.close()
+    writer.close()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
 
 def main():
     """Main function to generate embeddings for all chunk files.
@@ -133,25 +300,67 @@ def main():
         "--config",
         type=str,
         required=False,
-        help="Path to processing_config.yaml; used for variable substitution",
+        help="Path to processing_config.yaml; used for variable substitution and embedding.model_name",
+    )
+    parser.add_argument(
+        "--model",
+        help=f"Embedding model served by MAX (default: embedding.model_name from --config, else {MODEL_NAME})",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help=f"Chunks per embeddings request (default: embedding.batch_size from --config, else {BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        help=f"Concurrent embeddings requests (default: embedding.max_in_flight from --config, else {MAX_IN_FLIGHT})",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-embed every chunk instead of reusing unchanged ones from the embedding store",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        help=f"Retries per failed batch (default: embedding.max_retries from --config, else {MAX_RETRIES})",
+    )
+    parser.add_argument(
+        "--min-coverage",
+        type=float,
+        help="Fail unless this share of chunks is embedded "
+        f"(default: embedding.min_coverage from --config, else {MIN_COVERAGE})",
     )
     args = parser.parse_args()
 
     # Load config (optional) to resolve project/server roots; paths themselves are
     # currently convention-based under shared/build.
+    config = {}
     if args.config:
-        _ = load_config_with_substitution(args.config)
+        config = load_config_with_substitution(args.config)
+    embed_config = config.get("embedding") or {}
+    model_name = args.model or embed_config.get("model_name") or MODEL_NAME
+    batch_size = args.batch_size or int(embed_config.get("batch_size") or BATCH_SIZE)
+    max_in_flight = args.max_in_flight or int(embed_config.get("max_in_flight") or MAX_IN_FLIGHT)
+    max_retries = args.max_retries if args.max_retries is not None else int(embed_config.get("max_retries", MAX_RETRIES))
+    retry_backoff_s = float(embed_config.get("retry_backoff_s", RETRY_BACKOFF_S))
+    min_coverage = (
+        args.min_coverage if args.min_coverage is not None else float(embed_config.get("min_coverage", MIN_COVERAGE))
+    )
 
     mcp_name = args.mcp_name
     input_dir = os.path.join("shared", "build", "processed_docs", mcp_name, "chunks")
     output_dir = os.path.join("shared", "build", "embeddings", mcp_name)
+    output_path = os.path.join(output_dir, EMBEDDINGS_FILE)
+    store_path = os.path.join("shared", "build", "embedding_store", f"{mcp_name}.sqlite")
 
     # Check if MAX server is running
     print(f"Checking MAX server at {MAX_SERVER_URL}...")
     if not check_max_server(MAX_SERVER_URL):
         print(f"\n❌ ERROR: MAX server is not running at {MAX_SERVER_URL}")
         print("\nPlease start the MAX server before running this script:")
-        print(f"  max serve --model {MODEL_NAME}")
+        print(f"  max serve --model {model_name}")
         print("\nOr run it via pixi:")
         print("  pixi run max-serve")
         print("\nIn MCP environments, the server is typically started automatically by the host.")
@@ -160,7 +369,8 @@ def main():
     
     print(f"✓ MAX server is running at {MAX_SERVER_URL}")
 
-    client = OpenAI(base_url=MAX_SERVER_URL, api_key="EMPTY")
+    # Retries are done per batch with backoff (_embed_batch)
+    client = OpenAI(base_url=MAX_SERVER_URL, api_key="EMPTY", max_retries=0)
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
@@ -173,15 +383,57 @@ def main():
         return
 
     print(f"Found {len(jsonl_files)} files to process.")
+    print(f"Embedding in batches of {batch_size} with up to {max_in_flight} requests in flight")
 
-    for input_path in jsonl_files:
-        file_name = os.path.basename(input_path)
-        output_path = os.path.join(output_dir, file_name.replace(".jsonl", "_embeddings.jsonl"))
-        
-        print(f"\nProcessing {input_path} -> {output_path}")
-        process_file(client, input_path, output_path)
+    store = EmbeddingStore(store_path)
+    writer = EmbeddingWriter(output_path)
+    try:
+        build_start, full_rebuild, resumed = store.begin_run(model_name, full_rebuild=args.full)
+        if resumed:
+            print(
+                f"Resuming the interrupted build started {time.ctime(build_start)}: "
+                f"{store.committed_since(model_name, build_start)} chunks already committed"
+            )
+        stats = embed_files(
+            client, jsonl_files, writer, model_name, batch_size, max_in_flight,
+            store=store,
+            # A full rebuild reuses only what it embedded itself before an interruption
+            stored_since=build_start if full_rebuild else None,
+            max_retries=max_retries,
+            retry_backoff_s=retry_backoff_s,
+        )
+        covered = stats["chunks"] + stats["reused"]
+        coverage = covered / stats["total"] if stats["total"] else 1.0
+        if not stats["failed_chunks"]:
+            pruned = store.prune(model_name, build_start)
+            if pruned:
+                print(f"Pruned {pruned} embeddings of removed or changed chunks from {store_path}")
+        if coverage >= min_coverage:
+            writer.commit()
+            store.finish_run(model_name)
+        else:
+            # Keep the last good embeddings file; the store keeps what this run committed
+            writer.abort()
+    finally:
+        store.close()
 
-    print("\nEmbedding generation complete.")
+    seconds = stats["seconds"] or 1e-9
+    print(
+        f"\nEmbedded {stats['chunks']} chunks ({stats['tokens']} tokens) in {stats['batches']} batches, "
+        f"{stats['seconds']:.1f}s: {stats['chunks'] / seconds:.1f} chunks/s, {stats['tokens'] / seconds:.0f} tokens/s"
+    )
+    print(f"Reused {stats['reused']} unchanged chunks from {store_path}")
+    if stats["failed_chunks"]:
+        print(f"⚠️  {stats['failed_chunks']} chunks failed to embed")
+    if coverage < min_coverage:
+        print(
+            f"\n❌ ERROR: only {covered}/{stats['total']} chunks ({coverage:.1%}) were embedded, "
+            f"below the required {min_coverage:.1%}"
+        )
+        print(f"{output_path} was left as it was.")
+        print("Run the command again to resume: committed batches are kept and only the rest is embedded.")
+        sys.exit(1)
+    print(f"\nEmbedding generation complete: {output_path}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+"""
+Quantized copies of the chunk embeddings for the runtime's two-stage vector search.
+
+Added as extra columns of the indexed table by ``create_indexes.py``:
+
+- ``embedding_int8`` (TINYINT[d]) + ``embedding_scale`` (FLOAT): symmetric scalar
+  quantization of the L2-normalized vector with one scale per row, so
+  ``cosine(q, x) ~= scale * (q_normalized . codes)``; 1 byte per dimension
+- ``embedding_bits`` (UTINYINT[d / 8]): sign bits packed 8 per byte (``np.packbits``
+  order), compared by Hamming distance; 1 bit per dimension
+
+The float32 ``embedding`` column is kept: the runtime rescores the best quantized
+candidates with it (``runtime/vector_index.py::QuantizedVectorIndex``).
+"""
+
+import numpy as np
+import pyarrow as pa
+
+QUANTIZATION_MODES = ("none", "int8", "binary", "all")
+
+
+def _normalized(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def quantize_int8(embeddings: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns (int8 codes, float32 per-row scales) of the L2-normalized rows."""
+    unit = _normalized(np.asarray(embeddings, dtype=np.float32))
+    max_abs = np.abs(unit).max(axis=1)
+    max_abs[max_abs == 0] = 1.0
+    codes = np.clip(np.rint(unit * (127.0 / max_abs[:, None])), -127, 127).astype(np.int8)
+    scales = (max_abs / 127.0).astype(np.float32)
+    return codes, scales
+
+
+def quantize_binary(embeddings: np.ndarray) -> np.ndarray:
+    """Returns the sign bits of each row packed into uint8 (d / 8 bytes per row)."""
+    return np.packbits(np.asarray(embeddings) > 0, axis=1)
+
+
+def _fixed_size_list(matrix: np.ndarray) -> pa.FixedSizeListArray:
+    return pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), matrix.shape[1])
+
+
+def add_quantized_columns(con, table_name: str, mode: str = "all") -> dict:
+    """Adds the quantized columns selected by ``mode`` ('int8', 'binary' or 'all') to the
+    freshly materialized ``table_name``. Must run before the table's indexes are created,
+    since the table is rebuilt.
+
+    Returns:
+        Row count, dimension and the in-memory size of each representation in bytes
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}', expected one of {QUANTIZATION_MODES}")
+    data = con.execute(f"SELECT chunk_id, embedding FROM {table_name} ORDER BY chunk_id;").fetchnumpy()
+    n = len(data["chunk_id"])
+    dim = len(data["embedding"][0]) if n else 0
+    stats = {"rows": n, "dim": dim, "float32_bytes": n * dim * 4}
+    if mode == "none" or n == 0:
+        return stats
+
+    matrix = np.empty((n, dim), dtype=np.float32)
+    for i, emb in enumerate(data["embedding"]):
+        matrix[i] = emb
+    columns = {"chunk_id": pa.array([str(c) for c in data["chunk_id"]])}
+    if mode in ("int8", "all"):
+        codes, scales = quantize_int8(matrix)
+        columns["embedding_int8"] = _fixed_size_list(codes)
+        columns["embedding_scale"] = pa.array(scales)
+        stats["int8_bytes"] = codes.nbytes + scales.nbytes
+    if mode in ("binary", "all"):
+        bits = quantize_binary(matrix)
+        columns["embedding_bits"] = _fixed_size_list(bits)
+        stats["binary_bytes"] = bits.nbytes
+
+    con.register("quantized_embeddings", pa.table(columns))
+    try:
+        added = ", ".join(f"q.{name}" for name in columns if name != "chunk_id")
+        con.execute(
+            f"""
+            CREATE OR REPLACE TABLE {table_name} AS
+            SELECT t.*, {added}
+            FROM {table_name} AS t
+            JOIN quantized_embeddings AS q ON q.chunk_id = t.chunk_id
+            ORDER BY t.chunk_id;
+            """
+        )
+    finally:
+        con.unregister("quantized_embeddings")
+    return stats
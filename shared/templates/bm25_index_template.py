@@ -0,0 +1,166 @@
+"""
+Memory-mapped BM25 inverted index for in-process full-text search.
+
+Reads the index directory written by ``shared/embedding/bm25_index.py`` at build time
+(``create_indexes.py``). Query cost depends on the postings of the query terms only, not
+on the number of chunks: per-field (title/content) BM25 contributions are computed for
+the touched postings and top-k is found with MaxScore pruning using the per-term upper
+bounds stored in the index.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+SUPPORTED_FORMAT_VERSION = 1
+
+
+def _s_stem(token: str) -> str:
+    # Must match shared/embedding/bm25_index.py::s_stem
+    if len(token) > 3 and token.endswith("ies") and not token.endswith(("eies", "aies")):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("es") and not token.endswith(("aes", "ees", "oes")):
+        return token[:-1]
+    if len(token) > 2 and token.endswith("s") and not token.endswith(("us", "ss")):
+        return token[:-1]
+    return token
+
+
+class BM25Index:
+    """Read-only BM25 index over the title and content fields of a docs table."""
+
+    def __init__(self, index_dir: str):
+        meta_path = os.path.join(index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"BM25 index not found at {index_dir}. Please run the indexing script first.")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != SUPPORTED_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported BM25 index format {self.meta.get('format_version')} in {index_dir}"
+            )
+        self.index_dir = index_dir
+        self.k1 = float(self.meta["k1"])
+        self.b = float(self.meta["b"])
+        self._pattern = re.compile(self.meta["token_pattern"])
+        self._stem = _s_stem if self.meta.get("stemmer") == "s" else (lambda tok: tok)
+        self._stopwords = frozenset(self.meta.get("stopwords", []))
+
+        with open(os.path.join(index_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            self._vocab = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(index_dir, "chunk_ids.json"), "r", encoding="utf-8") as f:
+            self.chunk_ids: list[str] = json.load(f)
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+        self._offsets = load("offsets")
+        self._postings = load("postings")
+        self._title_tf = load("title_tf")
+        self._content_tf = load("content_tf")
+        self._title_len = load("title_len")
+        self._content_len = load("content_len")
+        self._title_idf = load("title_idf")
+        self._content_idf = load("content_idf")
+        self._title_max = load("title_max")
+        self._content_max = load("content_max")
+        self._avg_title_len = max(float(self.meta["avg_title_len"]), 1e-9)
+        self._avg_content_len = max(float(self.meta["avg_content_len"]), 1e-9)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def tokenize(self, text: str) -> list[str]:
+        """Tokenizes text exactly like the build step did."""
+        return [
+            self._stem(tok) for tok in self._pattern.findall(text.lower()) if tok not in self._stopwords
+        ]
+
+    def _term_scores(self, term_id: int, title_weight: float, content_weight: float):
+        """Returns (doc positions, weighted BM25 contributions) for one term's postings."""
+        lo, hi = int(self._offsets[term_id]), int(self._offsets[term_id + 1])
+        docs = np.asarray(self._postings[lo:hi])
+        scores = np.zeros(hi - lo, dtype=np.float32)
+        for weight, tf_arr, len_arr, avg_len, idf in (
+            (title_weight, self._title_tf, self._title_len, self._avg_title_len, self._title_idf),
+            (content_weight, self._content_tf, self._content_len, self._avg_content_len, self._content_idf),
+        ):
+            if weight == 0:
+                continue
+            tf = np.asarray(tf_arr[lo:hi], dtype=np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * len_arr[docs] / avg_len)
+            scores += weight * float(idf[term_id]) * tf * (self.k1 + 1.0) / (tf + norm)
+        return docs, scores
+
+    def search_many(self, query_texts: list[str], limit: int, title_weight: float = 2.0, content_weight: float = 1.0):
+        """Runs several queries, computing the scored postings of each distinct term once."""
+        shared: dict[int, tuple] = {}
+        return [
+            self.search(q, limit, title_weight=title_weight, content_weight=content_weight, _term_cache=shared)
+            for q in query_texts
+        ]
+
+    def search(
+        self,
+        query_text: str,
+        limit: int,
+        title_weight: float = 2.0,
+        content_weight: float = 1.0,
+        _term_cache: dict | None = None,
+    ):
+        """Returns up to ``limit`` (chunk_id, score) tuples ordered by descending score.
+
+        MaxScore: terms are visited by decreasing upper bound. Once the k-th best partial
+        score reaches the summed upper bounds of the unvisited terms, no unseen document can
+        enter the top-k, so the remaining terms only update existing candidates (binary
+        search into their postings) and candidates that can no longer reach the threshold
+        are dropped.
+        """
+        term_ids = list(dict.fromkeys(t for t in (self._vocab.get(tok) for tok in self.tokenize(query_text)) if t is not None))
+        if not term_ids or limit <= 0:
+            return []
+
+        upper = {
+            t: title_weight * float(self._title_max[t]) + content_weight * float(self._content_max[t])
+            for t in term_ids
+        }
+        term_ids.sort(key=lambda t: upper[t], reverse=True)
+        remaining_ub = [0.0] * (len(term_ids) + 1)
+        for i in range(len(term_ids) - 1, -1, -1):
+            remaining_ub[i] = remaining_ub[i + 1] + upper[term_ids[i]]
+
+        cand_docs = np.empty(0, dtype=np.int32)
+        cand_scores = np.empty(0, dtype=np.float32)
+        for i, term_id in enumerate(term_ids):
+            threshold = (
+                float(np.partition(cand_scores, -limit)[-limit]) if len(cand_scores) >= limit else 0.0
+            )
+            if _term_cache is not None and term_id in _term_cache:
+                docs, scores = _term_cache[term_id]
+            else:
+                docs, scores = self._term_scores(term_id, title_weight, content_weight)
+                if _term_cache is not None:
+                    _term_cache[term_id] = (docs, scores)
+            if len(cand_docs) >= limit and threshold >= remaining_ub[i]:
+                # Non-essential term: only candidates already seen can still make the top-k
+                pos = np.searchsorted(docs, cand_docs)
+                pos_clipped = np.minimum(pos, len(docs) - 1)
+                hit = (pos < len(docs)) & (docs[pos_clipped] == cand_docs)
+                cand_scores[hit] += scores[pos_clipped[hit]]
+                keep = cand_scores + remaining_ub[i + 1] >= threshold
+                cand_docs, cand_scores = cand_docs[keep], cand_scores[keep]
+            else:
+                merged_docs = np.concatenate([cand_docs, docs])
+                merged_scores = np.concatenate([cand_scores, scores])
+                cand_docs, inverse = np.unique(merged_docs, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=merged_scores).astype(np.float32)
+
+        if len(cand_scores) > limit:
+            top = np.argpartition(cand_scores, -limit)[-limit:]
+        else:
+            top = np.arange(len(cand_scores))
+        # Descending score, ties broken by document position for deterministic output
+        order = top[np.lexsort((cand_docs[top], -cand_scores[top]))]
+        return [(self.chunk_ids[int(cand_docs[j])], float(cand_scores[j])) for j in order]
@@ -12,7 +12,9 @@ Run (dev inspector): mcp dev {mcp_name}_mcp_server.py
 """
 
 from typing import List, Optional, AsyncIterator, Any
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import json
 import sys
 from pathlib import Path
 import os
@@ -57,6 +59,7 @@ except ImportError:
 # Import search module
 # Note: This import will work once the template is copied to a server's runtime directory
 import search as search_mod  # noqa: E402
+from metrics import prometheus_text, write_textfile  # noqa: E402
 HybridSearcher = search_mod.HybridSearcher
 TOP_K = search_mod.TOP_K
 
@@ -68,6 +71,13 @@ class SearchResult(BaseModel):
     url: str
     section_hierarchy: Optional[List[str]] = Field(default=None)
     snippet: str
+    # Search branches left out because they missed the deadline ("embed", "vss")
+    degraded: Optional[List[str]] = Field(default=None)
+
+
+class SearchGroup(BaseModel):
+    query: str
+    results: List[SearchResult]
 
 
 class AppState:
@@ -149,6 +159,38 @@ def _ensure_max_running(
     return proc  # may not be ready yet; caller can still proceed with FTS-only fallback
 
 
+def _write_metrics(searcher: Any, path: str, server_name: str) -> None:
+    try:
+        write_textfile(path, prometheus_text(searcher.stats(), labels={"server": server_name}))
+    except Exception as e:
+        print(f"Warning: Failed to write metrics to {path}: {e}", file=sys.stderr)
+
+
+async def _export_metrics(searcher: Any, path: str, interval_s: float, server_name: str) -> None:
+    """Rewrites the Prometheus text file every interval_s seconds until cancelled."""
+    while True:
+        _write_metrics(searcher, path, server_name)
+        await asyncio.sleep(interval_s)
+
+
+async def _warm_up(state: "AppState", base_url: str, model_name: str, auto_start: bool) -> None:
+    """Background half of startup: loads the extensions and vector engine while MAX is
+    checked/started, then switches vector search on. Searches are FTS-only meanwhile.
+    """
+    warmed, max_proc = await asyncio.gather(
+        asyncio.to_thread(state.searcher.warm_up),
+        asyncio.to_thread(_ensure_max_running, base_url, model_name, auto_start=auto_start),
+        return_exceptions=True,
+    )
+    if isinstance(max_proc, subprocess.Popen):
+        state.max_proc = max_proc
+    if isinstance(warmed, BaseException):
+        print(f"Warning: Warm-up failed, keeping FTS-only search: {warmed}", file=sys.stderr)
+        return
+    # Also when MAX is not up yet: failed embeddings still fall back to FTS per query
+    state.searcher.enable_vector_search()
+
+
 @asynccontextmanager
 async def app_lifespan(server: FastMCP) -> AsyncIterator[AppState]:
     """Startup/shutdown lifecycle to manage shared searcher."""
@@ -166,6 +208,7 @@ async def app_lifespan(server: FastMCP) -> AsyncIterator[AppState]:
     db_config = config.get("database", {})
     embed_config = config.get("embedding", {})
     search_config = config.get("search", {})
+    metrics_config = config.get("metrics") or {}
     
     # Resolve DB path relative to runtime dir if not absolute
     raw_db_path = db_config.get("path", os.getenv("{{MCP_NAME_UPPER}}_DB_PATH", "{{MCP_NAME}}.db"))
@@ -189,26 +232,91 @@ async def app_lifespan(server: FastMCP) -> AsyncIterator[AppState]:
         auto_start = bool(auto_start_val)
         
     embed_cache_size = search_config.get("embed_cache_size", int(os.getenv("EMBED_CACHE_SIZE", "512")))
-
-    # Optionally auto-start MAX embeddings server if not reachable
-    max_proc = _ensure_max_running(base_url, model_name, auto_start=auto_start)
+    execution_mode = search_config.get("execution_mode", search_mod.EXECUTION_MODE)
+    fts_engine = search_config.get("fts_engine", search_mod.FTS_ENGINE)
+    vector_engine = search_config.get("vector_engine", search_mod.VECTOR_ENGINE)
+    vector_self_check = bool(search_config.get("vector_self_check", False))
+    vector_quantization = search_config.get("vector_quantization", search_mod.VECTOR_QUANTIZATION)
+    vector_rescore_factor = int(search_config.get("vector_rescore_factor", search_mod.VECTOR_RESCORE_FACTOR))
+    hnsw_ef_search = int(search_config.get("hnsw_ef_search") or search_mod.HNSW_EF_SEARCH)
+    worker_threads = int(search_config.get("worker_threads", search_mod.WORKER_THREADS))
+    db_pool_size = int(search_config.get("db_pool_size", search_mod.DB_POOL_SIZE))
+    result_cache_size = int(search_config.get("result_cache_size", search_mod.RESULT_CACHE_SIZE))
+    result_cache_ttl_s = float(search_config.get("result_cache_ttl_s", search_mod.RESULT_CACHE_TTL_S))
+    snippet_chars = int(search_config.get("snippet_chars", search_mod.SNIPPET_CHARS))
+    snippet_token_budget = int(search_config.get("snippet_token_budget", search_mod.SNIPPET_TOKEN_BUDGET))
+    persistent_embed_cache_size = int(
+        search_config.get("persistent_embed_cache_size", search_mod.PERSISTENT_EMBED_CACHE_SIZE)
+    )
+    background_warmup = bool(search_config.get("background_warmup", search_mod.BACKGROUND_WARMUP))
+    deadline_ms = int(search_config.get("deadline_ms", search_mod.SEARCH_DEADLINE_MS))
+    embed_timeout_s = float(embed_config.get("timeout_s", search_mod.EMBED_TIMEOUT_S))
+    embed_connect_timeout_s = float(embed_config.get("connect_timeout_s", search_mod.EMBED_CONNECT_TIMEOUT_S))
+    embed_breaker_threshold = int(embed_config.get("breaker_failure_threshold", search_mod.EMBED_BREAKER_THRESHOLD))
+    embed_breaker_reset_s = float(embed_config.get("breaker_reset_s", search_mod.EMBED_BREAKER_RESET_S))
+
+    # Optionally auto-start MAX embeddings server if not reachable (with background_warmup
+    # after startup, together with loading the extensions and vector engine)
+    max_proc = None
+    if not background_warmup:
+        max_proc = _ensure_max_running(base_url, model_name, auto_start=auto_start)
 
     searcher = HybridSearcher(
         db_path=db_path,
         table_name=table_name,
         max_server_url=base_url,
         model_name=model_name,
-        embed_cache_size=embed_cache_size
-    )  # opens read-only DuckDB, loads vss+fts
+        embed_cache_size=embed_cache_size,
+        execution_mode=execution_mode,
+        fts_engine=fts_engine,
+        vector_engine=vector_engine,
+        vector_self_check=vector_self_check,
+        vector_quantization=vector_quantization,
+        vector_rescore_factor=vector_rescore_factor,
+        hnsw_ef_search=hnsw_ef_search,
+        worker_threads=worker_threads,
+        db_pool_size=db_pool_size,
+        result_cache_size=result_cache_size,
+        result_cache_ttl_s=result_cache_ttl_s,
+        snippet_chars=snippet_chars,
+        snippet_token_budget=snippet_token_budget,
+        persistent_embed_cache_size=persistent_embed_cache_size,
+        background_warmup=background_warmup,
+        embed_timeout_s=embed_timeout_s,
+        embed_connect_timeout_s=embed_connect_timeout_s,
+        embed_breaker_threshold=embed_breaker_threshold,
+        embed_breaker_reset_s=embed_breaker_reset_s,
+        deadline_ms=deadline_ms,
+    )  # opens read-only DuckDB, loads vss+fts unless warming up in the background
+    state = AppState(searcher=searcher, max_proc=max_proc)
+    warmup = None
+    if background_warmup:
+        warmup = asyncio.create_task(_warm_up(state, base_url, model_name, auto_start))
+
+    # Optionally export metrics for the node_exporter textfile collector
+    textfile = metrics_config.get("prometheus_textfile")
+    exporter = None
+    if textfile:
+        interval_s = float(metrics_config.get("prometheus_interval_s", 15))
+        exporter = asyncio.create_task(_export_metrics(searcher, textfile, interval_s, server.name))
     try:
-        yield AppState(searcher=searcher, max_proc=max_proc)
+        yield state
     finally:
+        if warmup is not None:
+            # Cancelling does not stop the warm-up thread; aclose() waits for it
+            warmup.cancel()
+            with suppress(asyncio.CancelledError):
+                await warmup
+        if exporter is not None:
+            exporter.cancel()
+            _write_metrics(searcher, textfile, server.name)
         try:
-            searcher.close()
+            await searcher.aclose()
         except Exception:
             pass
         # Clean up spawned MAX process if we started it
         try:
+            max_proc = state.max_proc
             if isinstance(max_proc, subprocess.Popen) and max_proc.poll() is None:  # type: ignore[arg-type]
                 max_proc.terminate()
         except Exception:
@@ -218,47 +326,72 @@ async def app_lifespan(server: FastMCP) -> AsyncIterator[AppState]:
 mcp = FastMCP("{{DOC_TYPE_TITLE}}", lifespan=app_lifespan)
 
 
-def _make_results(searcher: Any, query: str, k: int = TOP_K) -> List[SearchResult]:
-    ids = searcher.hybrid_search(query, k=k)
-    rows = searcher.get_results_by_ids(ids)
-    out: List[SearchResult] = []
-    for chunk_id, title, content, url, section_hierarchy in rows:
-        snippet = (content[:500] + ("…" if len(content) > 500 else "")).replace(
-            "\n", " "
-        )
-        out.append(
-            SearchResult(
-                chunk_id=str(chunk_id),
-                title=title or "",
-                url=url or "",
-                section_hierarchy=section_hierarchy if section_hierarchy else None,
-                snippet=snippet,
-            )
-        )
-    return out
+def _to_result(row: Any, degraded: Optional[List[str]] = None) -> SearchResult:
+    # search() rows carry the query-aware snippet (built in SQL) as their content
+    chunk_id, title, snippet, url, section_hierarchy = row
+    return SearchResult(
+        chunk_id=str(chunk_id),
+        title=title or "",
+        url=url or "",
+        section_hierarchy=section_hierarchy if section_hierarchy else None,
+        snippet=snippet,
+        degraded=degraded,
+    )
+
+
+async def _make_results(
+    searcher: Any, query: str, k: int = TOP_K, deadline_ms: Optional[int] = None
+) -> List[SearchResult]:
+    timings: dict = {}
+    rows = await searcher.asearch(query, k=k, timings=timings, deadline_ms=deadline_ms)
+    return [_to_result(row, timings.get("degraded")) for row in rows]
 
 
 @mcp.tool()
-def search(
-    query: str, k: int = TOP_K, ctx: Optional[Context] = None
+async def search(
+    query: str, k: int = TOP_K, deadline_ms: Optional[int] = None, ctx: Optional[Context] = None
 ) -> List[SearchResult]:
     """Hybrid search over {{DOC_TYPE}} documentation. Returns top-k results with snippets.
 
     Args:
       query: The natural language query.
       k: Number of results to return.
+      deadline_ms: Latency budget in milliseconds (default: the server's; 0 = none). Results
+        that missed it come from keyword search alone and are marked `degraded`.
+    """
+    assert ctx is not None
+    state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
+    return await _make_results(state.searcher, query, k=k, deadline_ms=deadline_ms)
+
+
+@mcp.tool()
+async def search_many(
+    queries: List[str], k: int = TOP_K, ctx: Optional[Context] = None
+) -> List[SearchGroup]:
+    """Hybrid search for several related queries in one call. Returns top-k results per query.
+
+    Cheaper than calling `search` repeatedly: all queries are embedded in one request and
+    scored as a batch.
+
+    Args:
+      queries: The natural language queries.
+      k: Number of results to return per query.
     """
     assert ctx is not None
     state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
-    return _make_results(state.searcher, query, k=k)
+    grouped = await state.searcher.asearch_many(queries, k=k)
+    return [
+        SearchGroup(query=q, results=[_to_result(row) for row in rows])
+        for q, rows in zip(queries, grouped)
+    ]
 
 
 @mcp.resource("{{MCP_NAME}}://search/{q}")
-def search_resource(q: str, ctx: Optional[Context] = None) -> str:
+async def search_resource(q: str, ctx: Optional[Context] = None) -> str:
     """Dynamic resource that returns a markdown view of top results for a query."""
     assert ctx is not None
     state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
-    results = _make_results(state.searcher, q, k=TOP_K)
+    results = await _make_results(state.searcher, q, k=TOP_K)
     lines: List[str] = [f"# Search results for: {q}"]
     for i, r in enumerate(results, start=1):
         path = " > ".join(r.section_hierarchy) if r.section_hierarchy else ""
@@ -271,11 +404,11 @@ def search_resource(q: str, ctx: Optional[Context] = None) -> str:
 
 
 @mcp.resource("{{MCP_NAME}}://chunk/{chunk_id}")
-def chunk_resource(chunk_id: str, ctx: Optional[Context] = None) -> str:
+async def chunk_resource(chunk_id: str, ctx: Optional[Context] = None) -> str:
     """Return a single chunk by id as markdown (title, section, content, url)."""
     assert ctx is not None
     state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
-    rows = state.searcher.get_results_by_ids([chunk_id])
+    rows = await state.searcher.aget_results_by_ids([chunk_id])
     if not rows:
         return f"Chunk {chunk_id} not found"
     cid, title, content, url, section_hierarchy = rows[0]
@@ -289,6 +422,27 @@ def chunk_resource(chunk_id: str, ctx: Optional[Context] = None) -> str:
     return "\n\n".join(parts)
 
 
+@mcp.tool()
+async def stats(ctx: Optional[Context] = None) -> dict:
+    """Search latency and cache statistics since the server started.
+
+    Returns per-stage latency histograms in milliseconds (count, mean, p50/p95/p99, max),
+    counters (searches, embedding failures that fell back to FTS only, FTS path taken,
+    cache hits and misses), cache hit rates and the search engines in use.
+    """
+    assert ctx is not None
+    state: AppState = ctx.request_context.lifespan_context  # type: ignore[assignment]
+    return state.searcher.stats()
+
+
+@mcp.resource("{{MCP_NAME}}://stats")
+async def stats_resource() -> str:
+    """Search latency and cache statistics as JSON (same payload as the stats tool)."""
+    # Static resources take no arguments, so the context comes from the server
+    state: AppState = mcp.get_context().request_context.lifespan_context  # type: ignore[assignment]
+    return json.dumps(state.searcher.stats(), indent=2)
+
+
 if __name__ == "__main__":
     # Allow direct execution for convenience (e.g., python {mcp_name}_mcp_server.py)
     mcp.run()
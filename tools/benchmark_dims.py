@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Latency / recall benchmark for reduced embedding dimensions.
+
+Reduces the embeddings of a built database in memory with the same code as
+``create_indexes.py --reduce-dim`` (PCA and Matryoshka truncation to each requested
+width), loads each variant into the server runtime's ``NumpyVectorIndex`` and reports
+memory, recall@k against the full-width exact top-k and p50/p95 search latency.
+
+Queries are midpoints of random pairs of stored embeddings (fixed seed), projected like
+the runtime projects query embeddings, so no embedding server is needed. Run it once per
+database to compare encoders of different widths.
+
+Usage:
+    python tools/benchmark_dims.py --mcp-name mojo
+    python tools/benchmark_dims.py --mcp-name duckdb --doc-type docs --dims 512,384,256,128
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_PROJECT_ROOT))
+
+from shared.embedding.dim_reduction import REDUCTION_METHODS, reduce_matrix  # noqa: E402
+
+
+def _percentile_ms(samples: list[float], pct: float) -> float:
+    return float(np.percentile(samples, pct)) * 1000.0 if samples else 0.0
+
+
+def _index_for(index_cls, chunk_ids: list[str], matrix: np.ndarray):
+    """Builds the runtime's vector index over ``matrix`` through an in-memory DuckDB table."""
+    con = duckdb.connect()
+    con.register(
+        "variant",
+        pa.table(
+            {
+                "chunk_id": pa.array(chunk_ids),
+                "embedding": pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), matrix.shape[1]),
+            }
+        ),
+    )
+    con.execute(f"CREATE TABLE docs AS SELECT chunk_id, CAST(embedding AS FLOAT[{matrix.shape[1]}]) AS embedding FROM variant;")
+    try:
+        return index_cls(con, "docs")
+    finally:
+        con.close()
+
+
+def run_variant(index, queries: np.ndarray, k: int, truth=None) -> dict:
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k))
+        latencies.append(time.perf_counter() - start)
+    recall = 1.0
+    if truth is not None:
+        hits = sum(len({c for c, _ in got} & {c for c, _ in exp}) for got, exp in zip(results, truth))
+        recall = hits / max(1, sum(len(exp) for exp in truth))
+    return {
+        "bytes": index.nbytes,
+        "recall": recall,
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reduced embedding dimension benchmark")
+    parser.add_argument("--mcp-name", default="mojo", help="MCP server name (e.g., 'mojo', 'duckdb')")
+    parser.add_argument("--doc-type", default="manual", help="Documentation type (e.g., 'manual', 'docs')")
+    parser.add_argument("--db", help="Database path (default: servers/{mcp}-{doc}-mcp/runtime/{mcp}_{doc}_mcp.db)")
+    parser.add_argument("--table", help="Table name (default: {mcp}_docs_indexed)")
+    parser.add_argument("--dims", default="384,256", help="Comma-separated target dimensions")
+    parser.add_argument("--methods", default=",".join(REDUCTION_METHODS), help="Comma-separated reduction methods")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("-k", type=int, default=10, help="Results per search")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the query set")
+    args = parser.parse_args()
+
+    runtime_dir = _PROJECT_ROOT / "servers" / f"{args.mcp_name}-{args.doc_type}-mcp" / "runtime"
+    if not runtime_dir.is_dir():
+        raise SystemExit(f"Runtime directory not found: {runtime_dir}")
+    sys.path.insert(0, str(runtime_dir))
+    from vector_index import NumpyVectorIndex  # noqa: E402  (the server's own runtime module)
+
+    db_path = args.db or str(runtime_dir / f"{args.mcp_name}_{args.doc_type}_mcp.db")
+    table_name = args.table or f"{args.mcp_name}_docs_indexed"
+    con = duckdb.connect(db_path, read_only=True)
+    try:
+        full = NumpyVectorIndex(con, table_name)
+    finally:
+        con.close()
+    n = len(full.chunk_ids)
+    if n == 0:
+        raise SystemExit(f"Table {table_name} is empty")
+    # The stored (unit) rows stand in for raw model embeddings
+    matrix = np.asarray(full.matrix, dtype=np.float32)
+    rng = np.random.default_rng(args.seed)
+    queries = matrix[rng.integers(0, n, args.queries)] + matrix[rng.integers(0, n, args.queries)]
+
+    print(f"🔥 {len(queries)} queries, k={args.k}, {n} chunks x {full.dim} dims")
+    print(f"{'variant':<16} {'memory MB':>10} {'ratio':>6} {'kept':>6} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    baseline = run_variant(full, queries, args.k)
+    truth = baseline.pop("results")
+
+    def report(name: str, row: dict, kept: float):
+        print(
+            f"{name:<16} {row['bytes'] / 1e6:>10.2f} {baseline['bytes'] / row['bytes']:>5.1f}x {kept:>6.1%} "
+            f"{row['recall']:>9.3f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}"
+        )
+
+    report(f"full {full.dim}", baseline, 1.0)
+    for method in args.methods.split(","):
+        for dim in (int(d) for d in args.dims.split(",")):
+            if dim >= full.dim:
+                continue
+            reduced, projection = reduce_matrix(matrix, dim, method)
+            if projection["components"] is not None:
+                projected = queries @ projection["components"].T
+            else:
+                projected = queries[:, :dim]
+            index = _index_for(NumpyVectorIndex, full.chunk_ids, reduced)
+            report(f"{method} {dim}", run_variant(index, projected, args.k, truth), projection["energy_kept"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Memory / recall / latency benchmark for the runtime's quantized vector search.
+
+Compares the in-process vector engines of a server's runtime on the same query set:
+exact float32 (``NumpyVectorIndex``) against the int8 and binary first passes of
+``QuantizedVectorIndex`` at several rescore factors. Recall@k is measured against the
+exact float32 top-k. The database must have been built with
+``create_indexes.py --quantize all`` (the default).
+
+Queries are midpoints of random pairs of stored embeddings (fixed seed), so no embedding
+server is needed and queries do not coincide with a stored chunk.
+
+Usage:
+    python tools/benchmark_quantization.py --mcp-name mojo
+    python tools/benchmark_quantization.py --mcp-name duckdb --doc-type docs --rescore-factors 1,2,4,8
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import duckdb
+import numpy as np
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _percentile_ms(samples: list[float], pct: float) -> float:
+    return float(np.percentile(samples, pct)) * 1000.0 if samples else 0.0
+
+
+def run_engine(index, queries: np.ndarray, k: int, truth=None) -> dict:
+    """Times one search per query and measures recall@k against ``truth`` when given."""
+    latencies = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k))
+        latencies.append(time.perf_counter() - start)
+    recall = 1.0
+    if truth is not None:
+        hits = sum(len({c for c, _ in got} & {c for c, _ in exp}) for got, exp in zip(results, truth))
+        recall = hits / max(1, sum(len(exp) for exp in truth))
+    return {
+        "bytes": index.nbytes,
+        "recall": recall,
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized vector search benchmark")
+    parser.add_argument("--mcp-name", default="mojo", help="MCP server name (e.g., 'mojo', 'duckdb')")
+    parser.add_argument("--doc-type", default="manual", help="Documentation type (e.g., 'manual', 'docs')")
+    parser.add_argument("--db", help="Database path (default: servers/{mcp}-{doc}-mcp/runtime/{mcp}_{doc}_mcp.db)")
+    parser.add_argument("--table", help="Table name (default: {mcp}_docs_indexed)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("-k", type=int, default=10, help="Results per search")
+    parser.add_argument("--rescore-factors", default="1,2,4,8", help="Comma-separated rescore factors")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the query set")
+    args = parser.parse_args()
+
+    runtime_dir = _PROJECT_ROOT / "servers" / f"{args.mcp_name}-{args.doc_type}-mcp" / "runtime"
+    if not runtime_dir.is_dir():
+        raise SystemExit(f"Runtime directory not found: {runtime_dir}")
+    sys.path.insert(0, str(runtime_dir))
+    from vector_index import NumpyVectorIndex, QuantizedVectorIndex  # noqa: E402  (the server's own runtime module)
+
+    db_path = args.db or str(runtime_dir / f"{args.mcp_name}_{args.doc_type}_mcp.db")
+    table_name = args.table or f"{args.mcp_name}_docs_indexed"
+    con = duckdb.connect(db_path, read_only=True)
+    try:
+        exact = NumpyVectorIndex(con, table_name)
+        n = len(exact.chunk_ids)
+        if n == 0:
+            raise SystemExit(f"Table {table_name} is empty")
+        rng = np.random.default_rng(args.seed)
+        queries = exact.matrix[rng.integers(0, n, args.queries)] + exact.matrix[rng.integers(0, n, args.queries)]
+        factors = [int(f) for f in args.rescore_factors.split(",")]
+
+        print(f"🔥 {len(queries)} queries, k={args.k}, {n} chunks x {exact.dim} dims")
+        print(f"{'engine':<16} {'memory MB':>10} {'ratio':>6} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        baseline = run_engine(exact, queries, args.k)
+        truth = baseline.pop("results")
+
+        def report(name: str, row: dict):
+            print(
+                f"{name:<16} {row['bytes'] / 1e6:>10.2f} {baseline['bytes'] / row['bytes']:>5.1f}x "
+                f"{row['recall']:>9.3f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}"
+            )
+
+        report("float32", baseline)
+        for quantization in ("int8", "binary"):
+            for factor in factors:
+                try:
+                    index = QuantizedVectorIndex(con, table_name, quantization=quantization, rescore_factor=factor)
+                except duckdb.Error as e:
+                    print(f"{quantization:<16} unavailable ({e}); rebuild with create_indexes.py --quantize all")
+                    break
+                report(f"{quantization} x{factor}", run_engine(index, queries, args.k, truth))
+    finally:
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
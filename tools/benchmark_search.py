@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+End-to-end search latency benchmark for the doc servers.
+
+Runs a fixed query set (``tools/benchmark_queries.json``) through each server's runtime
+exactly as the MCP tool does (``HybridSearcher.asearch`` + result serialization) and
+reports, per server:
+
+- startup and time to first response (with ``--background-warmup`` as the server starts:
+  the first search runs FTS-only while the extensions and vector engine load, and the
+  time until vector search is ready is reported separately)
+- cold latency (first pass on a fresh searcher) and warm latency (later passes) as
+  p50/p95/p99 per stage: embed, fts, fts_wait, vss, fused_sql (fusion + payload fetch in
+  one statement) or fusion + fetch (staged mode), serialize, total and end_to_end
+- mean serialized response size (the agent's context cost of a call)
+- throughput and latency under 1..N concurrent callers
+- with ``--deadline-ms``, the share of calls that missed the deadline and were answered
+  from FTS alone (degraded)
+
+Query embeddings come from a deterministic local stub (one fixed pseudo-random vector per
+text, optional simulated latency), so the benchmark runs offline and repeatably. The
+search result cache is disabled so every call runs the pipeline. Results are written as
+JSON (``--output``); ``--compare`` prints the change against an earlier run.
+
+Usage:
+    python tools/benchmark_search.py --output bench.json
+    python tools/benchmark_search.py --servers mojo-manual --concurrency 1,4 --compare bench.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import duckdb
+import numpy as np
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_DEFAULT_QUERIES = Path(__file__).resolve().parent / "benchmark_queries.json"
+SERVERS = ("mojo-manual", "duckdb-docs")
+
+
+class StubEmbeddings:
+    """Offline stand-in for the embeddings endpoint: every text maps to a fixed
+    pseudo-random unit vector seeded by its SHA-256.
+    """
+
+    def __init__(self, dim: int, latency_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+
+    def _vector(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vec = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vec / np.linalg.norm(vec)).tolist()
+
+    def _response(self, texts):
+        return SimpleNamespace(data=[SimpleNamespace(embedding=self._vector(t)) for t in texts])
+
+    def create(self, model, input, **kwargs):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return self._response(input)
+
+
+class AsyncStubEmbeddings(StubEmbeddings):
+    async def create(self, model, input, **kwargs):
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return self._response(input)
+
+
+def _load_runtime(server: str):
+    """Imports a server's own search and MCP server modules (each runtime has its own
+    ``search`` module, so modules of a previously loaded runtime are dropped first).
+    """
+    mcp_name, doc_type = server.split("-", 1)
+    runtime_dir = _PROJECT_ROOT / "servers" / f"{server}-mcp" / "runtime"
+    if not runtime_dir.is_dir():
+        raise SystemExit(f"Runtime directory not found: {runtime_dir}")
+    for path in runtime_dir.glob("*.py"):
+        sys.modules.pop(path.stem, None)
+    sys.path.insert(0, str(runtime_dir))
+    try:
+        search_mod = importlib.import_module("search")
+        server_mod = importlib.import_module(f"{mcp_name}_{doc_type}_mcp_server")
+    finally:
+        sys.path.remove(str(runtime_dir))
+    return search_mod, server_mod, runtime_dir
+
+
+def _stats(samples: list[float]) -> dict:
+    arr = np.asarray(samples, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "p99": float(np.percentile(arr, 99)),
+    }
+
+
+def _stage_stats(calls: list[dict]) -> dict:
+    """Per-stage latency stats over the timings of several calls (stages a call skipped,
+    e.g. vss without an embedding, are left out of that stage's samples).
+    """
+    stages: dict[str, list[float]] = {}
+    for timings in calls:
+        for key, ms in timings.items():
+            if key.endswith("_ms"):
+                stages.setdefault(key[:-3], []).append(ms)
+    return {stage: _stats(samples) for stage, samples in sorted(stages.items())}
+
+
+async def _call(searcher, server_mod, query: str, k: int) -> dict:
+    """One tool call: search plus the server's result serialization."""
+    timings: dict = {}
+    start = time.perf_counter()
+    rows = await searcher.asearch(query, k=k, timings=timings)
+    serialize_start = time.perf_counter()
+    payload = json.dumps([server_mod._to_result(row).model_dump() for row in rows])
+    end = time.perf_counter()
+    timings["serialize_ms"] = (end - serialize_start) * 1000.0
+    timings["response_bytes"] = len(payload.encode("utf-8"))
+    timings["end_to_end_ms"] = (end - start) * 1000.0
+    return timings
+
+
+async def _throughput(searcher, server_mod, queries: list[str], k: int, concurrency: int, rounds: int) -> dict:
+    """Runs ``rounds`` passes over the queries from ``concurrency`` concurrent callers."""
+    work = queries * rounds
+    cursor = iter(range(len(work)))
+    latencies: list[float] = []
+
+    async def caller():
+        for i in cursor:
+            latencies.append((await _call(searcher, server_mod, work[i], k))["end_to_end_ms"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(work),
+        "seconds": elapsed,
+        "qps": len(work) / elapsed,
+        **{f"{key}_ms": value for key, value in _stats(latencies).items() if key != "n"},
+    }
+
+
+async def bench_server(server: str, queries: list[str], args) -> dict:
+    search_mod, server_mod, runtime_dir = _load_runtime(server)
+    mcp_name, doc_type = server.split("-", 1)
+    db_path = (args.db or {}).get(server) or str(runtime_dir / f"{mcp_name}_{doc_type}_mcp.db")
+    table_name = f"{mcp_name}_docs_indexed"
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    start = time.perf_counter()
+    searcher = search_mod.HybridSearcher(
+        db_path=db_path,
+        table_name=table_name,
+        execution_mode=args.mode,
+        fts_engine=args.fts_engine,
+        vector_engine=args.vector_engine,
+        vector_quantization=args.quantization,
+        snippet_chars=args.snippet_chars,
+        snippet_token_budget=args.snippet_token_budget,
+        worker_threads=max(levels),
+        db_pool_size=max(levels) + 1,
+        result_cache_size=0,
+        persistent_embed_cache_size=0,
+        background_warmup=args.background_warmup,
+        deadline_ms=args.deadline_ms,
+    )
+    startup_ms = (time.perf_counter() - start) * 1000.0
+    try:
+        dim = searcher._projection.shape[1] if searcher._projection is not None else searcher.embedding_dim
+        latency_s = args.embed_latency_ms / 1000.0
+        searcher.openai_client.embeddings = StubEmbeddings(dim, latency_s)
+        searcher.async_openai_client.embeddings = AsyncStubEmbeddings(dim, latency_s)
+
+        vector_ready_ms = startup_ms
+        if args.background_warmup:
+            # As the server does: warm up off the loop, answer FTS-only meanwhile
+            warmup = asyncio.create_task(asyncio.to_thread(searcher.warm_up))
+            await _call(searcher, server_mod, queries[0], args.k)
+            first_response_ms = (time.perf_counter() - start) * 1000.0
+            await warmup
+            searcher.enable_vector_search()
+            vector_ready_ms = (time.perf_counter() - start) * 1000.0
+
+        cold = [await _call(searcher, server_mod, q, args.k) for q in queries]
+        if not args.background_warmup:
+            first_response_ms = startup_ms + cold[0]["end_to_end_ms"]
+        warm = [await _call(searcher, server_mod, q, args.k) for _ in range(args.rounds) for q in queries]
+        throughput = [
+            await _throughput(searcher, server_mod, queries, args.k, level, args.throughput_rounds)
+            for level in levels
+        ]
+        return {
+            "db": db_path,
+            "table": table_name,
+            "engines": {
+                "execution_mode": searcher.execution_mode,
+                "fts_engine": searcher.fts_engine,
+                "vector_engine": searcher.vector_engine,
+                "vector_quantization": searcher.vector_quantization,
+                "embedding_dim": searcher.embedding_dim,
+                "snippet_chars": searcher.snippet_chars,
+                "snippet_token_budget": searcher.snippet_token_budget,
+                "background_warmup": searcher.background_warmup,
+                "deadline_ms": searcher.deadline_ms,
+            },
+            "startup_ms": startup_ms,
+            "first_response_ms": first_response_ms,
+            "vector_ready_ms": vector_ready_ms,
+            "response_bytes": float(np.mean([call["response_bytes"] for call in cold])),
+            "degraded_rate": float(np.mean([bool(call.get("degraded")) for call in cold + warm])),
+            "cold": _stage_stats(cold),
+            "warm": _stage_stats(warm),
+            "throughput": throughput,
+        }
+    finally:
+        await searcher.aclose()
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=_PROJECT_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(server: str, result: dict):
+    print(f"\n=== {server} ({', '.join(f'{k}={v}' for k, v in result['engines'].items())})")
+    print(
+        f"startup {result['startup_ms']:.1f} ms, first response {result['first_response_ms']:.1f} ms, "
+        f"vector search ready {result.get('vector_ready_ms', result['startup_ms']):.1f} ms, "
+        f"response {result.get('response_bytes', 0):.0f} bytes, "
+        f"degraded {result.get('degraded_rate', 0.0):.0%} of calls"
+    )
+    print(f"{'stage':<14} {'cold p50':>9} {'p95':>8} {'p99':>8} {'warm p50':>9} {'p95':>8} {'p99':>8}")
+    for stage in sorted(set(result["cold"]) | set(result["warm"])):
+        cells = []
+        for phase in ("cold", "warm"):
+            s = result[phase].get(stage)
+            cells.append(f"{s['p50']:>9.2f} {s['p95']:>8.2f} {s['p99']:>8.2f}" if s else f"{'-':>9} {'-':>8} {'-':>8}")
+        print(f"{stage:<14} {cells[0]} {cells[1]}")
+    print(f"{'callers':>7} {'requests':>9} {'qps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for row in result["throughput"]:
+        print(
+            f"{row['concurrency']:>7} {row['requests']:>9} {row['qps']:>9.1f} "
+            f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}"
+        )
+
+
+def print_comparison(base: dict, current: dict):
+    """Prints p50/p95 per stage and qps per concurrency level against a baseline run."""
+
+    def delta(old: float, new: float) -> str:
+        return f"{old:>9.2f} -> {new:>9.2f} ({(new - old) / old:+.0%})" if old else f"{old:>9.2f} -> {new:>9.2f}"
+
+    print(f"\n=== Comparison with {base['meta'].get('git_commit') or 'baseline'}")
+    for server, result in current["servers"].items():
+        old = base["servers"].get(server)
+        if old is None:
+            continue
+        print(f"\n{server}")
+        for key in ("startup_ms", "first_response_ms"):
+            print(f"  {key:<23} {delta(old[key], result[key])}")
+        if "response_bytes" in old:
+            print(f"  response bytes          {delta(old['response_bytes'], result['response_bytes'])}")
+        for phase in ("cold", "warm"):
+            for stage, stats in result[phase].items():
+                if stage in old[phase]:
+                    for pct in ("p50", "p95"):
+                        print(f"  {phase:<4} {stage:<14} {pct}: {delta(old[phase][stage][pct], stats[pct])}")
+        old_qps = {row["concurrency"]: row["qps"] for row in old["throughput"]}
+        for row in result["throughput"]:
+            if row["concurrency"] in old_qps:
+                print(f"  qps @{row['concurrency']:<3} {delta(old_qps[row['concurrency']], row['qps'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end search latency benchmark")
+    parser.add_argument("--servers", default=",".join(SERVERS), help="Comma-separated servers ({mcp}-{doc} names)")
+    parser.add_argument(
+        "--db", action="append", metavar="SERVER=PATH", help="Database path for a server (repeatable)"
+    )
+    parser.add_argument("--queries", default=str(_DEFAULT_QUERIES), help="JSON file: server name -> list of queries")
+    parser.add_argument("-k", type=int, default=5, help="Results per search")
+    parser.add_argument("--rounds", type=int, default=5, help="Warm passes over the query set")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Comma-separated concurrent caller counts")
+    parser.add_argument("--throughput-rounds", type=int, default=3, help="Passes over the query set per level")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated embedding latency per request")
+    parser.add_argument("--mode", choices=["fused", "staged"], default="staged", help="Query execution mode")
+    parser.add_argument("--fts-engine", choices=["memory", "duckdb"], default="memory")
+    parser.add_argument("--vector-engine", choices=["numpy", "duckdb"], default="numpy")
+    parser.add_argument("--quantization", choices=["none", "int8", "binary"], default="none")
+    parser.add_argument("--snippet-chars", type=int, default=500, help="Snippet characters per hit")
+    parser.add_argument("--snippet-token-budget", type=int, default=0, help="Token budget for all snippets (0 = none)")
+    parser.add_argument(
+        "--background-warmup", action="store_true", help="Start as the server does with background_warmup"
+    )
+    parser.add_argument(
+        "--deadline-ms", type=int, default=0, help="Per-search latency budget as in search.deadline_ms (0 = none)"
+    )
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Earlier --output file to compare against")
+    args = parser.parse_args()
+    args.db = dict(item.split("=", 1) for item in args.db or [])
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        query_sets = json.load(f)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "duckdb": duckdb.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "k": args.k,
+            "rounds": args.rounds,
+            "throughput_rounds": args.throughput_rounds,
+            "embed_latency_ms": args.embed_latency_ms,
+            "queries_file": os.path.relpath(args.queries, _PROJECT_ROOT),
+        },
+        "servers": {},
+    }
+    for server in args.servers.split(","):
+        queries = query_sets.get(server)
+        if not queries:
+            raise SystemExit(f"No queries for server '{server}' in {args.queries}")
+        print(f"🔥 {server}: {len(queries)} queries, k={args.k}")
+        result = asyncio.run(bench_server(server, queries, args))
+        report["servers"][server] = result
+        print_report(server, result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Wrote {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -170,6 +170,37 @@ else
     echo -e "${RED}    ✗ Template not found: search_template.py${NC}" >&2
 fi
 
+# Copy in-memory BM25 index reader (no placeholders)
+if [[ -f "$TEMPLATE_DIR/bm25_index_template.py" ]]; then
+    cp "$TEMPLATE_DIR/bm25_index_template.py" "$SERVER_DIR/runtime/bm25_index.py"
+    echo "    ✓ Created runtime/bm25_index.py"
+else
+    echo -e "${RED}    ✗ Template not found: bm25_index_template.py${NC}" >&2
+fi
+
+# Copy NumPy vector engine (no placeholders)
+if [[ -f "$TEMPLATE_DIR/vector_index_template.py" ]]; then
+    cp "$TEMPLATE_DIR/vector_index_template.py" "$SERVER_DIR/runtime/vector_index.py"
+    echo "    ✓ Created runtime/vector_index.py"
+else
+    echo -e "${RED}    ✗ Template not found: vector_index_template.py${NC}" >&2
+fi
+
+# Copy persistent query-embedding cache (no placeholders)
+if [[ -f "$TEMPLATE_DIR/embedding_cache_template.py" ]]; then
+    cp "$TEMPLATE_DIR/embedding_cache_template.py" "$SERVER_DIR/runtime/embedding_cache.py"
+    echo "    ✓ Created runtime/embedding_cache.py"
+else
+    echo -e "${RED}    ✗ Template not found: embedding_cache_template.py${NC}" >&2
+fi
+
+if [[ -f "$TEMPLATE_DIR/metrics_template.py" ]]; then
+    cp "$TEMPLATE_DIR/metrics_template.py" "$SERVER_DIR/runtime/metrics.py"
+    echo "    ✓ Created runtime/metrics.py"
+else
+    echo -e "${RED}    ✗ Template not found: metrics_template.py${NC}" >&2
+fi
+
 # Copy server file
 if [[ -f "$TEMPLATE_DIR/mcp_server_template.py" ]]; then
     SERVER_FILE="${TOOL_NAME}_${DOC_TYPE}_mcp_server.py"
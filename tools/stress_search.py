@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for a server's HybridSearcher.
+
+Runs the same query set through ``HybridSearcher.search`` from 1, 2, 4, ... client threads
+and reports throughput (qps) and per-search latency for each level, next to the core count
+of the machine. Whether throughput scales depends on the cores available and on how much
+of a search runs outside the GIL; read it off the table rather than assuming it. Query vectors are embeddings stored in the
+database (no embedding server needed) and query texts are the matching chunk titles, so
+every search runs the full path: FTS on the worker pool, VSS, fusion and payload fetch.
+
+Usage:
+    python tools/stress_search.py --mcp-name mojo
+    python tools/stress_search.py --mcp-name duckdb --doc-type docs --concurrency 1,2,4,8
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load_queries(searcher, count: int):
+    """Picks ``count`` (title, embedding) pairs spread evenly over the table."""
+    rows = searcher.db_connection.execute(
+        f"SELECT title, embedding FROM {searcher.table_name} ORDER BY chunk_id;"
+    ).fetchall()
+    if not rows:
+        raise SystemExit(f"Table {searcher.table_name} is empty")
+    step = max(1, len(rows) // count)
+    picked = rows[::step][:count]
+    return [(title or "", list(embedding)) for title, embedding in picked]
+
+
+def _percentile_ms(samples: list[float], pct: int) -> float:
+    if len(samples) < 2:
+        return samples[0] * 1000.0 if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1] * 1000.0
+
+
+def run_level(searcher, queries, concurrency: int, rounds: int, k: int) -> dict:
+    """Runs ``rounds`` passes over the query set from ``concurrency`` threads."""
+    work = queries * rounds
+
+    def one(item):
+        text, vector = item
+        start = time.perf_counter()
+        rows = searcher.search(text, k=k, query_vector=vector)
+        return rows, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        start = time.perf_counter()
+        results = list(clients.map(one, work))
+        elapsed = time.perf_counter() - start
+    latencies = [seconds for _, seconds in results]
+    empty = sum(1 for rows, _ in results if not rows)
+    return {
+        "concurrency": concurrency,
+        "searches": len(work),
+        "seconds": elapsed,
+        "qps": len(work) / elapsed,
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "empty": empty,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent search throughput test")
+    parser.add_argument("--mcp-name", default="mojo", help="MCP server name (e.g., 'mojo', 'duckdb')")
+    parser.add_argument("--doc-type", default="manual", help="Documentation type (e.g., 'manual', 'docs')")
+    parser.add_argument("--db", help="Database path (default: servers/{mcp}-{doc}-mcp/runtime/{mcp}_{doc}_mcp.db)")
+    parser.add_argument("--table", help="Table name (default: {mcp}_docs_indexed)")
+    parser.add_argument(
+        "--concurrency",
+        help="Comma-separated client thread counts (default: powers of two up to the core count)",
+    )
+    parser.add_argument("--queries", type=int, default=64, help="Distinct queries per round")
+    parser.add_argument("--rounds", type=int, default=5, help="Passes over the query set per level")
+    parser.add_argument("-k", type=int, default=5, help="Results per search")
+    parser.add_argument("--mode", choices=["fused", "staged"], default="staged", help="Query execution mode")
+    parser.add_argument("--fts-engine", choices=["memory", "duckdb"], default="memory")
+    parser.add_argument("--vector-engine", choices=["numpy", "duckdb"], default="numpy")
+    args = parser.parse_args()
+
+    runtime_dir = _PROJECT_ROOT / "servers" / f"{args.mcp_name}-{args.doc_type}-mcp" / "runtime"
+    if not runtime_dir.is_dir():
+        raise SystemExit(f"Runtime directory not found: {runtime_dir}")
+    sys.path.insert(0, str(runtime_dir))
+    import search as search_mod  # noqa: E402  (the server's own runtime module)
+
+    cores = os.cpu_count() or 1
+    if args.concurrency:
+        levels = [int(c) for c in args.concurrency.split(",")]
+    else:
+        levels = [1]
+        while levels[-1] * 2 <= cores:
+            levels.append(levels[-1] * 2)
+    top = max(levels)
+
+    searcher = search_mod.HybridSearcher(
+        db_path=args.db or str(runtime_dir / f"{args.mcp_name}_{args.doc_type}_mcp.db"),
+        table_name=args.table or f"{args.mcp_name}_docs_indexed",
+        execution_mode=args.mode,
+        fts_engine=args.fts_engine,
+        vector_engine=args.vector_engine,
+        # Every client thread can have a search and its FTS branch in flight at once
+        worker_threads=top,
+        db_pool_size=2 * top,
+    )
+    try:
+        queries = _load_queries(searcher, args.queries)
+        print(
+            f"🔥 {len(queries)} queries x {args.rounds} rounds, mode={searcher.execution_mode}, "
+            f"fts={searcher.fts_engine}, vector={searcher.vector_engine}, cores={cores}"
+        )
+        run_level(searcher, queries, top, 1, args.k)  # warm up: creates every pooled cursor
+
+        baseline = None
+        print(
+            f"{'threads':>7} {'searches':>9} {'seconds':>8} {'qps':>9} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'speedup':>8} {'efficiency':>10}"
+        )
+        for level in levels:
+            result = run_level(searcher, queries, level, args.rounds, args.k)
+            baseline = baseline or result["qps"]
+            speedup = result["qps"] / baseline
+            print(
+                f"{level:>7} {result['searches']:>9} {result['seconds']:>8.2f} {result['qps']:>9.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {speedup:>7.2f}x {speedup / level:>9.0%}"
+                + ("  (more threads than cores)" if level > cores else "")
+            )
+            if result["empty"]:
+                print(f"  ⚠️  {result['empty']} searches returned no rows")
+    finally:
+        searcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+HNSW parameter sweep for a server's database.
+
+Builds one HNSW index per (m, ef_construction) variant on a scratch copy of the indexed
+table's embeddings and queries it at each ef_search. For every setting it records build
+time, on-disk index size, p50/p95 query latency and recall@k against exact
+``array_cosine_distance`` (computed on the same copy before any index exists). Settings
+that no other setting beats on recall, p95 latency and index size together are the
+Pareto front; the recommendation is the fastest Pareto setting reaching ``--min-recall``.
+
+Queries are midpoints of random pairs of stored embeddings (fixed seed), so no embedding
+server is needed. Requires the DuckDB vss extension.
+
+Usage:
+    python tools/sweep_hnsw.py --mcp-name mojo
+    python tools/sweep_hnsw.py --mcp-name duckdb --doc-type docs --m 8,16 --ef-search 32,64,128 --output sweep.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import numpy as np
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_PROJECT_ROOT))
+
+from shared.embedding.create_indexes import hnsw_index_options  # noqa: E402
+
+
+def _ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def _percentile_ms(samples: list[float], pct: float) -> float:
+    return float(np.percentile(samples, pct)) * 1000.0 if samples else 0.0
+
+
+def _load_queries(con, table_name: str, count: int, seed: int) -> tuple[np.ndarray, int]:
+    data = con.execute(f"SELECT embedding FROM {table_name} ORDER BY chunk_id;").fetchnumpy()["embedding"]
+    if len(data) == 0:
+        raise SystemExit(f"Table {table_name} is empty")
+    matrix = np.stack([np.asarray(row, dtype=np.float32) for row in data])
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.integers(0, len(matrix), count)] + matrix[rng.integers(0, len(matrix), count)]
+    return queries, matrix.shape[1]
+
+
+def _copy_table(path: str, db_path: str, table_name: str):
+    """Creates a scratch database holding only the chunk ids and embeddings."""
+    con = duckdb.connect(path)
+    con.execute("LOAD vss;")
+    con.execute("SET hnsw_enable_experimental_persistence = true;")
+    con.execute(f"ATTACH '{db_path}' AS src (READ_ONLY);")
+    con.execute(f"CREATE TABLE docs AS SELECT chunk_id, embedding FROM src.{table_name} ORDER BY chunk_id;")
+    con.execute("DETACH src;")
+    con.execute("CHECKPOINT;")
+    return con
+
+
+def exact_top_k(con, queries: np.ndarray, dim: int, k: int) -> list[set]:
+    """Exact cosine top-k ids; the distance is materialized before ordering, so an HNSW
+    index could not answer it approximately.
+    """
+    sql = f"""
+        SELECT chunk_id FROM (
+            SELECT chunk_id, array_cosine_distance(embedding, CAST(? AS FLOAT[{dim}])) AS distance
+            FROM docs
+        )
+        ORDER BY distance ASC, chunk_id
+        LIMIT {k};
+    """
+    return [{row[0] for row in con.execute(sql, [q.tolist()]).fetchall()} for q in queries]
+
+
+def run_queries(con, queries: np.ndarray, dim: int, k: int, truth: list[set]) -> dict:
+    sql = f"SELECT chunk_id FROM docs ORDER BY array_cosine_distance(embedding, CAST(? AS FLOAT[{dim}])) LIMIT {k};"
+    con.execute(sql, [queries[0].tolist()]).fetchall()  # warm up
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows = con.execute(sql, [query.tolist()]).fetchall()
+        latencies.append(time.perf_counter() - start)
+        hits += len({row[0] for row in rows} & expected)
+    return {
+        "recall": hits / max(1, sum(len(e) for e in truth)),
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+    }
+
+
+def pareto_front(rows: list[dict]) -> list[dict]:
+    """Rows not dominated on (recall higher, p95 lower, index size lower)."""
+
+    def dominates(a: dict, b: dict) -> bool:
+        no_worse = a["recall"] >= b["recall"] and a["p95_ms"] <= b["p95_ms"] and a["index_bytes"] <= b["index_bytes"]
+        better = a["recall"] > b["recall"] or a["p95_ms"] < b["p95_ms"] or a["index_bytes"] < b["index_bytes"]
+        return no_worse and better
+
+    return [r for r in rows if not any(dominates(other, r) for other in rows if other is not r)]
+
+
+def recommend(front: list[dict], min_recall: float) -> dict:
+    """Fastest Pareto setting reaching min_recall, else the one with the highest recall."""
+    good = [r for r in front if r["recall"] >= min_recall]
+    if good:
+        return min(good, key=lambda r: (r["p95_ms"], r["index_bytes"], r["build_s"]))
+    return max(front, key=lambda r: (r["recall"], -r["p95_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HNSW recall/latency sweep")
+    parser.add_argument("--mcp-name", default="mojo", help="MCP server name (e.g., 'mojo', 'duckdb')")
+    parser.add_argument("--doc-type", default="manual", help="Documentation type (e.g., 'manual', 'docs')")
+    parser.add_argument("--db", help="Database path (default: servers/{mcp}-{doc}-mcp/runtime/{mcp}_{doc}_mcp.db)")
+    parser.add_argument("--table", help="Table name (default: {mcp}_docs_indexed)")
+    parser.add_argument("--m", default="8,16,32", help="Comma-separated M values (M0 = 2 * M)")
+    parser.add_argument("--ef-construction", default="64,128,256", help="Comma-separated ef_construction values")
+    parser.add_argument("--ef-search", default="16,32,64,128,256", help="Comma-separated ef_search values")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("-k", type=int, default=10, help="Results per search")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Recall@k the recommendation must reach")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the query set")
+    parser.add_argument("--output", help="Write all measurements and the recommendation as JSON")
+    args = parser.parse_args()
+
+    runtime_dir = _PROJECT_ROOT / "servers" / f"{args.mcp_name}-{args.doc_type}-mcp" / "runtime"
+    db_path = os.path.abspath(args.db or str(runtime_dir / f"{args.mcp_name}_{args.doc_type}_mcp.db"))
+    table_name = args.table or f"{args.mcp_name}_docs_indexed"
+    if not os.path.exists(db_path):
+        raise SystemExit(f"Database not found: {db_path}")
+
+    source = duckdb.connect(db_path, read_only=True)
+    try:
+        queries, dim = _load_queries(source, table_name, args.queries, args.seed)
+    finally:
+        source.close()
+
+    print(f"🔥 {len(queries)} queries, k={args.k}, {dim} dims, table {table_name}")
+    rows = []
+    truth = None
+    with tempfile.TemporaryDirectory(prefix="hnsw_sweep_") as work_dir:
+        for m in _ints(args.m):
+            for ef_construction in _ints(args.ef_construction):
+                path = os.path.join(work_dir, f"m{m}_efc{ef_construction}.db")
+                con = _copy_table(path, db_path, table_name)
+                try:
+                    if truth is None:
+                        truth = exact_top_k(con, queries, dim, args.k)
+                    base_bytes = os.path.getsize(path)
+                    params = {"m": m, "m0": 2 * m, "ef_construction": ef_construction}
+                    start = time.perf_counter()
+                    con.execute(f"CREATE INDEX docs_hnsw ON docs USING HNSW (embedding) WITH ({hnsw_index_options(params)});")
+                    con.execute("CHECKPOINT;")
+                    build_s = time.perf_counter() - start
+                    index_bytes = max(0, os.path.getsize(path) - base_bytes)
+                    for ef_search in _ints(args.ef_search):
+                        con.execute(f"SET hnsw_ef_search = {ef_search};")
+                        result = run_queries(con, queries, dim, args.k, truth)
+                        rows.append(
+                            {**params, "ef_search": ef_search, "build_s": build_s, "index_bytes": index_bytes, **result}
+                        )
+                        print(
+                            f"  m={m:<3} ef_construction={ef_construction:<4} ef_search={ef_search:<4} "
+                            f"recall={result['recall']:.3f} p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms"
+                        )
+                finally:
+                    con.close()
+                    os.remove(path)
+
+    front = pareto_front(rows)
+    best = recommend(front, args.min_recall)
+    print(f"\n{'':1} {'m':>3} {'m0':>3} {'ef_c':>5} {'ef_s':>5} {'build s':>8} {'index MB':>9} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in sorted(rows, key=lambda r: (r["m"], r["ef_construction"], r["ef_search"])):
+        mark = "★" if r is best else ("*" if r in front else " ")
+        print(
+            f"{mark} {r['m']:>3} {r['m0']:>3} {r['ef_construction']:>5} {r['ef_search']:>5} {r['build_s']:>8.2f} "
+            f"{r['index_bytes'] / 1e6:>9.2f} {r['recall']:>7.3f} {r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f}"
+        )
+    print("\n* Pareto-optimal (recall, p95 latency, index size)   ★ recommended")
+    print("\nprocessing_config.yaml:")
+    print("  indexing:\n    hnsw:")
+    for key in ("ef_construction", "ef_search", "m", "m0"):
+        print(f"      {key}: {best[key]}")
+    print("server_config.yaml:")
+    print(f"  search:\n    hnsw_ef_search: {best['ef_search']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "db": db_path,
+                    "table": table_name,
+                    "k": args.k,
+                    "queries": len(queries),
+                    "min_recall": args.min_recall,
+                    "results": rows,
+                    "pareto": [rows.index(r) for r in front],
+                    "recommended": best,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\n✓ Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()